@@ -0,0 +1,387 @@
+"""
+Background Carbonation Alert Evaluation for the Kombucha Batch Logger
+
+The Streamlit page used to scan every batch for over-carbonation on each
+rerun, and only while a browser had the page open. This module evaluates the
+alerts on a schedule instead and stores the result through the storage
+backend (see storage.py), so the page only reads a small alerts table.
+
+A batch raises an alert when either:
+- its latest recorded CO2 pressure is at or above the warning threshold, or
+- it is in secondary fermentation and its pressure projected for today is at
+  or above the warning threshold. The projection accumulates the pressure over
+  the storage temperatures recorded since bottling (see pressure_history) and
+  continues at the latest one.
+The higher of the two pressures is reported. Thresholds come from the stored
+settings, so changes saved in the sidebar apply on the next evaluation.
+
+The engine also forecasts when each bottled batch's projected pressure
+crosses the warning and danger thresholds, whether or not it is alerting
+yet. The forecast continues from the accumulated pressure and solves the
+pressure model in closed form for all batches and both thresholds at once (see co2_calculator.days_until_pressure_array).
+It is stored next to the alerts, so the page can order alerts by the hours
+left until danger and show when quiet batches will need attention.
+
+The engine runs as a daemon thread inside the Streamlit server by default.
+Set KOMBUCHA_ALERT_ENGINE=external to run it as a separate process instead.
+
+Usage:
+    python alert_engine.py [--once]
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import datetime
+import os
+import sys
+import threading
+
+import numpy as np
+
+from co2_calculator import (CO2HistoryIntegrator, constants_for_batch, days_until_pressure_array,
+                            estimate_co2_array, stack_model_constants)
+from storage import open_store
+
+# Seconds between evaluations
+ALERT_INTERVAL = float(os.environ.get("KOMBUCHA_ALERT_INTERVAL", 300))
+
+# "thread" to run inside the app process, "external" when run as its own process
+ALERT_ENGINE_MODE = os.environ.get("KOMBUCHA_ALERT_ENGINE", "thread")
+
+# Thresholds used until settings have been saved (same defaults as app.py)
+DEFAULT_DANGER_THRESHOLD = 2.5
+DEFAULT_WARNING_THRESHOLD = 1.5
+
+# Storage temperature assumed when a bottled batch has no secondary readings
+DEFAULT_STORAGE_TEMPERATURE = 23.0
+
+def bottling_date(batch):
+    """
+    Return the date a batch went into secondary fermentation.
+
+    Batches without a bottling date are assumed to have been bottled 14 days
+    after they started, as on the Secondary Fermentation tab.
+
+    Args:
+        batch (dict): Batch dictionary
+
+    Returns:
+        datetime.datetime: Bottling date at midnight
+    """
+    if "bottling_date" in batch:
+        return datetime.datetime.strptime(batch["bottling_date"], "%Y-%m-%d")
+    return datetime.datetime.strptime(batch["start_date"], "%Y-%m-%d") + datetime.timedelta(days=14)
+
+def days_bottled(batch, today):
+    """
+    Count the whole days a batch has been in secondary fermentation.
+
+    Args:
+        batch (dict): Batch dictionary
+        today (datetime.datetime): Current date and time
+
+    Returns:
+        int: Days since bottling, at least 0
+    """
+    return max(0, (today - bottling_date(batch)).days)
+
+def secondary_readings(batch, until=None):
+    """
+    Return a batch's secondary readings that have a temperature, oldest first.
+
+    Args:
+        batch (dict): Batch dictionary
+        until (str, optional): Only readings on or before this "YYYY-MM-DD"
+            date. Defaults to None (all).
+
+    Returns:
+        list: Measurement dicts sorted by date
+    """
+    readings = [m for m in batch.get("measurements", [])
+                if m.get("phase") == "secondary" and "temperature" in m and (until is None or m["date"] <= until)]
+    return sorted(readings, key=lambda m: m["date"])
+
+def storage_temperature(batch):
+    """
+    Return the temperature of a batch's latest secondary reading.
+
+    Args:
+        batch (dict): Batch dictionary
+
+    Returns:
+        float: Temperature in °C, or DEFAULT_STORAGE_TEMPERATURE without readings
+    """
+    secondary = secondary_readings(batch)
+    if not secondary:
+        return DEFAULT_STORAGE_TEMPERATURE
+
+    return secondary[-1]["temperature"]
+
+def pressure_history(batch, until=None):
+    """
+    Accumulate a bottled batch's CO2 and pressure over its recorded storage temperatures.
+
+    The Secondary Fermentation tab, ingested readings and the forecasts all
+    continue from this history.
+
+    Args:
+        batch (dict): Batch dictionary
+        until (str, optional): Only readings on or before this "YYYY-MM-DD"
+            date. Defaults to None (all).
+
+    Returns:
+        CO2HistoryIntegrator: Integrator positioned at the latest secondary reading,
+        counting days since bottling
+    """
+    history = CO2HistoryIntegrator(batch["sugar_content"], batch["volume"], constants_for_batch(batch))
+    history.add_measurements(secondary_readings(batch, until), bottling_date(batch).strftime("%Y-%m-%d"))
+    return history
+
+def forecast_crossings(batches, thresholds, histories=None):
+    """
+    Forecast when each batch's projected pressure crosses each threshold.
+
+    All batches are solved together. The projection continues from the
+    pressure accumulated up to the latest secondary reading, with the storage
+    temperature assumed to stay at that reading's.
+
+    Args:
+        batches (list): Batch dictionaries in secondary fermentation
+        thresholds (list): Pressures in atm
+        histories (list, optional): pressure_history of each batch. Defaults to computing them.
+
+    Returns:
+        list: One list per threshold with, for each batch, the
+        datetime.datetime of the crossing (the latest reading's date if it
+        was already crossed), or None if it never happens
+    """
+    if not batches:
+        return [[] for _ in thresholds]
+    if histories is None:
+        histories = [pressure_history(batch) for batch in batches]
+
+    sugar_content = [batch["sugar_content"] for batch in batches]
+    temps = [storage_temperature(batch) for batch in batches]
+    last_days = np.array([history.last_day for history in histories], dtype=float)
+    constants = stack_model_constants([constants_for_batch(batch) for batch in batches])
+
+    # Beyond the latest reading, the pressure is the model's at the storage
+    # temperature shifted by what the recorded temperatures added up to
+    offsets = (np.array([history.pressure for history in histories])
+               - estimate_co2_array(sugar_content, temps, last_days, constants))
+    crossing_days = last_days + days_until_pressure_array(
+        sugar_content=sugar_content,
+        temp=temps,
+        pressure=np.asarray(thresholds, dtype=float).reshape(-1, 1) - offsets,
+        time_in_days=last_days,
+        constants=constants
+    )
+
+    return [
+        [bottling_date(batch) + datetime.timedelta(days=float(days)) if np.isfinite(days) else None
+         for batch, days in zip(batches, row)]
+        for row in crossing_days
+    ]
+
+def hours_until(crossing, now=None):
+    """
+    Hours from now until a forecast crossing.
+
+    Args:
+        crossing (str): Crossing time as "YYYY-MM-DD HH:MM", or None
+        now (datetime.datetime, optional): Current time. Defaults to now.
+
+    Returns:
+        float: Hours until the crossing, 0 if it has passed, or None if it never happens
+    """
+    if crossing is None:
+        return None
+    if now is None:
+        now = datetime.datetime.now()
+
+    remaining = datetime.datetime.strptime(crossing, "%Y-%m-%d %H:%M") - now
+    return max(0.0, remaining.total_seconds() / 3600)
+
+def forecast_pressures(batches, settings, today=None):
+    """
+    Project today's pressure and forecast both threshold crossings for every bottled batch.
+
+    Args:
+        batches (list): Batch dictionaries
+        settings (dict): Settings with "danger_threshold" and "warning_threshold"
+        today (datetime.datetime, optional): Evaluation time. Defaults to now.
+
+    Returns:
+        list: Dicts with "name", "pressure" (projected for today), "date",
+        "warning_at" and "danger_at" (forecast times the thresholds are
+        crossed as "YYYY-MM-DD HH:MM", None if never), one per bottled batch
+    """
+    if today is None:
+        today = datetime.datetime.now()
+
+    danger_threshold = settings.get("danger_threshold", DEFAULT_DANGER_THRESHOLD)
+    warning_threshold = settings.get("warning_threshold", DEFAULT_WARNING_THRESHOLD)
+
+    bottled = [batch for batch in batches if batch.get("fermentation_phase", "primary") == "secondary"]
+    if not bottled:
+        return []
+
+    # Continue each batch's pressure history to today at its storage temperature
+    histories = [pressure_history(batch) for batch in bottled]
+    pressures = [
+        history.estimate_pressure(max(days_bottled(batch, today), history.last_day), storage_temperature(batch))
+        for batch, history in zip(bottled, histories)
+    ]
+    warning_crossings, danger_crossings = forecast_crossings(bottled, [warning_threshold, danger_threshold], histories)
+
+    return [
+        {
+            "name": batch["name"],
+            "pressure": float(pressure),
+            "date": today.strftime("%Y-%m-%d"),
+            "warning_at": warning_at.strftime("%Y-%m-%d %H:%M") if warning_at else None,
+            "danger_at": danger_at.strftime("%Y-%m-%d %H:%M") if danger_at else None
+        }
+        for batch, pressure, warning_at, danger_at in zip(bottled, pressures, warning_crossings, danger_crossings)
+    ]
+
+def evaluate_alerts(batches, settings, measured=(), today=None, forecasts=None):
+    """
+    Evaluate carbonation alerts for all batches.
+
+    Args:
+        batches (list): Batch dictionaries
+        settings (dict): Settings with "danger_threshold" and "warning_threshold"
+        measured (list, optional): Latest recorded pressures at or above the
+            warning threshold, as returned by the store's latest_at_or_above
+        today (datetime.datetime, optional): Evaluation time. Defaults to now.
+        forecasts (list, optional): Output of forecast_pressures for the same
+            batches and time. Defaults to computing it.
+
+    Returns:
+        list: Dicts with "name", "pressure", "risk_level", "source"
+        ("measured" or "projected"), "date", and "warning_at" and "danger_at"
+        from the batch's forecast (None for batches that aren't bottled)
+    """
+    if forecasts is None:
+        forecasts = forecast_pressures(batches, settings, today)
+
+    danger_threshold = settings.get("danger_threshold", DEFAULT_DANGER_THRESHOLD)
+    warning_threshold = settings.get("warning_threshold", DEFAULT_WARNING_THRESHOLD)
+
+    candidates = {}
+
+    for reading in measured:
+        candidates[reading["name"]] = dict(reading, source="measured")
+
+    forecasts_by_name = {forecast["name"]: forecast for forecast in forecasts}
+    for forecast in forecasts:
+        current = candidates.get(forecast["name"])
+        if forecast["pressure"] >= warning_threshold and (current is None or forecast["pressure"] > current["pressure"]):
+            candidates[forecast["name"]] = {
+                "name": forecast["name"],
+                "pressure": forecast["pressure"],
+                "source": "projected",
+                "date": forecast["date"]
+            }
+
+    alerts = []
+    for alert in candidates.values():
+        forecast = forecasts_by_name.get(alert["name"], {})
+        alert["risk_level"] = "danger" if alert["pressure"] >= danger_threshold else "warning"
+        alert["warning_at"] = forecast.get("warning_at")
+        alert["danger_at"] = forecast.get("danger_at")
+        alerts.append(alert)
+
+    return alerts
+
+class AlertEngine:
+    """
+    Periodically evaluates carbonation alerts and stores them.
+
+    Attributes:
+        store (SQLiteStore or JSONFileStore): Batch storage
+        interval (float): Seconds between evaluations
+        last_run (datetime.datetime): Time of the last completed evaluation
+    """
+
+    def __init__(self, store, interval=ALERT_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self.last_run = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """
+        Evaluate the alerts and pressure forecasts now and store them.
+
+        Returns:
+            list: The evaluated alerts
+        """
+        batches, settings = self.store.load()
+        warning_threshold = settings.get("warning_threshold", DEFAULT_WARNING_THRESHOLD)
+
+        forecasts = forecast_pressures(batches, settings)
+        alerts = evaluate_alerts(batches, settings, self.store.latest_at_or_above(warning_threshold),
+                                 forecasts=forecasts)
+        self.store.save_forecasts(forecasts)
+        self.store.save_alerts(alerts)
+        self.last_run = datetime.datetime.now()
+        return alerts
+
+    def trigger(self):
+        """Ask the background thread to re-evaluate without waiting for the interval."""
+        self._wake.set()
+
+    def start(self):
+        """Start evaluating in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="alert-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and wait for it to finish."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        """Evaluation loop of the background thread."""
+        while not self._stopping.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error evaluating alerts: {str(e)}")
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+# Run the evaluator as its own process if run directly
+if __name__ == "__main__":
+    engine = AlertEngine(open_store())
+
+    if "--once" in sys.argv[1:]:
+        alerts = engine.run_once()
+        print(f"{len(alerts)} alerts")
+        for alert in alerts:
+            print(f"{alert['risk_level'].upper()}: {alert['name']} {alert['pressure']:.2f} atm ({alert['source']}, {alert['date']})"
+                  + (f", danger in {hours_until(alert['danger_at']):.0f} h" if alert["danger_at"] else ""))
+        for forecast in engine.store.load_forecasts():
+            print(f"FORECAST: {forecast['name']} {forecast['pressure']:.2f} atm today"
+                  + (f", warning in {hours_until(forecast['warning_at']):.0f} h" if forecast["warning_at"] else "")
+                  + (f", danger in {hours_until(forecast['danger_at']):.0f} h" if forecast["danger_at"] else ""))
+    else:
+        print(f"Evaluating alerts every {engine.interval:g} seconds with {engine.store}")
+        engine.start()
+        try:
+            engine._thread.join()
+        except KeyboardInterrupt:
+            engine.stop()
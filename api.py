@@ -0,0 +1,286 @@
+"""
+REST API for the Kombucha Batch Logger
+
+This Flask application exposes the batches, measurements and carbonation
+alerts of the Streamlit app to other programs, such as line sensors or an ERP
+system. It works on the same storage backend as app.py (see storage.py), so
+readings posted here show up in the app and vice versa.
+
+Endpoints:
+- GET  /api/batches: Batches without their measurements, paginated
+- GET  /api/batches/<name>: One batch with all its measurements
+- GET  /api/batches/<name>/measurements: A batch's measurements, paginated
+- POST /api/batches/<name>/measurements: Append a measurement
+- POST /api/measurements: Append many readings for many batches in one write
+  (NDJSON, CSV or a JSON array, see ingest.py)
+- GET  /api/alerts: Current carbonation alerts (see alert_engine.py), each
+  with the forecast times its batch reaches the warning and danger thresholds
+- GET  /api/forecasts: Projected pressure and forecast threshold crossings
+  of every bottled batch, alerting or not
+- GET  /api/sensors: Latest sensor samples, and with ?window=<seconds> the
+  recent ones, from the background sampler in sensors.py
+  (enabled with KOMBUCHA_SENSOR_SAMPLING=1)
+- GET  /api/sensors/<channel>/aggregates: Stored min/mean/max buckets of a
+  sensor channel (see sensor_aggregation.py), with ?resolution=minute|hour
+  (or seconds) and ?since=<epoch seconds>
+
+List endpoints take "page" (from 1) and "per_page" query parameters. Every
+GET response carries an ETag derived from the storage data version, and
+requests with a matching If-None-Match header get a 304 response without
+the data being read, so polling clients only download changes.
+
+Usage:
+    python api.py
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import hashlib
+import json
+import os
+
+from flask import Flask, jsonify, make_response, request
+
+from alert_engine import ALERT_ENGINE_MODE, AlertEngine
+from ingest import IngestError, build_measurement, ingest_readings, parse_readings
+from sensor_aggregation import RESOLUTION_NAMES, SensorAggregator
+from sensors import SensorSampler
+from storage import open_store
+
+API_HOST = os.environ.get("KOMBUCHA_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("KOMBUCHA_API_PORT", 5000))
+
+# Poll the sensors in the background and serve them on /api/sensors
+SENSOR_SAMPLING = os.environ.get("KOMBUCHA_SENSOR_SAMPLING") == "1"
+
+# Page sizes for list endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+class APIError(Exception):
+    """Error returned to the client as a JSON body with an HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def _pagination():
+    """Read and validate the page and per_page query parameters."""
+    try:
+        page = int(request.args.get("page", 1))
+        per_page = int(request.args.get("per_page", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise APIError("page and per_page must be integers")
+
+    if page < 1 or not 1 <= per_page <= MAX_PAGE_SIZE:
+        raise APIError(f"page must be at least 1 and per_page between 1 and {MAX_PAGE_SIZE}")
+
+    return page, per_page
+
+def _paginate(items, key):
+    """Return one page of items in a response body with paging details."""
+    page, per_page = _pagination()
+    start = (page - 1) * per_page
+
+    return {
+        key: items[start:start + per_page],
+        "page": page,
+        "per_page": per_page,
+        "total": len(items),
+        "pages": (len(items) + per_page - 1) // per_page
+    }
+
+def _conditional(etag, build):
+    """
+    Answer a GET with 304 if the client has the current version, else build the response.
+
+    Args:
+        etag (str): Current version of the resource
+        build (callable): Returns the JSON-serializable response body
+
+    Returns:
+        flask.Response: 304 response or the JSON body with its ETag
+    """
+    if etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        response = jsonify(build())
+
+    response.set_etag(etag)
+    return response
+
+def _find_batch(batches, name):
+    """Find a batch by name, raising a 404 APIError if it doesn't exist."""
+    for batch in batches:
+        if batch["name"] == name:
+            return batch
+    raise APIError(f"No batch named '{name}'", 404)
+
+def _batch_summary(batch):
+    """A batch without its measurements, plus the number of measurements."""
+    summary = {key: value for key, value in batch.items() if key != "measurements"}
+    summary["measurement_count"] = len(batch.get("measurements", []))
+    return summary
+
+def create_app(store=None, alert_engine=None, sampler=None):
+    """
+    Create the Flask application.
+
+    Args:
+        store (SQLiteStore or JSONFileStore, optional): Batch storage. Defaults to the configured store.
+        alert_engine (AlertEngine, optional): Engine to wake after writes. Defaults to a new
+            engine, started in a background thread unless KOMBUCHA_ALERT_ENGINE=external.
+        sampler (SensorSampler, optional): Sensor sampler to serve. Defaults to a new, started
+            sampler that stores its aggregates in store if KOMBUCHA_SENSOR_SAMPLING=1,
+            otherwise /api/sensors is disabled.
+
+    Returns:
+        flask.Flask: The application
+    """
+    if store is None:
+        store = open_store()
+    if alert_engine is None:
+        alert_engine = AlertEngine(store)
+        if ALERT_ENGINE_MODE == "thread":
+            alert_engine.start()
+    if sampler is None and SENSOR_SAMPLING:
+        sampler = SensorSampler(aggregator=SensorAggregator(sink=store.add_sensor_aggregates))
+        sampler.start()
+
+    app = Flask(__name__)
+
+    @app.errorhandler(APIError)
+    def handle_api_error(error):
+        return jsonify(error=error.message), error.status
+
+    @app.get("/api/batches")
+    def list_batches():
+        phase = request.args.get("phase")
+
+        def build():
+            batches, _ = store.load()
+            if phase:
+                batches = [b for b in batches if b.get("fermentation_phase", "primary") == phase]
+            return _paginate([_batch_summary(b) for b in batches], "batches")
+
+        return _conditional(store.version(), build)
+
+    @app.get("/api/batches/<name>")
+    def get_batch(name):
+        def build():
+            batches, _ = store.load()
+            return _find_batch(batches, name)
+
+        return _conditional(store.version(), build)
+
+    @app.get("/api/batches/<name>/measurements")
+    def list_measurements(name):
+        def build():
+            batches, _ = store.load()
+            return _paginate(_find_batch(batches, name).get("measurements", []), "measurements")
+
+        return _conditional(store.version(), build)
+
+    @app.post("/api/batches/<name>/measurements")
+    def add_measurement(name):
+        batches, _ = store.load()
+        batch = _find_batch(batches, name)
+
+        try:
+            measurement = build_measurement(batch, request.get_json(silent=True))
+        except ValueError as e:
+            raise APIError(str(e))
+
+        store.add_measurement(name, measurement)
+        alert_engine.trigger()
+
+        response = jsonify(measurement)
+        response.status_code = 201
+        response.set_etag(store.version())
+        return response
+
+    @app.post("/api/measurements")
+    def add_measurements():
+        try:
+            if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+                readings = parse_readings(request.get_data(as_text=True), "ndjson")
+            elif request.mimetype == "text/csv":
+                readings = parse_readings(request.get_data(as_text=True), "csv")
+            else:
+                readings = request.get_json(silent=True)
+                if not isinstance(readings, list):
+                    raise APIError("Request body must be NDJSON, CSV or a JSON array of readings")
+
+            report = ingest_readings(store, readings)
+        except IngestError as e:
+            response = jsonify(
+                error=f"{len(e.errors)} invalid readings, nothing was stored",
+                errors=[{"reading": number, "message": message} for number, message in e.errors]
+            )
+            response.status_code = 400
+            return response
+
+        alert_engine.trigger()
+
+        response = jsonify(report)
+        response.status_code = 201
+        response.set_etag(store.version())
+        return response
+
+    @app.get("/api/sensors")
+    def get_sensors():
+        if sampler is None:
+            raise APIError("Sensor sampling is disabled", 404)
+
+        body = {
+            "latest": {
+                name: None if sample is None else {"timestamp": sample[0], "value": sample[1]}
+                for name, sample in sampler.latest().items()
+            }
+        }
+
+        if "window" in request.args:
+            try:
+                seconds = float(request.args["window"])
+            except ValueError:
+                raise APIError("window must be a number of seconds")
+
+            body["window"] = {
+                name: {"timestamps": times.tolist(), "values": values.tolist()}
+                for name, (times, values) in sampler.window(seconds).items()
+            }
+
+        return jsonify(body)
+
+    @app.get("/api/sensors/<channel>/aggregates")
+    def get_sensor_aggregates(channel):
+        resolution = request.args.get("resolution", "minute")
+        try:
+            resolution = RESOLUTION_NAMES[resolution] if resolution in RESOLUTION_NAMES else int(resolution)
+            since = float(request.args["since"]) if "since" in request.args else None
+        except ValueError:
+            raise APIError("resolution must be 'minute', 'hour' or seconds, and since a time in seconds")
+
+        return jsonify(aggregates=store.load_sensor_aggregates(channel, resolution, since))
+
+    @app.get("/api/alerts")
+    def list_alerts():
+        alerts = store.load_alerts()
+        etag = "alerts-" + hashlib.sha1(json.dumps(alerts, sort_keys=True).encode()).hexdigest()[:16]
+
+        return _conditional(etag, lambda: {"alerts": alerts})
+
+    @app.get("/api/forecasts")
+    def list_forecasts():
+        forecasts = store.load_forecasts()
+        etag = "forecasts-" + hashlib.sha1(json.dumps(forecasts, sort_keys=True).encode()).hexdigest()[:16]
+
+        return _conditional(etag, lambda: {"forecasts": forecasts})
+
+    return app
+
+# Serve the API if run directly
+if __name__ == "__main__":
+    create_app().run(host=API_HOST, port=API_PORT)
@@ -19,29 +19,103 @@ Email: deen.htc@gmail.com
 import streamlit as st
 import pandas as pd
 import datetime
+import copy
+import threading
 import plotly.express as px
-import json
-import os
-from co2_calculator import calculate_co2_production, estimate_fermentation_completion, estimate_co2
-
-# File path for persistent storage
-DATA_FILE = "kombucha_data.json"
-print(f"Data file path: {os.path.abspath(DATA_FILE)}")
-
-# Function to save data to file - define this BEFORE using it
-def save_data():
+from co2_calculator import predict_co2_timeline_array, estimate_co2_bands, constants_for_batch, CO2HistoryIntegrator
+from model_cache import calculate_co2_production, estimate_fermentation_completion, estimate_co2
+from storage import open_store
+from alert_engine import AlertEngine, ALERT_ENGINE_MODE, hours_until, secondary_readings, \
+    bottling_date as batch_bottling_date
+from measurement_columns import MeasurementColumns
+
+# Persistent storage, opened once per process (SQLite by default, see storage.py)
+@st.cache_resource
+def get_store():
+    store = open_store()
+    print(f"Data store: {store}")
+    return store
+
+store = get_store()
+
+# Carbonation alerts are evaluated in the background and only read by the page
+# (see alert_engine.py); unless run as a separate process, the evaluator
+# thread is started once per server process
+@st.cache_resource
+def get_alert_engine():
+    engine = AlertEngine(get_store())
+    if ALERT_ENGINE_MODE == "thread":
+        engine.start()
+    return engine
+
+alert_engine = get_alert_engine()
+
+# Measurement history for the charts and tables, memory-mapped from column
+# files shared by every server process (see measurement_columns.py)
+@st.cache_resource
+def get_measurement_columns():
+    return MeasurementColumns(get_store())
+
+measurement_columns = get_measurement_columns()
+
+def measurement_history(batch):
     try:
-        data = {
-            'batches': st.session_state.batches,
-            'settings': st.session_state.settings
-        }
-        with open(DATA_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
-        print(f"Saved {len(st.session_state.batches)} batches to {DATA_FILE}")
+        return measurement_columns.frame(batch["name"])
+    except (KeyError, OSError) as e:
+        # Fall back to the nested measurements, e.g. for a batch not saved yet
+        print(f"Error reading measurement columns: {str(e)}")
+        history_df = pd.DataFrame(batch["measurements"])
+        history_df["date"] = pd.to_datetime(history_df["date"])
+        return history_df
+
+# CO2 histories of the bottled batches, shared by every session of the server
+# process. When the data version changes, a batch's integrator is only fed the
+# readings recorded since it was last brought up to date.
+@st.cache_resource
+def get_co2_histories():
+    return {}, threading.Lock()
+
+def co2_history(batch, version):
+    histories, lock = get_co2_histories()
+    with lock:
+        cached = histories.get(batch["name"])
+        if cached is not None and cached["version"] == version:
+            return cached["history"]
+
+        readings = secondary_readings(batch)
+        basis = (batch["sugar_content"], batch["volume"], batch_bottling_date(batch), constants_for_batch(batch))
+        if cached is None or cached["basis"] != basis or readings[:len(cached["readings"])] != cached["readings"]:
+            # New batch, changed batch details, or a reading inserted before the latest one
+            cached = {
+                "basis": basis,
+                "readings": [],
+                "history": CO2HistoryIntegrator(batch["sugar_content"], batch["volume"], constants_for_batch(batch))
+            }
+
+        cached["history"].add_measurements(readings[len(cached["readings"]):], batch_bottling_date(batch).strftime("%Y-%m-%d"))
+        cached["readings"] = readings
+        cached["version"] = version
+        histories[batch["name"]] = cached
+        return cached["history"]
+
+# Function to save a single change to storage - define this BEFORE using it
+def save_change(operation, *args):
+    try:
+        operation(*args)
+        alert_engine.trigger()
     except Exception as e:
         st.error(f"Error saving data: {str(e)}")
         print(f"Error saving data: {str(e)}")
 
+# Batches loaded from storage are shared read-only between sessions, so copy
+# a batch into this session before changing it (copy-on-write)
+def writable_batch(batch):
+    for i, session_batch in enumerate(st.session_state.batches):
+        if session_batch is batch:
+            st.session_state.batches[i] = copy.deepcopy(batch)
+            return st.session_state.batches[i]
+    return batch
+
 # Set page configuration
 st.set_page_config(
     page_title="Kombucha Batch Logger",
@@ -66,20 +140,19 @@ if 'settings' not in st.session_state:
 if 'confirm_delete' not in st.session_state:
     st.session_state.confirm_delete = False
 
-# Load data from file if it exists (do this AFTER initializing session state)
-if os.path.exists(DATA_FILE):
-    try:
-        with open(DATA_FILE, 'r') as f:
-            data = json.load(f)
-            st.session_state.batches = data.get('batches', [])
-            
-            # Update settings if they exist in the file
-            if 'settings' in data:
-                st.session_state.settings.update(data['settings'])
-                
-        print(f"Loaded {len(st.session_state.batches)} batches from {DATA_FILE}")
-    except Exception as e:
-        st.error(f"Error loading data: {e}")
+# Load data from storage (do this AFTER initializing session state)
+try:
+    # Read before loading, so the data is at least as new as this version
+    data_version = store.version()
+    batches, settings = store.load()
+    st.session_state.batches = batches
+
+    # Update settings if they exist in storage
+    st.session_state.settings.update(settings)
+
+    print(f"Loaded {len(st.session_state.batches)} batches from {store}")
+except Exception as e:
+    st.error(f"Error loading data: {e}")
 
 # Sidebar for settings
 with st.sidebar:
@@ -127,7 +200,7 @@ with st.sidebar:
         st.session_state.settings['warning_threshold'] = warning_threshold
         st.session_state.settings['show_alerts'] = show_alerts
         st.session_state.settings['alert_check_frequency'] = alert_check_frequency.lower()
-        save_data()  # Save data to file
+        save_change(store.save_settings, st.session_state.settings)
         st.success("Settings saved successfully!")
 
     st.markdown("---")
@@ -162,55 +235,28 @@ if st.session_state.settings['show_alerts']:
             st.session_state.settings['last_alert_check'] = today
 
     if should_check_alerts and st.session_state.batches:
-        # Get the danger and warning thresholds from settings
-        danger_threshold = st.session_state.settings['danger_threshold']
-        warning_threshold = st.session_state.settings['warning_threshold']
-
-        # Check all batches for over-carbonation risk
-        at_risk_batches = []
-
-        for batch in st.session_state.batches:
-            # Skip if the batch doesn't have measurements
-            if "measurements" not in batch or not batch["measurements"]:
-                continue
-
-            # Get the latest measurement
-            latest_measurement = sorted(batch["measurements"], key=lambda m: m["date"], reverse=True)[0]
-
-            # Check if CO₂ pressure exceeds thresholds
-            if "co2_pressure" in latest_measurement:
-                pressure = latest_measurement["co2_pressure"]
-                risk_level = None
-
-                if pressure >= danger_threshold:
-                    risk_level = "danger"
-                elif pressure >= warning_threshold:
-                    risk_level = "warning"
-
-                if risk_level:
-                    at_risk_batches.append({
-                        "name": batch["name"],
-                        "pressure": pressure,
-                        "risk_level": risk_level,
-                        "date": latest_measurement["date"]
-                    })
+        # Read the alerts evaluated by the background engine
+        at_risk_batches = store.load_alerts()
 
         # Display alerts if any batches are at risk
         if at_risk_batches:
             st.markdown("### ⚠️ Carbonation Alerts")
 
             # Create columns for the alerts
-            alert_cols = st.columns([1, 1, 1, 1])
+            alert_cols = st.columns([1, 1, 1, 1, 1])
             alert_cols[0].markdown("**Batch Name**")
             alert_cols[1].markdown("**CO₂ Pressure**")
             alert_cols[2].markdown("**Risk Level**")
-            alert_cols[3].markdown("**Last Measured**")
+            alert_cols[3].markdown("**As Of**")
+            alert_cols[4].markdown("**Danger In**")
 
-            # Sort batches by risk level (danger first) and then by pressure
-            at_risk_batches.sort(key=lambda b: (0 if b["risk_level"] == "danger" else 1, -b["pressure"]))
+            # Most urgent first: danger, then the fewest hours until danger
+            at_risk_batches.sort(key=lambda b: (0 if b["risk_level"] == "danger" else 1,
+                                                hours_until(b["danger_at"]) if b["danger_at"] else float("inf"),
+                                                -b["pressure"]))
 
             for batch in at_risk_batches:
-                cols = st.columns([1, 1, 1, 1])
+                cols = st.columns([1, 1, 1, 1, 1])
                 cols[0].write(batch["name"])
                 cols[1].write(f"{batch['pressure']:.2f} atm")
 
@@ -219,7 +265,17 @@ if st.session_state.settings['show_alerts']:
                 else:
                     cols[2].warning("Warning")
 
-                cols[3].write(batch["date"])
+                if batch["source"] == "projected":
+                    cols[3].write(f"{batch['date']} (projected)")
+                else:
+                    cols[3].write(batch["date"])
+
+                if batch["risk_level"] == "danger":
+                    cols[4].write("Now")
+                elif batch["danger_at"]:
+                    cols[4].write(f"{hours_until(batch['danger_at']):.0f} h")
+                else:
+                    cols[4].write("—")
 
             # Replace the View Fermentation Data button with clearer guidance
             st.info("""
@@ -232,6 +288,30 @@ if st.session_state.settings['show_alerts']:
 
             st.markdown("---")
 
+        # Forecast for every bottled batch, including those not alerting yet
+        forecasts = store.load_forecasts()
+        if forecasts:
+            with st.expander("📅 Pressure Forecast"):
+                def time_left(crossing):
+                    if crossing is None:
+                        return "—"
+                    hours = hours_until(crossing)
+                    return "Now" if hours == 0 else f"{hours:.0f} h"
+
+                st.dataframe(
+                    pd.DataFrame([
+                        {
+                            "Batch Name": forecast["name"],
+                            "Projected Pressure": f"{forecast['pressure']:.2f} atm",
+                            "Warning In": time_left(forecast["warning_at"]),
+                            "Danger In": time_left(forecast["danger_at"])
+                        }
+                        for forecast in forecasts
+                    ]),
+                    hide_index=True,
+                    use_container_width=True
+                )
+
 # Initialize the active tab in session state if it doesn't exist
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = "batch"  # Default to batch management
@@ -363,7 +443,7 @@ if st.session_state.active_tab == "batch":
 
                     # Add to session state
                     st.session_state.batches.append(new_batch)
-                    save_data()  # Save data to file
+                    save_change(store.add_batch, new_batch)
 
                     st.success("Batch logged successfully!")
 
@@ -404,7 +484,7 @@ if st.session_state.active_tab == "batch":
                                 batch for batch in st.session_state.batches 
                                 if batch["name"] != batch_to_delete
                             ]
-                            save_data()  # Save data to file
+                            save_change(store.delete_batch, batch_to_delete)
                             st.success(f"Batch '{batch_to_delete}' deleted successfully!")
                             st.session_state.confirm_delete = False
                             st.rerun()
@@ -702,20 +782,23 @@ elif st.session_state.active_tab == "primary":
                         st.success("✅ No reading recorded for today yet. It's a good time to add your daily measurement!")
                     
                     if st.button("💾 Record Readings", use_container_width=True, key="save_primary_readings"):
+                        selected_batch = writable_batch(selected_batch)
+
                         # Initialize measurements list if it doesn't exist
                         if "measurements" not in selected_batch:
                             selected_batch["measurements"] = []
 
                         # Add new measurement (without SCOBY thickness)
-                        selected_batch["measurements"].append({
+                        new_measurement = {
                             "date": today.strftime("%Y-%m-%d"),
                             "temperature": temperature,
                             "ph": ph_level,
                             "taste": taste,
                             "brix": brix,
                             "phase": "primary"
-                        })
-                        save_data()  # Save data to file
+                        }
+                        selected_batch["measurements"].append(new_measurement)
+                        save_change(store.add_measurement, selected_batch["name"], new_measurement)
 
                         st.success("Readings saved successfully!")
                         
@@ -725,9 +808,10 @@ elif st.session_state.active_tab == "primary":
                     
                     if st.button("Move to Secondary Fermentation", use_container_width=True, key="move_to_secondary"):
                         # Update the batch to secondary phase
+                        selected_batch = writable_batch(selected_batch)
                         selected_batch["fermentation_phase"] = "secondary"
                         selected_batch["bottling_date"] = today.strftime("%Y-%m-%d")
-                        save_data()
+                        save_change(store.update_batch, selected_batch)
                         
                         st.success("Batch moved to secondary fermentation! Please go to the Secondary Fermentation tab to add bottling details.")
                         st.balloons()
@@ -743,12 +827,14 @@ elif st.session_state.active_tab == "primary":
                     sugar_amount=selected_batch['sugar_content'],
                     days=days_fermenting,
                     temperature=temperature,
-                    volume=selected_batch['volume']
+                    volume=selected_batch['volume'],
+                    constants=constants_for_batch(selected_batch)
                 )
                 
                 completion_pct = estimate_fermentation_completion(
                     sugar_amount=selected_batch['sugar_content'],
-                    co2_produced=co2_produced
+                    co2_produced=co2_produced,
+                    constants=constants_for_batch(selected_batch)
                 )
                 
                 # Create a two-column layout for the metrics
@@ -768,7 +854,8 @@ elif st.session_state.active_tab == "primary":
                     co2_pressure = estimate_co2(
                         sugar_content=selected_batch['sugar_content'],
                         temp=temperature,
-                        time_in_days=days_fermenting
+                        time_in_days=days_fermenting,
+                        constants=constants_for_batch(selected_batch)
                     )
 
                     # Get thresholds from settings
@@ -910,9 +997,8 @@ elif st.session_state.active_tab == "primary":
                     st.markdown("---")
                     st.subheader("📈 Measurement History")
 
-                    # Create a dataframe from measurements
-                    measurements_df = pd.DataFrame(selected_batch["measurements"])
-                    measurements_df["date"] = pd.to_datetime(measurements_df["date"])
+                    # Charts and table read from the measurement columns
+                    history_df = measurement_history(selected_batch)
 
                     # Create tabs for different charts with custom styling
                     chart_tab1, chart_tab2, chart_tab3 = st.tabs(["📊 CO₂ Production", "📈 CO₂ Pressure", "🔍 Data Table"])
@@ -920,7 +1006,7 @@ elif st.session_state.active_tab == "primary":
                     with chart_tab1:
                         # Create a line chart of CO₂ production over time with improved styling
                         fig1 = px.line(
-                            measurements_df,
+                            history_df,
                             x="date",
                             y="co2_estimate",
                             title="CO₂ Production Over Time",
@@ -942,7 +1028,7 @@ elif st.session_state.active_tab == "primary":
                     with chart_tab2:
                         # Create a line chart of CO₂ pressure over time with improved styling
                         fig2 = px.line(
-                            measurements_df,
+                            history_df,
                             x="date",
                             y="co2_pressure",
                             title="CO₂ Pressure Over Time",
@@ -988,7 +1074,7 @@ elif st.session_state.active_tab == "primary":
                     with chart_tab3:
                         # Display the measurements table with improved styling
                         st.dataframe(
-                            measurements_df,
+                            history_df.dropna(axis=1, how="all"),
                             column_config={
                                 "date": "Date",
                                 "temperature": st.column_config.NumberColumn("Temp (°C)", format="%.1f °C"),
@@ -1055,16 +1141,14 @@ elif st.session_state.active_tab == "primary":
             """)
 
             # Generate prediction data
-            prediction_days = list(range(days_fermenting, days_fermenting + 8))
-            prediction_co2 = [
-                calculate_co2_production(
-                    sugar_amount=selected_batch['sugar_content'],
-                    days=day,
-                    temperature=temperature,
-                    volume=selected_batch['volume']
-                )
-                for day in prediction_days
-            ]
+            prediction_days, prediction_co2 = predict_co2_timeline_array(
+                sugar_amount=selected_batch['sugar_content'],
+                temperature=temperature,
+                volume=selected_batch['volume'],
+                days=7,
+                start_day=days_fermenting,
+                constants=constants_for_batch(selected_batch)
+            )
 
             # Create a dataframe for the prediction
             prediction_df = pd.DataFrame({
@@ -1213,10 +1297,11 @@ elif st.session_state.active_tab == "secondary":
                         )
                         
                         if st.button("Update Bottling Details", use_container_width=True, key="update_bottling_details"):
+                            selected_batch = writable_batch(selected_batch)
                             selected_batch['bottle_type'] = bottle_type
                             selected_batch['added_sugar'] = added_sugar
                             selected_batch['flavoring'] = flavoring
-                            save_data()
+                            save_change(store.update_batch, selected_batch)
                             st.success("Bottling details updated successfully!")
                     
                     # Secondary fermentation specific inputs
@@ -1249,12 +1334,14 @@ elif st.session_state.active_tab == "secondary":
                     # Save readings button
                     st.markdown("---")
                     if st.button("💾 Record Secondary Readings", use_container_width=True, key="save_secondary_readings"):
+                        selected_batch = writable_batch(selected_batch)
+
                         # Initialize measurements list if it doesn't exist
                         if "measurements" not in selected_batch:
                             selected_batch["measurements"] = []
 
                         # Add new measurement with secondary phase data
-                        selected_batch["measurements"].append({
+                        new_measurement = {
                             "date": today.strftime("%Y-%m-%d"),
                             "temperature": temperature,
                             "carbonation_level": carbonation_level,
@@ -1263,8 +1350,9 @@ elif st.session_state.active_tab == "secondary":
                             "co2_pressure": co2_pressure,
                             "completion": completion_pct,
                             "phase": "secondary"
-                        })
-                        save_data()  # Save data to file
+                        }
+                        selected_batch["measurements"].append(new_measurement)
+                        save_change(store.add_measurement, selected_batch["name"], new_measurement)
                         st.success("Secondary fermentation readings saved successfully!")
 
     with scol2:
@@ -1272,18 +1360,19 @@ elif st.session_state.active_tab == "secondary":
             # Add a container with styling
             with st.container():
                 st.subheader("CO₂ Production Estimate")
-                
+
+                # Accumulate CO2 and pressure over the storage temperatures recorded
+                # since bottling, then project to today at the current temperature
+                batch_history = co2_history(selected_batch, data_version)
+                history_day = max(days_bottled, batch_history.last_day)
+
                 # Calculate CO2 production and completion percentage
-                co2_produced = calculate_co2_production(
-                    sugar_amount=selected_batch['sugar_content'],
-                    days=days_bottled,
-                    temperature=temperature,
-                    volume=selected_batch['volume']
-                )
+                co2_produced = batch_history.estimate(history_day, temperature)
                 
                 completion_pct = estimate_fermentation_completion(
                     sugar_amount=selected_batch['sugar_content'],
-                    co2_produced=co2_produced
+                    co2_produced=co2_produced,
+                    constants=constants_for_batch(selected_batch)
                 )
                 
                 # Create a two-column layout for the metrics
@@ -1299,12 +1388,8 @@ elif st.session_state.active_tab == "secondary":
                     )
                 
                 with metric_col2:
-                    # Calculate CO₂ pressure
-                    co2_pressure = estimate_co2(
-                        sugar_content=selected_batch['sugar_content'],
-                        temp=temperature,
-                        time_in_days=days_bottled
-                    )
+                    # Calculate CO₂ pressure along the same temperature history
+                    co2_pressure = batch_history.estimate_pressure(history_day, temperature)
 
                     # Get thresholds from settings
                     danger_threshold = st.session_state.settings['danger_threshold']
@@ -1427,9 +1512,8 @@ elif st.session_state.active_tab == "secondary":
                     st.markdown("---")
                     st.subheader("📈 Measurement History")
 
-                    # Create a dataframe from measurements
-                    measurements_df = pd.DataFrame(selected_batch["measurements"])
-                    measurements_df["date"] = pd.to_datetime(measurements_df["date"])
+                    # Charts and table read from the measurement columns
+                    history_df = measurement_history(selected_batch)
 
                     # Create tabs for different charts with custom styling
                     chart_tab1, chart_tab2, chart_tab3 = st.tabs(["📊 CO₂ Production", "📈 CO₂ Pressure", "🔍 Data Table"])
@@ -1437,7 +1521,7 @@ elif st.session_state.active_tab == "secondary":
                     with chart_tab1:
                         # Create a line chart of CO₂ production over time with improved styling
                         fig1 = px.line(
-                            measurements_df,
+                            history_df,
                             x="date",
                             y="co2_estimate",
                             title="CO₂ Production Over Time",
@@ -1459,7 +1543,7 @@ elif st.session_state.active_tab == "secondary":
                     with chart_tab2:
                         # Create a line chart of CO₂ pressure over time with improved styling
                         fig2 = px.line(
-                            measurements_df,
+                            history_df,
                             x="date",
                             y="co2_pressure",
                             title="CO₂ Pressure Over Time",
@@ -1505,7 +1589,7 @@ elif st.session_state.active_tab == "secondary":
                     with chart_tab3:
                         # Display the measurements table with improved styling
                         st.dataframe(
-                            measurements_df,
+                            history_df.dropna(axis=1, how="all"),
                             column_config={
                                 "date": "Date",
                                 "temperature": st.column_config.NumberColumn("Temp (°C)", format="%.1f °C"),
@@ -1571,16 +1655,16 @@ elif st.session_state.active_tab == "secondary":
             """)
 
             # Generate prediction data
-            prediction_days = list(range(days_bottled, days_bottled + 8))
-            prediction_co2 = [
-                calculate_co2_production(
-                    sugar_amount=selected_batch['sugar_content'],
-                    days=day,
-                    temperature=temperature,
-                    volume=selected_batch['volume']
-                )
-                for day in prediction_days
-            ]
+            prediction_days, prediction_co2 = predict_co2_timeline_array(
+                sugar_amount=selected_batch['sugar_content'],
+                temperature=temperature,
+                volume=selected_batch['volume'],
+                days=7,
+                start_day=days_bottled,
+                constants=constants_for_batch(selected_batch)
+            )
+            # Continue from today's estimate over the recorded temperatures
+            prediction_co2 = co2_produced + (prediction_co2 - prediction_co2[0])
 
             # Create a dataframe for the prediction
             prediction_df = pd.DataFrame({
@@ -1607,6 +1691,47 @@ elif st.session_state.active_tab == "secondary":
 
             st.plotly_chart(fig, use_container_width=True)
 
+            # Optional uncertainty bands for the pressure prediction
+            if st.checkbox("Show pressure uncertainty bands", key="show_pressure_bands",
+                           help="Simulate temperature and sugar variations to estimate a range of likely pressures"):
+                danger_threshold = st.session_state.settings['danger_threshold']
+                warning_threshold = st.session_state.settings['warning_threshold']
+
+                # Continue from today's pressure along the recorded temperatures
+                pressure_bands = estimate_co2_bands(
+                    sugar_content=selected_batch['sugar_content'],
+                    temp=temperature,
+                    time_in_days=range(days_bottled, days_bottled + 15),
+                    thresholds=(warning_threshold, danger_threshold),
+                    constants=constants_for_batch(selected_batch),
+                    start_pressure=co2_pressure
+                )
+
+                bands_df = pd.DataFrame({
+                    "day": pressure_bands["days"],
+                    "5th percentile": pressure_bands["bands"][5],
+                    "Median": pressure_bands["bands"][50],
+                    "95th percentile": pressure_bands["bands"][95]
+                })
+
+                bands_fig = px.line(
+                    bands_df,
+                    x="day",
+                    y=["5th percentile", "Median", "95th percentile"],
+                    title="Predicted CO₂ Pressure Range",
+                    labels={"day": "Fermentation Day", "value": "Pressure (atm)", "variable": ""}
+                )
+                bands_fig.add_hline(y=danger_threshold, line_dash="dash", line_color="red", annotation_text="Danger")
+                bands_fig.add_hline(y=warning_threshold, line_dash="dash", line_color="orange", annotation_text="Warning")
+
+                st.plotly_chart(bands_fig, use_container_width=True)
+
+                st.markdown(f"""
+                **Probability of exceeding thresholds within 14 days**:
+                - Warning ({warning_threshold} atm): {pressure_bands["exceedance"][warning_threshold][-1] * 100:.0f}%
+                - Danger ({danger_threshold} atm): {pressure_bands["exceedance"][danger_threshold][-1] * 100:.0f}%
+                """)
+
 elif st.session_state.active_tab == "comparison":
     st.header("Batch Comparison")
     st.markdown("""
@@ -1817,7 +1942,7 @@ if st.session_state.batches:
         with col1:
             if st.button("Yes, Delete Everything", type="primary", key="confirm_clear_yes"):
                 st.session_state.batches = []
-                save_data()  # Save data to file
+                save_change(store.clear_batches)
                 st.session_state.confirm_clear_all = False
                 st.success("All batch data has been cleared.")
                 st.rerun()
@@ -0,0 +1,346 @@
+"""
+Model Calibration for Kombucha CO2 Estimation
+
+This module fits the constants of the CO2 production model in
+co2_calculator.py from the measurements logged in batch storage (see
+storage.py). The constants are MAX_CO2_RATIO and the per-degree temperature
+coefficient. A separate set is fitted for every tea type and vessel type
+seen in the data (FITTED_FIELDS). The bottle type is left out: it only
+matters after bottling, and the fit never sees a bottled reading.
+
+The stored co2_estimate and co2_pressure values are outputs of the models
+themselves, so fitting against them would only reproduce the constants they
+were calculated with. The fit uses the Brix readings instead: the sugar
+consumed since the batch's first Brix reading, converted to grams of CO2
+(CO2_PER_GRAM_SUGAR), is the observed production. Only primary readings
+carry a Brix value, so days are counted from the batch start date, as on the
+Primary Fermentation tab. SUGAR_TO_PRESSURE_FACTOR has no observed
+counterpart (no pressure is ever measured) and keeps its default.
+
+The production model is linear in its constants once the known factors are
+folded into the features:
+    co2 = ratio * x + ratio * coefficient * x * (temp - 25),
+    where x = sugar * time factor gain * volume factor
+
+The model is a scikit-learn SGDRegressor trained with partial_fit. The
+pipeline remembers how many measurements of each batch it has already
+consumed, so a refit only streams the newly logged readings instead of
+rescanning the whole history. Fitted constants outside PLAUSIBLE_CONSTANTS
+are rejected, and the group keeps the defaults for them.
+
+The fitted constants are written to co2_calculator.CALIBRATION_FILE, which the
+calculator loads once at startup. The estimator state needed for the next
+incremental refit is pickled to CALIBRATION_STATE_FILE.
+
+Usage:
+    python calibration.py
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import datetime
+import json
+import os
+import pickle
+
+import numpy as np
+from sklearn.linear_model import SGDRegressor
+
+from co2_calculator import CALIBRATION_FILE, DEFAULT_MODEL_CONSTANTS, _time_factor_array
+from storage import open_store
+
+CALIBRATION_STATE_FILE = os.environ.get("KOMBUCHA_CALIBRATION_STATE_FILE", "model_calibration.pkl")
+
+# Batch fields fitted per value; a subset of co2_calculator.CALIBRATION_FIELDS
+FITTED_FIELDS = ("tea_type", "vessel_type")
+
+# Features are divided by this so the SGD coefficients are of order one
+FEATURE_SCALE = 100.0
+
+# Passes over each chunk of new measurements
+EPOCHS_PER_UPDATE = 200
+
+# Minimum number of measurements before a group's constants are published
+MIN_SAMPLES = 3
+
+# Grams of sugar per liter for each degree Brix
+SUGAR_PER_BRIX = 10.0
+
+# Grams of CO2 released per gram of sugar fermented (2 CO2 per glucose)
+CO2_PER_GRAM_SUGAR = 0.489
+
+# Range a fitted constant must fall in to be published
+PLAUSIBLE_CONSTANTS = {
+    "max_co2_ratio": (0.1, 0.55),
+    "temp_coefficient": (0.0, 0.1)
+}
+
+# Bumped whenever the fit changes, so state saved by an older version is discarded
+STATE_VERSION = 3
+
+def _plausible(name, value):
+    """True if a fitted constant lies in its PLAUSIBLE_CONSTANTS range."""
+    low, high = PLAUSIBLE_CONSTANTS[name]
+    return low <= value <= high
+
+def _start_brix(batch):
+    """
+    Return the day and value of a batch's first Brix reading.
+
+    Args:
+        batch (dict): Batch dictionary as stored in kombucha_data.json
+
+    Returns:
+        tuple: (days since the start date, Brix), or None without Brix readings
+    """
+    start = datetime.datetime.strptime(batch["start_date"], "%Y-%m-%d")
+    readings = [m for m in batch.get("measurements", [])
+                if m.get("phase", "primary") == "primary" and isinstance(m.get("brix"), (int, float))]
+    if not readings:
+        return None
+
+    first = min(readings, key=lambda m: m["date"])
+    return (datetime.datetime.strptime(first["date"], "%Y-%m-%d") - start).days, float(first["brix"])
+
+def measurement_rows(batch, measurements=None):
+    """
+    Extract model inputs and observed CO2 production from a batch's measurements.
+
+    Days are counted from the batch start date. The observed production of a
+    primary reading with a Brix value is the sugar consumed since the batch's
+    first Brix reading, in grams of CO2. Readings without a Brix value or a
+    temperature, and readings on or before the first Brix reading, are skipped.
+
+    Args:
+        batch (dict): Batch dictionary as stored in kombucha_data.json
+        measurements (list, optional): Measurements to use. Defaults to all of the batch's measurements.
+
+    Returns:
+        dict: Arrays "days", "temperature" and "co2_observed", and
+        "start_day", the day of the first Brix reading
+    """
+    if measurements is None:
+        measurements = batch.get("measurements", [])
+
+    start = datetime.datetime.strptime(batch["start_date"], "%Y-%m-%d")
+    start_brix = _start_brix(batch)
+    volume = float(batch.get("volume", 1.0))
+    rows = []
+
+    for measurement in measurements if start_brix is not None else []:
+        if measurement.get("phase", "primary") != "primary":
+            continue
+        if not isinstance(measurement.get("brix"), (int, float)) or measurement.get("temperature") is None:
+            continue
+
+        days = (datetime.datetime.strptime(measurement["date"], "%Y-%m-%d") - start).days
+        if days <= start_brix[0]:
+            continue
+
+        sugar_consumed = (start_brix[1] - measurement["brix"]) * SUGAR_PER_BRIX * volume
+        rows.append((days, measurement["temperature"], sugar_consumed * CO2_PER_GRAM_SUGAR))
+
+    columns = np.array(rows, dtype=float).reshape(-1, 3)
+
+    return {
+        "days": columns[:, 0],
+        "temperature": columns[:, 1],
+        "co2_observed": columns[:, 2],
+        "start_day": start_brix[0] if start_brix is not None else 0
+    }
+
+def _new_regressor():
+    """Create an SGD regressor for a linear model through the origin."""
+    return SGDRegressor(fit_intercept=False, alpha=0.0, learning_rate="constant", eta0=0.01)
+
+class CalibrationPipeline:
+    """
+    Incrementally fitted model constants per tea and vessel type.
+
+    Attributes:
+        groups (dict): (field, value) -> {"production": SGDRegressor, "samples": int}
+        seen (dict): Batch name -> number of measurements already consumed
+        version (int): STATE_VERSION the pipeline was created with
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.seen = {}
+        self.version = STATE_VERSION
+
+    def _group(self, key):
+        """Return the estimators for a (field, value) group, creating them if needed."""
+        if key not in self.groups:
+            self.groups[key] = {
+                "production": _new_regressor(),
+                "samples": 0
+            }
+        return self.groups[key]
+
+    def _temp_coefficient(self, group):
+        """
+        Temperature coefficient from a group's production model.
+
+        Falls back to the default until the group has enough samples, and
+        whenever the fit is implausible, e.g. says fermentation slows down as
+        it gets warmer, which only happens with too little or too noisy data.
+        """
+        if group["samples"] < MIN_SAMPLES:
+            return DEFAULT_MODEL_CONSTANTS.temp_coefficient
+
+        ratio, ratio_times_coefficient = group["production"].coef_
+        if ratio <= 0:
+            return DEFAULT_MODEL_CONSTANTS.temp_coefficient
+
+        coefficient = ratio_times_coefficient / ratio
+        if not _plausible("temp_coefficient", coefficient):
+            return DEFAULT_MODEL_CONSTANTS.temp_coefficient
+
+        return coefficient
+
+    def update(self, batches):
+        """
+        Fit the models on measurements logged since the previous update.
+
+        Args:
+            batches (list): Batch dictionaries as stored in kombucha_data.json
+
+        Returns:
+            int: Number of new measurements used
+        """
+        used = 0
+
+        for batch in batches:
+            measurements = batch.get("measurements", [])
+            new_measurements = measurements[self.seen.get(batch["name"], 0):]
+            self.seen[batch["name"]] = len(measurements)
+
+            rows = measurement_rows(batch, new_measurements)
+            if len(rows["days"]) == 0:
+                continue
+
+            sugar = float(batch["sugar_content"])
+            volume = float(batch.get("volume", 1.0))
+            volume_factor = max(0.8, 1.0 - (0.05 * max(0, volume - 2) / 10))
+            # Production since the first Brix reading, not since the start date
+            time_factor = _time_factor_array(rows["days"]) - _time_factor_array(rows["start_day"])
+            temp_offset = rows["temperature"] - 25
+
+            base = sugar * time_factor * volume_factor / FEATURE_SCALE
+            production_features = np.column_stack([base, base * temp_offset])
+            production_target = rows["co2_observed"] / FEATURE_SCALE
+
+            for field in FITTED_FIELDS:
+                if not batch.get(field):
+                    continue
+
+                group = self._group((field, batch[field]))
+
+                for _ in range(EPOCHS_PER_UPDATE):
+                    group["production"].partial_fit(production_features, production_target)
+                group["samples"] += len(rows["days"])
+
+            used += len(rows["days"])
+
+        return used
+
+    def constants(self):
+        """
+        Derive the fitted model constants for every group with enough data.
+
+        Groups whose fitted ratio is implausible are left out, so they keep
+        the default constants.
+
+        Returns:
+            dict: Batch field -> field value -> constant overrides, in the
+            format read by co2_calculator.load_calibration
+        """
+        fitted = {}
+
+        for (field, value), group in self.groups.items():
+            if group["samples"] < MIN_SAMPLES:
+                continue
+
+            ratio = float(group["production"].coef_[0])
+            if not _plausible("max_co2_ratio", ratio):
+                print(f"Rejected calibration for {field}={value}: max_co2_ratio={ratio:.4f}")
+                continue
+
+            fitted.setdefault(field, {})[value] = {
+                "max_co2_ratio": ratio,
+                "temp_coefficient": float(self._temp_coefficient(group))
+            }
+
+        return fitted
+
+    def save(self, state_path=CALIBRATION_STATE_FILE, calibration_path=CALIBRATION_FILE):
+        """
+        Persist the estimator state and the fitted constants.
+
+        Args:
+            state_path (str, optional): Pickle file for the estimator state. Defaults to CALIBRATION_STATE_FILE.
+            calibration_path (str, optional): JSON file read by co2_calculator. Defaults to CALIBRATION_FILE.
+        """
+        with open(state_path, 'wb') as f:
+            pickle.dump(self, f)
+
+        data = {
+            "updated_at": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "samples": {f"{field}={value}": group["samples"] for (field, value), group in self.groups.items()},
+            "constants": self.constants()
+        }
+        with open(calibration_path, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    @classmethod
+    def load(cls, state_path=CALIBRATION_STATE_FILE):
+        """
+        Load a previously saved pipeline, or start a new one.
+
+        State saved by an older version of the fit is discarded, so the next
+        update refits from the full history.
+
+        Args:
+            state_path (str, optional): Pickle file for the estimator state. Defaults to CALIBRATION_STATE_FILE.
+
+        Returns:
+            CalibrationPipeline: Pipeline ready for the next incremental update
+        """
+        if os.path.exists(state_path):
+            with open(state_path, 'rb') as f:
+                pipeline = pickle.load(f)
+            if getattr(pipeline, "version", None) == STATE_VERSION:
+                return pipeline
+        return cls()
+
+def recalibrate(store=None, state_path=CALIBRATION_STATE_FILE, calibration_path=CALIBRATION_FILE):
+    """
+    Update the calibration with newly logged measurements and save it.
+
+    Args:
+        store (SQLiteStore or JSONFileStore, optional): Batch storage. Defaults to the configured store.
+        state_path (str, optional): Pickle file for the estimator state. Defaults to CALIBRATION_STATE_FILE.
+        calibration_path (str, optional): JSON file read by co2_calculator. Defaults to CALIBRATION_FILE.
+
+    Returns:
+        CalibrationPipeline: The updated pipeline
+    """
+    if store is None:
+        store = open_store()
+    batches, _ = store.load()
+
+    pipeline = CalibrationPipeline.load(state_path)
+    used = pipeline.update(batches)
+    pipeline.save(state_path, calibration_path)
+
+    print(f"Calibrated on {used} new measurements from {len(batches)} batches")
+    return pipeline
+
+# Recalibrate if run directly
+if __name__ == "__main__":
+    pipeline = recalibrate()
+
+    for field, values in pipeline.constants().items():
+        for value, constants in values.items():
+            print(f"{field}={value}: " + ", ".join(f"{name}={constant:.4f}" for name, constant in constants.items()))
@@ -13,13 +13,131 @@ Key functions:
 - estimate_fermentation_completion: Calculates percentage of fermentation completed
 - estimate_co2: Estimates CO2 pressure in a sealed container
 - predict_co2_timeline: Generates a timeline of predicted CO2 production
+- predict_co2_timeline_array: Same timeline as a (days, co2) pair of arrays
 - calculate_sugar_needed: Estimates sugar needed for target CO2 production
+- calculate_sugar_needed_array: Exact batched inverse for many CO2 targets
+- estimate_co2_bands: Monte Carlo percentile bands for CO2 pressure
+- days_until_pressure_array: Closed-form time until the pressure model reaches a threshold
+- get_model_constants / constants_for_batch: Calibrated model constants for a batch
+- stack_model_constants: Combine per-batch constants for the vectorized functions
+
+Vectorized variants (calculate_co2_production_array, estimate_co2_array and
+estimate_fermentation_completion_array) accept NumPy arrays or broadcastable
+mixes of arrays and scalars and evaluate the same models in a single pass.
+
+integrate_co2_history and CO2HistoryIntegrator accumulate CO2 production over a
+batch's recorded temperature series instead of a single average temperature.
 
 Author: Deen
 Email: deen.htc@gmail.com
 """
 
-def calculate_co2_production(sugar_amount, days, temperature=25, volume=1.0):
+import datetime
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# Tunable constants of the CO2 models. The defaults are the hand-picked values
+# the models were written with; calibrated values fitted from logged batches
+# (see calibration.py) are loaded from CALIBRATION_FILE at import time.
+ModelConstants = namedtuple("ModelConstants", ["max_co2_ratio", "temp_coefficient", "sugar_to_pressure_factor"])
+
+DEFAULT_MODEL_CONSTANTS = ModelConstants(
+    max_co2_ratio=0.46,  # Approximately 46% of sugar weight becomes CO2
+    temp_coefficient=0.05,  # 5% change in fermentation rate per degree C
+    sugar_to_pressure_factor=0.01  # 1g of sugar produces 0.01 atm in a typical bottle
+)
+
+CALIBRATION_FILE = os.environ.get("KOMBUCHA_CALIBRATION_FILE", "model_calibration.json")
+
+# Batch fields that calibrations are fitted for, from least to most specific
+CALIBRATION_FIELDS = ("tea_type", "vessel_type", "bottle_type")
+
+# Breakpoints of the piecewise-linear time factor shared by the models:
+# 70% conversion after one week, 90% after two and 100% after four.
+TIME_FACTOR_DAYS = np.array([0.0, 7.0, 14.0, 28.0])
+TIME_FACTOR_VALUES = np.array([0.0, 0.7, 0.9, 1.0])
+
+def load_calibration(path=CALIBRATION_FILE):
+    """
+    Load fitted model constants from a calibration file.
+
+    Args:
+        path (str, optional): Path to the calibration JSON file. Defaults to CALIBRATION_FILE.
+
+    Returns:
+        dict: Mapping of batch field -> field value -> constant overrides,
+        e.g. {"tea_type": {"Black": {"max_co2_ratio": 0.44}}}. Empty if the
+        file does not exist or cannot be read.
+    """
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+        return data.get('constants', {})
+    except Exception as e:
+        print(f"Error loading calibration: {e}")
+        return {}
+
+# Calibrated constants, loaded once at startup
+CALIBRATION = load_calibration()
+
+def get_model_constants(tea_type=None, vessel_type=None, bottle_type=None):
+    """
+    Look up the model constants for a combination of batch properties.
+
+    Calibrations for the tea type, vessel type and bottle type are applied in
+    that order on top of the defaults, so the most specific one wins for each
+    constant it was fitted for.
+
+    Args:
+        tea_type (str, optional): Tea type of the batch. Defaults to None.
+        vessel_type (str, optional): Fermentation vessel of the batch. Defaults to None.
+        bottle_type (str, optional): Bottle type used for secondary fermentation. Defaults to None.
+
+    Returns:
+        ModelConstants: Constants to pass to the model functions
+    """
+    constants = DEFAULT_MODEL_CONSTANTS._asdict()
+
+    for field, value in zip(CALIBRATION_FIELDS, (tea_type, vessel_type, bottle_type)):
+        if value is not None:
+            constants.update(CALIBRATION.get(field, {}).get(value, {}))
+
+    return ModelConstants(**constants)
+
+def constants_for_batch(batch):
+    """
+    Look up the model constants for a batch dictionary.
+
+    Args:
+        batch (dict): Batch with optional tea_type, vessel_type and bottle_type keys
+
+    Returns:
+        ModelConstants: Constants to pass to the model functions
+    """
+    return get_model_constants(*(batch.get(field) for field in CALIBRATION_FIELDS))
+
+def stack_model_constants(constants_list):
+    """
+    Combine the constants of several batches into one set of arrays.
+
+    The result can be passed to the vectorized functions to evaluate many
+    batches, each with its own calibration, in a single pass.
+
+    Args:
+        constants_list (list): ModelConstants, one per batch
+
+    Returns:
+        ModelConstants: Constants whose fields are arrays with one entry per batch
+    """
+    return ModelConstants(*np.array(constants_list, dtype=float).reshape(-1, len(ModelConstants._fields)).T)
+
+def calculate_co2_production(sugar_amount, days, temperature=25, volume=1.0, constants=None):
     """
     Calculate estimated CO2 production during kombucha fermentation.
 
@@ -33,17 +151,21 @@ def calculate_co2_production(sugar_amount, days, temperature=25, volume=1.0):
         days (int): Number of days of fermentation
         temperature (float, optional): Average temperature in Celsius. Defaults to 25.
         volume (float, optional): Volume of the batch in liters. Defaults to 1.0.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
 
     Returns:
         float: Estimated CO2 production in grams
     """
     # Constants for the model
+    if constants is None:
+        constants = DEFAULT_MODEL_CONSTANTS
+
     # Theoretical maximum CO2 production from sugar (approximately 46% of sugar weight)
-    MAX_CO2_RATIO = 0.46
+    MAX_CO2_RATIO = constants.max_co2_ratio
 
     # Temperature adjustment factor (fermentation is faster at higher temperatures)
     # Base temperature is 25°C
-    temp_factor = 1.0 + (temperature - 25) * 0.05  # 5% change per degree C
+    temp_factor = 1.0 + (temperature - 25) * constants.temp_coefficient  # 5% change per degree C by default
 
     # Time-based efficiency factor (diminishing returns over time)
     # This models the decreasing fermentation rate as sugar is consumed
@@ -67,19 +189,23 @@ def calculate_co2_production(sugar_amount, days, temperature=25, volume=1.0):
 
     return co2_produced
 
-def estimate_fermentation_completion(sugar_amount, co2_produced):
+def estimate_fermentation_completion(sugar_amount, co2_produced, constants=None):
     """
     Estimate fermentation completion percentage based on CO2 production.
 
     Args:
         sugar_amount (float): Initial sugar amount in grams
         co2_produced (float): Estimated CO2 produced in grams
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
 
     Returns:
         float: Estimated completion percentage (0-100)
     """
+    if constants is None:
+        constants = DEFAULT_MODEL_CONSTANTS
+
     # Theoretical maximum CO2 production
-    max_co2 = sugar_amount * 0.46
+    max_co2 = sugar_amount * constants.max_co2_ratio
 
     # Calculate completion percentage
     completion = (co2_produced / max_co2) * 100 if max_co2 > 0 else 0
@@ -87,7 +213,7 @@ def estimate_fermentation_completion(sugar_amount, co2_produced):
     # Cap at 100%
     return min(100, completion)
 
-def predict_co2_timeline(sugar_amount, temperature=25, volume=1.0, days=28):
+def predict_co2_timeline(sugar_amount, temperature=25, volume=1.0, days=28, constants=None):
     """
     Generate a timeline of predicted CO2 production over a specified number of days.
 
@@ -96,19 +222,41 @@ def predict_co2_timeline(sugar_amount, temperature=25, volume=1.0, days=28):
         temperature (float, optional): Average temperature in Celsius. Defaults to 25.
         volume (float, optional): Volume of the batch in liters. Defaults to 1.0.
         days (int, optional): Number of days to predict. Defaults to 28.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
 
     Returns:
         dict: Dictionary with days as keys and CO2 production as values
     """
-    timeline = {}
+    day_values, co2_values = predict_co2_timeline_array(sugar_amount, temperature, volume, days, constants=constants)
+
+    return dict(zip(day_values.tolist(), co2_values.tolist()))
 
-    for day in range(days + 1):
-        co2 = calculate_co2_production(sugar_amount, day, temperature, volume)
-        timeline[day] = co2
+def predict_co2_timeline_array(sugar_amount, temperature=25, volume=1.0, days=28, start_day=0, constants=None):
+    """
+    Generate a timeline of predicted CO2 production as contiguous arrays.
 
-    return timeline
+    The whole horizon is evaluated in one vectorized call, avoiding a function
+    call and a dict entry per day.
 
-def calculate_sugar_needed(target_co2, days, temperature=25, volume=1.0):
+    Args:
+        sugar_amount (float): Amount of sugar in grams
+        temperature (float, optional): Average temperature in Celsius. Defaults to 25.
+        volume (float, optional): Volume of the batch in liters. Defaults to 1.0.
+        days (int, optional): Number of days to predict. Defaults to 28.
+        start_day (int, optional): First day of the timeline. Defaults to 0.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+
+    Returns:
+        tuple: (days, co2) where days is an int array from start_day to
+        start_day + days inclusive and co2 is the matching float array of
+        CO2 production in grams
+    """
+    day_values = np.arange(start_day, start_day + days + 1)
+    co2_values = calculate_co2_production_array(sugar_amount, day_values, temperature, volume, constants)
+
+    return day_values, co2_values
+
+def calculate_sugar_needed(target_co2, days, temperature=25, volume=1.0, constants=None):
     """
     Calculate the amount of sugar needed to produce a target amount of CO2.
 
@@ -117,15 +265,19 @@ def calculate_sugar_needed(target_co2, days, temperature=25, volume=1.0):
         days (int): Planned fermentation time in days
         temperature (float, optional): Expected temperature in Celsius. Defaults to 25.
         volume (float, optional): Batch volume in liters. Defaults to 1.0.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
 
     Returns:
         float: Estimated sugar needed in grams
     """
+    if constants is None:
+        constants = DEFAULT_MODEL_CONSTANTS
+
     # Start with an initial guess
-    initial_sugar = target_co2 / 0.46
+    initial_sugar = target_co2 / constants.max_co2_ratio
 
     # Use the CO2 calculation function to refine the estimate
-    test_co2 = calculate_co2_production(initial_sugar, days, temperature, volume)
+    test_co2 = calculate_co2_production(initial_sugar, days, temperature, volume, constants)
 
     # Simple adjustment factor
     adjustment = target_co2 / test_co2 if test_co2 > 0 else 1.0
@@ -135,7 +287,48 @@ def calculate_sugar_needed(target_co2, days, temperature=25, volume=1.0):
 
     return sugar_needed
 
-def estimate_co2(sugar_content, temp, time_in_days):
+def calculate_sugar_needed_array(target_co2, days, temperature=25, volume=1.0, constants=None):
+    """
+    Solve for the sugar needed to reach many CO2 targets in one call.
+
+    Production is linear in sugar, and the other factors are piecewise-linear
+    in days. So each target has the exact inverse
+    target / yield(days, temperature, volume). No guess-and-correct step is
+    needed. All arguments are broadcast against each other.
+
+    A target is unsolvable when the model cannot produce it with a
+    non-negative amount of sugar. Examples are a positive target with no
+    fermentation time, a temperature so low that the model yields no CO2, or a
+    negative target.
+
+    Args:
+        target_co2 (array_like): Target CO2 production in grams
+        days (array_like): Planned fermentation time in days
+        temperature (array_like, optional): Expected temperature in Celsius. Defaults to 25.
+        volume (array_like, optional): Batch volume in liters. Defaults to 1.0.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+
+    Returns:
+        tuple: (sugar_needed, unsolved) where sugar_needed is an array of sugar
+        amounts in grams (NaN where no solution exists) and unsolved is the
+        number of targets that could not be solved
+    """
+    target_co2 = np.asarray(target_co2, dtype=float)
+    co2_yield = _co2_yield_array(days, temperature, volume, constants)
+    target_co2, co2_yield = np.broadcast_arrays(target_co2, co2_yield)
+
+    sugar_needed = np.full(target_co2.shape, np.nan)
+    np.divide(target_co2, co2_yield, out=sugar_needed, where=co2_yield > 0)
+
+    # A zero target is always met by zero sugar, even when nothing ferments
+    sugar_needed[(target_co2 == 0) & (co2_yield <= 0)] = 0.0
+    sugar_needed[sugar_needed < 0] = np.nan
+
+    unsolved = int(np.count_nonzero(np.isnan(sugar_needed)))
+
+    return sugar_needed, unsolved
+
+def estimate_co2(sugar_content, temp, time_in_days, constants=None):
     """
     Estimate CO₂ pressure buildup in a sealed container based on sugar content,
     temperature, and fermentation time.
@@ -147,10 +340,14 @@ def estimate_co2(sugar_content, temp, time_in_days):
         sugar_content (float): Amount of sugar in grams
         temp (float): Temperature in Celsius
         time_in_days (float): Fermentation time in days
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
 
     Returns:
         float: Estimated CO₂ pressure in atmospheres (atm)
     """
+    if constants is None:
+        constants = DEFAULT_MODEL_CONSTANTS
+
     # Input validation
     if sugar_content < 0:
         sugar_content = 0
@@ -160,7 +357,7 @@ def estimate_co2(sugar_content, temp, time_in_days):
     # Calculate temperature factor
     # Fermentation is faster at higher temperatures
     # Base temperature is 25°C
-    temp_factor = 1.0 + (temp - 25) * 0.05  # 5% change per degree C
+    temp_factor = 1.0 + (temp - 25) * constants.temp_coefficient  # 5% change per degree C by default
     
     # Ensure temperature factor is within reasonable bounds
     temp_factor = max(0.5, min(temp_factor, 2.0))
@@ -181,13 +378,387 @@ def estimate_co2(sugar_content, temp, time_in_days):
     # Sugar conversion factor (grams of sugar to pressure in atm)
     # This is a simplified conversion factor for demonstration purposes
     # In reality, this would depend on container volume, headspace, etc.
-    SUGAR_TO_PRESSURE_FACTOR = 0.01  # 1g of sugar produces 0.01 atm in a typical bottle
+    SUGAR_TO_PRESSURE_FACTOR = constants.sugar_to_pressure_factor  # 0.01 atm per gram of sugar by default
 
     # Calculate CO₂ pressure
     co2_pressure = sugar_content * temp_factor * time_factor * SUGAR_TO_PRESSURE_FACTOR
 
     return co2_pressure
 
+def _time_factor_array(days):
+    """
+    Evaluate the piecewise-linear time factor for an array of durations.
+
+    Args:
+        days (array_like): Fermentation time in days
+
+    Returns:
+        numpy.ndarray: Time factor between 0 and 1 for each duration
+    """
+    # np.interp clamps to the end values, which gives 0 for days <= 0
+    # and 1.0 for days >= 28, matching the scalar if/elif chain
+    return np.interp(np.asarray(days, dtype=float), TIME_FACTOR_DAYS, TIME_FACTOR_VALUES)
+
+def _full_conversion_yield_array(temperature=25, volume=1.0, constants=None):
+    """
+    Grams of CO2 per gram of sugar once the time factor reaches 100%.
+
+    Args:
+        temperature (array_like, optional): Average temperature in Celsius. Defaults to 25.
+        volume (array_like, optional): Volume of the batch in liters. Defaults to 1.0.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+
+    Returns:
+        numpy.ndarray: Full-conversion CO2 yield in grams per gram of sugar
+    """
+    if constants is None:
+        constants = DEFAULT_MODEL_CONSTANTS
+
+    temp_factor = 1.0 + (np.asarray(temperature, dtype=float) - 25) * constants.temp_coefficient
+
+    volume_factor = 1.0 - (0.05 * np.maximum(0, np.asarray(volume, dtype=float) - 2) / 10)
+    volume_factor = np.maximum(0.8, volume_factor)
+
+    return constants.max_co2_ratio * temp_factor * volume_factor
+
+def _co2_yield_array(days, temperature=25, volume=1.0, constants=None):
+    """
+    Grams of CO2 produced per gram of sugar under the production model.
+
+    calculate_co2_production is linear in sugar, so this factor is all that
+    is needed to evaluate the model forwards or to invert it exactly.
+
+    Args:
+        days (array_like): Number of days of fermentation
+        temperature (array_like, optional): Average temperature in Celsius. Defaults to 25.
+        volume (array_like, optional): Volume of the batch in liters. Defaults to 1.0.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+
+    Returns:
+        numpy.ndarray: CO2 yield in grams per gram of sugar
+    """
+    return _full_conversion_yield_array(temperature, volume, constants) * _time_factor_array(days)
+
+def calculate_co2_production_array(sugar_amount, days, temperature=25, volume=1.0, constants=None):
+    """
+    Vectorized version of calculate_co2_production.
+
+    All arguments may be NumPy arrays or scalars; they are broadcast against
+    each other and evaluated in a single pass.
+
+    Args:
+        sugar_amount (array_like): Amount of sugar in grams
+        days (array_like): Number of days of fermentation
+        temperature (array_like, optional): Average temperature in Celsius. Defaults to 25.
+        volume (array_like, optional): Volume of the batch in liters. Defaults to 1.0.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+
+    Returns:
+        numpy.ndarray: Estimated CO2 production in grams
+    """
+    return np.asarray(sugar_amount, dtype=float) * _co2_yield_array(days, temperature, volume, constants)
+
+def estimate_fermentation_completion_array(sugar_amount, co2_produced, constants=None):
+    """
+    Vectorized version of estimate_fermentation_completion.
+
+    Args:
+        sugar_amount (array_like): Initial sugar amount in grams
+        co2_produced (array_like): Estimated CO2 produced in grams
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+
+    Returns:
+        numpy.ndarray: Estimated completion percentage (0-100)
+    """
+    if constants is None:
+        constants = DEFAULT_MODEL_CONSTANTS
+
+    max_co2 = np.asarray(sugar_amount, dtype=float) * constants.max_co2_ratio
+    co2_produced = np.asarray(co2_produced, dtype=float)
+
+    # Divide only where there is sugar to convert; everything else is 0%
+    max_co2, co2_produced = np.broadcast_arrays(max_co2, co2_produced)
+    completion = np.zeros(max_co2.shape)
+    np.divide(co2_produced * 100, max_co2, out=completion, where=max_co2 > 0)
+
+    return np.minimum(100, completion)
+
+def estimate_co2_array(sugar_content, temp, time_in_days, constants=None):
+    """
+    Vectorized version of estimate_co2.
+
+    Args:
+        sugar_content (array_like): Amount of sugar in grams
+        temp (array_like): Temperature in Celsius
+        time_in_days (array_like): Fermentation time in days
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+
+    Returns:
+        numpy.ndarray: Estimated CO₂ pressure in atmospheres (atm)
+    """
+    if constants is None:
+        constants = DEFAULT_MODEL_CONSTANTS
+
+    sugar_content = np.maximum(0, np.asarray(sugar_content, dtype=float))
+
+    temp_factor = 1.0 + (np.asarray(temp, dtype=float) - 25) * constants.temp_coefficient
+    temp_factor = np.clip(temp_factor, 0.5, 2.0)
+
+    time_factor = _time_factor_array(time_in_days)
+
+    return sugar_content * temp_factor * time_factor * constants.sugar_to_pressure_factor
+
+def days_until_pressure_array(sugar_content, temp, pressure, time_in_days=0, constants=None):
+    """
+    Days until the estimate_co2 pressure reaches a threshold.
+
+    The pressure model is the piecewise-linear time factor scaled by sugar,
+    temperature and the pressure factor. The crossing is therefore found
+    exactly by interpolating the time factor's breakpoints the other way
+    round, without stepping through the days.
+
+    Args:
+        sugar_content (array_like): Amount of sugar in grams
+        temp (array_like): Temperature in Celsius
+        pressure (array_like): Threshold pressure in atm
+        time_in_days (array_like, optional): Days already fermented. Defaults to 0.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+
+    Returns:
+        numpy.ndarray: Days from time_in_days until the threshold is reached,
+        0 where it already is and inf where the model never reaches it
+    """
+    if constants is None:
+        constants = DEFAULT_MODEL_CONSTANTS
+
+    sugar_content = np.maximum(0, np.asarray(sugar_content, dtype=float))
+    pressure = np.asarray(pressure, dtype=float)
+
+    temp_factor = 1.0 + (np.asarray(temp, dtype=float) - 25) * constants.temp_coefficient
+    temp_factor = np.clip(temp_factor, 0.5, 2.0)
+
+    # Pressure once the time factor reaches 100%
+    plateau = sugar_content * temp_factor * constants.sugar_to_pressure_factor
+
+    plateau, pressure = np.broadcast_arrays(plateau, pressure)
+    required_factor = np.full(plateau.shape, np.inf)
+    np.divide(pressure, plateau, out=required_factor, where=plateau > 0)
+    required_factor[pressure <= 0] = 0.0
+
+    crossing_day = np.full(plateau.shape, np.inf)
+    reachable = required_factor <= TIME_FACTOR_VALUES[-1]
+    crossing_day[reachable] = np.interp(required_factor[reachable], TIME_FACTOR_VALUES, TIME_FACTOR_DAYS)
+
+    return np.maximum(0.0, crossing_day - np.maximum(0, np.asarray(time_in_days, dtype=float)))
+
+def estimate_co2_bands(sugar_content, temp, time_in_days, n_draws=10000, temp_sd=1.0,
+                       sugar_sd=0.05, percentiles=(5, 50, 95), thresholds=(), seed=None, constants=None,
+                       start_pressure=None):
+    """
+    Estimate percentile bands for CO₂ pressure by Monte Carlo simulation.
+
+    Each draw perturbs the temperature (normal, in °C) and the sugar content
+    (normal, as a fraction of sugar_content). It holds these for the whole
+    horizon and evaluates estimate_co2_array for every draw and day in one
+    vectorized pass.
+
+    Args:
+        sugar_content (float): Amount of sugar in grams
+        temp (float): Expected temperature in Celsius
+        time_in_days (array_like): Fermentation days to evaluate
+        n_draws (int, optional): Number of Monte Carlo draws. Defaults to 10000.
+        temp_sd (float, optional): Standard deviation of the temperature in °C. Defaults to 1.0.
+        sugar_sd (float, optional): Relative standard deviation of the sugar content. Defaults to 0.05.
+        percentiles (tuple, optional): Percentiles to report. Defaults to (5, 50, 95).
+        thresholds (tuple, optional): Pressures in atm for which to report
+            exceedance probabilities. Defaults to ().
+        seed (int, optional): Seed for the random generator. Defaults to None.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+        start_pressure (float, optional): Pressure on the first day, e.g.
+            accumulated over the recorded temperatures by CO2HistoryIntegrator.
+            Each draw then only simulates the increase from there. Defaults to
+            None (the model's pressure on the first day).
+
+    Returns:
+        dict: "days" (array of evaluated days), "bands" (percentile -> pressure
+        array in atm) and "exceedance" (threshold -> probability array of the
+        pressure being at or above the threshold on each day)
+    """
+    rng = np.random.default_rng(seed)
+    days = np.atleast_1d(np.asarray(time_in_days, dtype=float))
+
+    temps = temp + rng.normal(0.0, temp_sd, size=(n_draws, 1))
+    sugars = sugar_content * (1.0 + rng.normal(0.0, sugar_sd, size=(n_draws, 1)))
+
+    # Shape (n_draws, len(days))
+    pressures = estimate_co2_array(sugars, temps, days[np.newaxis, :], constants)
+    if start_pressure is not None:
+        pressures = start_pressure + (pressures - pressures[:, :1])
+
+    bands = np.percentile(pressures, percentiles, axis=0)
+
+    return {
+        "days": days,
+        "bands": dict(zip(percentiles, bands)),
+        "exceedance": {threshold: (pressures >= threshold).mean(axis=0) for threshold in thresholds}
+    }
+
+def integrate_co2_history(sugar_amount, days, temperatures, volume=1.0, constants=None, start_day=0):
+    """
+    Accumulate CO2 production over a recorded temperature series.
+
+    Each reading's temperature is taken as the average temperature over the
+    interval since the previous reading (or since start_day for the first
+    one). The CO2 produced in that interval is the increase in the time
+    factor at that temperature. With a constant temperature the result equals
+    calculate_co2_production.
+
+    Readings run along the last axis; leading axes (e.g. one row per vessel)
+    are broadcast against sugar_amount and volume.
+
+    Args:
+        sugar_amount (array_like): Amount of sugar in grams
+        days (array_like): Day of each reading since the start of fermentation, in ascending order
+        temperatures (array_like): Temperature in Celsius recorded at each reading
+        volume (array_like, optional): Volume of the batch in liters. Defaults to 1.0.
+        constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+        start_day (float, optional): Day the first interval starts on. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: Estimated CO2 production in grams from start_day to each reading
+    """
+    days, temperatures = np.broadcast_arrays(np.asarray(days, dtype=float), np.asarray(temperatures, dtype=float))
+    # Time factor at the start of the first interval, one per row
+    start_factor = _time_factor_array(np.full(days.shape[:-1] + (1,), start_day))
+    time_factor_gain = np.diff(_time_factor_array(days), axis=-1, prepend=start_factor)
+    interval_yield = _full_conversion_yield_array(temperatures, volume, constants) * time_factor_gain
+
+    return np.asarray(sugar_amount, dtype=float) * np.cumsum(interval_yield, axis=-1)
+
+class CO2HistoryIntegrator:
+    """
+    Incremental version of integrate_co2_history for a single batch.
+
+    Appending a reading only evaluates the interval since the previous one, so
+    the cost per reading is constant however long the batch has been running.
+    The estimate_co2 pressure is accumulated over the same intervals.
+
+    Attributes:
+        sugar_amount (float): Amount of sugar in grams
+        volume (float): Volume of the batch in liters
+        constants (ModelConstants): Model constants, or None for the defaults
+        co2_produced (float): Cumulative estimated CO2 production in grams
+        pressure (float): Cumulative estimated CO2 pressure in atm
+        last_day (float): Day of the most recent reading
+    """
+
+    def __init__(self, sugar_amount, volume=1.0, constants=None):
+        self.sugar_amount = sugar_amount
+        self.volume = volume
+        self.constants = constants
+        self.co2_produced = 0.0
+        self.pressure = 0.0
+        self.last_day = 0
+
+    def _check_day(self, day):
+        """Reject a day before the most recent reading."""
+        if day < self.last_day:
+            raise ValueError(f"Reading on day {day} is earlier than the last reading on day {self.last_day}")
+
+    def _interval_co2(self, day, temperature):
+        """Estimate CO2 produced between the last reading and day at temperature."""
+        self._check_day(day)
+        return (calculate_co2_production(self.sugar_amount, day, temperature, self.volume, self.constants)
+                - calculate_co2_production(self.sugar_amount, self.last_day, temperature, self.volume, self.constants))
+
+    def _interval_pressure(self, day, temperature):
+        """Estimate the pressure built up between the last reading and day at temperature."""
+        self._check_day(day)
+        return (estimate_co2(self.sugar_amount, temperature, day, self.constants)
+                - estimate_co2(self.sugar_amount, temperature, self.last_day, self.constants))
+
+    def add_reading(self, day, temperature):
+        """
+        Append a reading and update the cumulative CO2 estimate.
+
+        Args:
+            day (float): Day of the reading since the start of fermentation
+            temperature (float): Temperature in Celsius recorded at the reading
+
+        Returns:
+            float: Cumulative estimated CO2 production in grams
+        """
+        self.co2_produced += self._interval_co2(day, temperature)
+        self.pressure += self._interval_pressure(day, temperature)
+        self.last_day = day
+
+        return self.co2_produced
+
+    def estimate(self, day, temperature):
+        """
+        Project the cumulative CO2 estimate to a later day without recording it.
+
+        Args:
+            day (float): Day to project to
+            temperature (float): Expected temperature in Celsius until that day
+
+        Returns:
+            float: Projected cumulative CO2 production in grams
+        """
+        return self.co2_produced + self._interval_co2(day, temperature)
+
+    def estimate_pressure(self, day, temperature):
+        """
+        Project the cumulative pressure estimate to a later day without recording it.
+
+        Args:
+            day (float): Day to project to
+            temperature (float): Expected temperature in Celsius until that day
+
+        Returns:
+            float: Projected CO2 pressure in atm
+        """
+        return self.pressure + self._interval_pressure(day, temperature)
+
+    def add_measurements(self, measurements, start_date):
+        """
+        Append logged measurements that are at least as recent as the last reading.
+
+        Args:
+            measurements (list): Measurement dicts with "date" and "temperature" keys, oldest first
+            start_date (str): Start of fermentation as "YYYY-MM-DD"
+
+        Returns:
+            float: Cumulative estimated CO2 production in grams
+        """
+        start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+        for measurement in measurements:
+            day = (datetime.datetime.strptime(measurement["date"], "%Y-%m-%d") - start).days
+            self.add_reading(max(day, self.last_day), measurement["temperature"])
+
+        return self.co2_produced
+
+    @classmethod
+    def from_measurements(cls, sugar_amount, measurements, start_date, volume=1.0, phase=None, constants=None):
+        """
+        Build an integrator from a batch's logged measurements.
+
+        Args:
+            sugar_amount (float): Amount of sugar in grams
+            measurements (list): Measurement dicts with "date" and "temperature" keys
+            start_date (str): Start of fermentation as "YYYY-MM-DD"
+            volume (float, optional): Volume of the batch in liters. Defaults to 1.0.
+            phase (str, optional): Only use measurements from this phase. Defaults to None (all).
+            constants (ModelConstants, optional): Model constants. Defaults to DEFAULT_MODEL_CONSTANTS.
+
+        Returns:
+            CO2HistoryIntegrator: Integrator positioned at the latest measurement
+        """
+        integrator = cls(sugar_amount, volume, constants)
+        readings = [m for m in measurements if phase is None or m.get("phase") == phase]
+        integrator.add_measurements(sorted(readings, key=lambda m: m["date"]), start_date)
+        return integrator
+
 # Example usage if run directly
 if __name__ == "__main__":
     # Example: 200g sugar, 14 days fermentation at 25°C in a 2L batch
@@ -0,0 +1,301 @@
+"""
+Bulk Measurement Ingestion for the Kombucha Batch Logger
+
+Recording readings one at a time through the app or the REST API costs one
+storage write each. This module validates a whole file or request body of
+readings for many batches and stores them in a single write (see
+add_measurements in storage.py).
+
+Readings are NDJSON (one JSON object per line) or CSV with a header row.
+Each reading names its batch in a "batch" field; the other fields are the
+measurement as recorded by app.py (date, phase, temperature, ph, brix,
+scoby_thickness, taste, carbonation_level, bottle_firmness, co2_estimate,
+co2_pressure, completion). Any other field is rejected, and every reading
+needs a temperature. The date defaults to today and the phase to the
+batch's fermentation phase; dates in the future are rejected. Missing CO2 values of secondary readings are accumulated
+over the batch's storage temperatures recorded up to the reading's own date,
+as on the Secondary Fermentation tab (see pressure_history in
+alert_engine.py). Backfilled readings therefore get the CO2 values of the
+day they were taken, and earlier readings of the same upload count too.
+
+Either every reading is valid and all are stored, or nothing is stored and
+the errors are reported per reading.
+
+Usage:
+    python ingest.py readings.ndjson [more.csv ...]
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import csv
+import datetime
+import io
+import json
+import os
+import sys
+import time
+
+from alert_engine import days_bottled, pressure_history
+from co2_calculator import constants_for_batch, estimate_fermentation_completion
+from storage import open_store
+
+# Measurement fields that must be numbers
+NUMERIC_FIELDS = ("temperature", "ph", "brix", "co2_estimate", "co2_pressure", "completion", "scoby_thickness")
+
+# Measurement fields that must be text
+TEXT_FIELDS = ("taste", "carbonation_level", "bottle_firmness")
+
+# Every field a measurement can have
+MEASUREMENT_FIELDS = ("date", "phase") + NUMERIC_FIELDS + TEXT_FIELDS
+
+class IngestError(ValueError):
+    """
+    Raised when readings fail validation; nothing has been stored.
+
+    Attributes:
+        errors (list): (reading number from 1, message) pairs
+    """
+
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid readings")
+        self.errors = errors
+
+def parse_ndjson(text):
+    """
+    Parse NDJSON readings, skipping blank lines.
+
+    Args:
+        text (str): One JSON object per line
+
+    Returns:
+        list: Reading dictionaries
+    """
+    readings = []
+    errors = []
+
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            readings.append(json.loads(line))
+        except ValueError as e:
+            errors.append((number, f"Invalid JSON: {e}"))
+
+    if errors:
+        raise IngestError(errors)
+    return readings
+
+def parse_csv(text):
+    """
+    Parse CSV readings with a header row.
+
+    Empty cells are left out, and numeric columns are converted to numbers.
+
+    Args:
+        text (str): CSV text
+
+    Returns:
+        list: Reading dictionaries
+    """
+    readings = []
+    errors = []
+
+    for number, row in enumerate(csv.DictReader(io.StringIO(text)), start=1):
+        reading = {key: value for key, value in row.items() if key and value not in (None, "")}
+        try:
+            for field in NUMERIC_FIELDS:
+                if field in reading:
+                    reading[field] = float(reading[field])
+        except ValueError:
+            errors.append((number, f"{field} must be a number"))
+            continue
+        readings.append(reading)
+
+    if errors:
+        raise IngestError(errors)
+    return readings
+
+def parse_readings(text, fmt):
+    """
+    Parse readings in the given format.
+
+    Args:
+        text (str): File or request body
+        fmt (str): "ndjson" or "csv"
+
+    Returns:
+        list: Reading dictionaries
+    """
+    if fmt == "ndjson":
+        return parse_ndjson(text)
+    if fmt == "csv":
+        return parse_csv(text)
+
+    raise ValueError(f"Unknown readings format '{fmt}' (expected 'ndjson' or 'csv')")
+
+def build_measurement(batch, body, today=None):
+    """
+    Validate a measurement and fill in what the app would record.
+
+    Only the MEASUREMENT_FIELDS are accepted, and a temperature is required.
+    The date defaults to today and the phase to the batch's fermentation
+    phase. For secondary readings with a temperature, the CO2 estimate,
+    completion and pressure are filled in unless they were supplied. They
+    continue the batch's pressure history up to the measurement's date at
+    its temperature, as on the Secondary Fermentation tab.
+
+    Args:
+        batch (dict): Batch the measurement belongs to
+        body (dict): Measurement fields
+        today (datetime.datetime, optional): Current time. Defaults to now.
+
+    Returns:
+        dict: Measurement to store
+
+    Raises:
+        ValueError: If a field is missing, unknown or has the wrong type, or
+            the date is in the future
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Measurement must be a JSON object")
+    if today is None:
+        today = datetime.datetime.now()
+
+    unknown = sorted(set(body) - set(MEASUREMENT_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(map(str, unknown))}")
+    if "temperature" not in body:
+        raise ValueError("temperature is required")
+
+    measurement = dict(body)
+    measurement.setdefault("date", today.strftime("%Y-%m-%d"))
+    measurement.setdefault("phase", batch.get("fermentation_phase", "primary"))
+
+    try:
+        measured_on = datetime.datetime.strptime(measurement["date"], "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError("date must be formatted as YYYY-MM-DD")
+    if measured_on.date() > today.date():
+        raise ValueError("date must not be in the future")
+
+    if measurement["phase"] not in ("primary", "secondary"):
+        raise ValueError("phase must be 'primary' or 'secondary'")
+
+    for field in NUMERIC_FIELDS:
+        if field in measurement and (isinstance(measurement[field], bool) or not isinstance(measurement[field], (int, float))):
+            raise ValueError(f"{field} must be a number")
+    for field in TEXT_FIELDS:
+        if field in measurement and not isinstance(measurement[field], str):
+            raise ValueError(f"{field} must be a string")
+
+    if measurement["phase"] == "secondary" and "temperature" in measurement:
+        history = pressure_history(batch, until=measurement["date"])
+        day = max(days_bottled(batch, measured_on), history.last_day)
+
+        if "co2_estimate" not in measurement:
+            measurement["co2_estimate"] = history.estimate(day, measurement["temperature"])
+        if "completion" not in measurement:
+            measurement["completion"] = estimate_fermentation_completion(
+                sugar_amount=batch["sugar_content"],
+                co2_produced=measurement["co2_estimate"],
+                constants=constants_for_batch(batch)
+            )
+        if "co2_pressure" not in measurement:
+            measurement["co2_pressure"] = history.estimate_pressure(day, measurement["temperature"])
+
+    return measurement
+
+def ingest_readings(store, readings, today=None):
+    """
+    Validate readings and store them all in one write.
+
+    Args:
+        store (SQLiteStore or JSONFileStore): Batch storage
+        readings (list): Reading dictionaries, each with a "batch" field
+        today (datetime.datetime, optional): Current time, the date of
+            readings without one. Defaults to now.
+
+    Returns:
+        dict: "ingested" (number of readings), "batches" (number of batches),
+        "seconds" (time taken) and "readings_per_second"
+
+    Raises:
+        IngestError: If any reading is invalid; nothing is stored
+    """
+    started = time.perf_counter()
+
+    batches, _ = store.load()
+    batches_by_name = {batch["name"]: batch for batch in batches}
+
+    validated = []
+    errors = []
+    copied = set()
+
+    for number, reading in enumerate(readings, start=1):
+        if not isinstance(reading, dict):
+            errors.append((number, "Reading must be a JSON object"))
+            continue
+
+        fields = dict(reading)
+        batch = batches_by_name.get(fields.pop("batch", None))
+        if batch is None:
+            errors.append((number, f"No batch named '{reading.get('batch')}'"))
+            continue
+
+        try:
+            measurement = build_measurement(batch, fields, today)
+        except ValueError as e:
+            errors.append((number, str(e)))
+            continue
+        validated.append((batch["name"], measurement))
+
+        # Later readings of the batch continue from this one; the loaded batch is shared, so copy it first
+        if batch["name"] not in copied:
+            batch = batches_by_name[batch["name"]] = dict(batch, measurements=list(batch.get("measurements", [])))
+            copied.add(batch["name"])
+        batch["measurements"].append(measurement)
+
+    if errors:
+        raise IngestError(errors)
+
+    if validated:
+        store.add_measurements(validated)
+
+    seconds = time.perf_counter() - started
+
+    return {
+        "ingested": len(validated),
+        "batches": len({name for name, _ in validated}),
+        "seconds": seconds,
+        "readings_per_second": len(validated) / seconds if seconds > 0 else None
+    }
+
+# Ingest reading files if run directly
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python ingest.py readings.ndjson [more.csv ...]")
+        sys.exit(1)
+
+    store = open_store()
+    readings = []
+    for path in sys.argv[1:]:
+        with open(path, 'r', newline='') as f:
+            fmt = "csv" if os.path.splitext(path)[1].lower() == ".csv" else "ndjson"
+            try:
+                readings.extend(parse_readings(f.read(), fmt))
+            except IngestError as e:
+                for number, message in e.errors:
+                    print(f"{path}: reading {number}: {message}")
+                sys.exit(1)
+
+    try:
+        report = ingest_readings(store, readings)
+    except IngestError as e:
+        for number, message in e.errors:
+            print(f"Reading {number}: {message}")
+        print(f"Nothing was stored ({len(e.errors)} invalid readings)")
+        sys.exit(1)
+
+    print(f"Ingested {report['ingested']} readings for {report['batches']} batches "
+          f"in {report['seconds']:.3f}s ({report['readings_per_second'] or 0:.0f} readings/s)")
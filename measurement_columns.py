@@ -0,0 +1,391 @@
+"""
+Columnar Measurement Store for the Kombucha Batch Logger
+
+Measurements are stored as lists of dictionaries nested in each batch (see
+storage.py), so every chart and table used to rebuild a DataFrame from
+them. This module keeps a read-optimized copy of the measurement fields as
+one NumPy array per field, memory-mapped from .npy files:
+
+    date          datetime64[s]  (measurement dates as timestamps)
+    batch_id      int32          (index into the batch names)
+    phase         int8           (index into PHASES)
+    temperature, ph, brix, co2_estimate, co2_pressure, completion, scoby_thickness
+                  float64        (NaN where a measurement doesn't have the field)
+    taste, carbonation_level, bottle_firmness
+                  fixed-width unicode  (empty where a measurement doesn't have the field)
+
+Rows are sorted by batch and date, so a batch's history is a contiguous
+slice of every column. Reading it copies nothing, and the OS page cache is
+shared by every process that maps the same files.
+
+The arrays are derived from the storage backend and never written to
+directly. Each data version of the store (see version() in storage.py) is
+written once to its own directory, named after the store's path, the
+version and COLUMNS_FORMAT, and renamed into place atomically. A process
+whose mapped version is out of date maps the current directory, or builds
+it if no process has yet. Old versions are removed after a build;
+processes that still map them keep their view until they sync.
+
+A new version is built from the previous one: the store reports the
+batches and measurements added since (see measurements_since() in
+storage.py), and only the segments of the batches they belong to are
+rebuilt. Deleting batches, or replacing the store's files, causes a full
+rebuild.
+
+Usage:
+    python measurement_columns.py
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from storage import open_store
+
+# Directory holding one subdirectory of column files per data version.
+# Defaults to <data file>.columns next to the store's file.
+COLUMNS_DIR = os.environ.get("KOMBUCHA_COLUMNS_DIR")
+
+# Numeric measurement fields stored as float64 columns
+VALUE_COLUMNS = ("temperature", "ph", "brix", "co2_estimate", "co2_pressure", "completion", "scoby_thickness")
+
+# Text measurement fields stored as fixed-width unicode columns
+TEXT_COLUMNS = ("taste", "carbonation_level", "bottle_firmness")
+
+# Fermentation phases, in the order of their phase codes
+PHASES = ("primary", "secondary")
+
+# Bumped whenever the columns change, so files in an older layout are rebuilt
+COLUMNS_FORMAT = 3
+
+# Seconds after which an unfinished build directory is assumed abandoned
+STALE_BUILD_SECONDS = 3600
+
+def _dates(values):
+    """Convert YYYY-MM-DD strings to datetime64[s], with NaT for unparseable dates."""
+    try:
+        return np.array(values, dtype="datetime64[s]")
+    except (TypeError, ValueError):
+        converted = []
+        for value in values:
+            try:
+                converted.append(np.datetime64(value, "s"))
+            except (TypeError, ValueError):
+                converted.append(np.datetime64("NaT"))
+        return np.array(converted, dtype="datetime64[s]")
+
+def _measurement_columns(measurements, batch_ids):
+    """Turn measurement dictionaries and the ids of their batches into columns."""
+    columns = {
+        "date": _dates([m.get("date", "NaT") for m in measurements]),
+        "batch_id": np.array(batch_ids, dtype=np.int32),
+        "phase": np.array([PHASES.index(m["phase"]) if m.get("phase") in PHASES else 0 for m in measurements],
+                          dtype=np.int8)
+    }
+    for field in VALUE_COLUMNS:
+        columns[field] = np.array(
+            [m[field] if isinstance(m.get(field), (int, float)) and not isinstance(m.get(field), bool) else np.nan
+             for m in measurements],
+            dtype=np.float64
+        )
+    for field in TEXT_COLUMNS:
+        # Fixed width, so the files can be memory-mapped like the numeric ones
+        columns[field] = np.array([str(m.get(field) or "") for m in measurements], dtype=np.str_)
+
+    return columns
+
+def append_columns(columns, names, offsets, new_names, readings):
+    """
+    Add batches and measurements to existing columns.
+
+    Only the segments of the batches that get new measurements are rebuilt;
+    the rows of every other batch are copied as they are.
+
+    Args:
+        columns (dict): Field -> array, rows ordered by batch and date
+        names (list): Batch names by batch id
+        offsets (list): Batch i's rows are offsets[i]:offsets[i + 1]
+        new_names (list): Names of the batches to add
+        readings (list): (batch_name, measurement) pairs to add
+
+    Returns:
+        tuple: (columns, names, offsets) including the additions
+    """
+    names = list(names)
+    ids = {name: batch_id for batch_id, name in enumerate(names)}
+    for name in new_names:
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+
+    # Readings for a batch that no longer exists are dropped, as on load
+    rows = [(ids[name], m) for name, m in readings if name in ids]
+    rows.sort(key=lambda row: (row[0], str(row[1].get("date", ""))))
+    added = _measurement_columns([m for _, m in rows], [batch_id for batch_id, _ in rows])
+    affected, starts, counts = np.unique(added["batch_id"], return_index=True, return_counts=True)
+
+    sizes = np.zeros(len(names), dtype=np.int64)
+    sizes[:len(offsets) - 1] = np.diff(offsets)
+    pieces = {field: [] for field in added}
+    copied = 0
+    for batch_id, start, count in zip(affected.tolist(), starts.tolist(), counts.tolist()):
+        first, last = (offsets[batch_id], offsets[batch_id + 1]) if batch_id < len(offsets) - 1 else (offsets[-1],) * 2
+        segment = {field: added[field][start:start + count] for field in added}
+        if last > first:
+            # Merge with the batch's stored rows; on equal dates the stored ones stay first
+            segment = {field: np.concatenate([columns[field][first:last], values])
+                       for field, values in segment.items()}
+            order = np.argsort(segment["date"], kind="stable")
+            segment = {field: values[order] for field, values in segment.items()}
+
+        for field in pieces:
+            pieces[field].append(columns[field][copied:first])
+            pieces[field].append(segment[field])
+        copied = last
+        sizes[batch_id] += count
+
+    columns = {field: np.concatenate(pieces[field] + [columns[field][copied:]]) for field in pieces}
+    return columns, names, [0] + np.cumsum(sizes).tolist()
+
+def build_columns(names, readings):
+    """
+    Turn batches and their measurements into columns.
+
+    Args:
+        names (list): Batch names, in the order of their batch ids
+        readings (list): (batch_name, measurement) pairs
+
+    Returns:
+        tuple: (columns, names, offsets) where columns maps field -> array,
+        names lists the batch names by batch id, and batch i's rows are
+        offsets[i]:offsets[i + 1]
+    """
+    return append_columns(_measurement_columns([], []), [], [0], names, readings)
+
+def write_columns(columns, names, offsets, marker, directory):
+    """
+    Write columns to a new directory, atomically.
+
+    The files are written to a temporary directory next to it, which is then
+    renamed to directory. If another process wrote the same directory first,
+    its copy is kept.
+
+    Args:
+        columns (dict): Field -> array, as returned by build_columns()
+        names (list): Batch names by batch id
+        offsets (list): Batch i's rows are offsets[i]:offsets[i + 1]
+        marker (list): The store's measurements_since() marker for the columns
+        directory (str): Directory to create
+    """
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    building = tempfile.mkdtemp(prefix=".building-", dir=parent)
+    try:
+        for field, values in columns.items():
+            np.save(os.path.join(building, field + ".npy"), values)
+        with open(os.path.join(building, "batches.json"), 'w') as f:
+            json.dump({"names": names, "offsets": offsets, "marker": marker}, f)
+
+        try:
+            os.rename(building, directory)
+        except OSError:
+            # Another process finished the same version first
+            if not os.path.isdir(directory):
+                raise
+            shutil.rmtree(building, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+
+class MeasurementColumns:
+    """
+    Memory-mapped measurement columns kept in step with a store.
+
+    Every read first checks the store's data version and remaps (or builds)
+    the columns if they are out of date. The columns are read-only.
+
+    Attributes:
+        store (SQLiteStore or JSONFileStore): Storage the columns are derived from
+        directory (str): Directory holding the column files of each data version
+    """
+
+    def __init__(self, store=None, directory=COLUMNS_DIR):
+        self.store = store if store is not None else open_store()
+        self.directory = directory or os.path.splitext(self.store.path)[0] + ".columns"
+        # Keeps stores sharing a directory apart; the version identifies the data within a store
+        self._store_key = hashlib.sha1(os.path.abspath(self.store.path).encode()).hexdigest()[:8]
+        self._mapped = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"MeasurementColumns({os.path.abspath(self.directory)!r})"
+
+    def _version_dir(self, version):
+        """Directory of the column files of a data version."""
+        return os.path.join(self.directory, f"{self._store_key}-{version}.v{COLUMNS_FORMAT}")
+
+    def _read(self, path):
+        """Memory-map the column files in a directory."""
+        columns = {
+            field: np.load(os.path.join(path, field + ".npy"), mmap_mode='r')
+            for field in ("date", "batch_id", "phase") + VALUE_COLUMNS + TEXT_COLUMNS
+        }
+        with open(os.path.join(path, "batches.json"), 'r') as f:
+            index = json.load(f)
+        return columns, index["names"], index["offsets"], index["marker"]
+
+    def _map(self, version):
+        """Memory-map the column files of a data version."""
+        columns, names, offsets, marker = self._read(self._version_dir(version))
+        batches = {name: (offsets[i], offsets[i + 1]) for i, name in enumerate(names)}
+        return version, columns, names, batches, offsets, marker
+
+    def _previous(self):
+        """Return the columns, names, offsets and marker of an older version, or None if there is none."""
+        if self._mapped is not None:
+            _, columns, names, _, offsets, marker = self._mapped
+            return columns, names, offsets, marker
+
+        # Left by an earlier run of this or another process
+        prefix = self._store_key + "-"
+        suffix = f".v{COLUMNS_FORMAT}"
+        for entry in os.listdir(self.directory):
+            if entry.startswith(prefix) and entry.endswith(suffix):
+                try:
+                    return self._read(os.path.join(self.directory, entry))
+                except (OSError, ValueError, KeyError):
+                    continue
+        return None
+
+    def _build(self, version):
+        """Write the columns of a data version, from an older version where the store allows it."""
+        previous = self._previous()
+        marker, reset, names, readings = self.store.measurements_since(previous[3] if previous else None)
+        if reset:
+            columns, names, offsets = build_columns(names, readings)
+        else:
+            columns, names, offsets = append_columns(previous[0], previous[1], previous[2], names, readings)
+        write_columns(columns, names, offsets, marker, self._version_dir(version))
+
+    def _remove_old_versions(self, current):
+        """Delete this store's column files of other data versions, best effort."""
+        now = time.time()
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            if path == self._version_dir(current):
+                continue
+            if entry.startswith(".building-"):
+                try:
+                    if now - os.path.getmtime(path) < STALE_BUILD_SECONDS:
+                        continue
+                except OSError:
+                    continue
+            elif not entry.startswith(self._store_key + "-"):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+    def sync(self):
+        """
+        Map the columns of the store's current data version, building them if needed.
+
+        Returns:
+            str: The data version now mapped
+        """
+        version = self.store.version()
+        mapped = self._mapped
+        if mapped is not None and mapped[0] == version:
+            return version
+
+        with self._lock:
+            if self._mapped is not None and self._mapped[0] == version:
+                return version
+
+            try:
+                mapped = self._map(version)
+            except (OSError, ValueError, KeyError):
+                # Not built yet, or removed by a newer build mid-read
+                os.makedirs(self.directory, exist_ok=True)
+                self._build(version)
+                self._remove_old_versions(version)
+                mapped = self._map(version)
+
+            self._mapped = mapped
+        return version
+
+    def columns(self):
+        """
+        Return every column of every batch.
+
+        Returns:
+            dict: Field -> read-only array, rows ordered by batch and date
+        """
+        self.sync()
+        return dict(self._mapped[1])
+
+    def batch_names(self):
+        """
+        Return the batch names, indexed by the batch_id column.
+
+        Returns:
+            list: Batch names
+        """
+        self.sync()
+        return list(self._mapped[2])
+
+    def batch(self, name):
+        """
+        Return a batch's measurement history as views into the columns.
+
+        Args:
+            name (str): Batch name
+
+        Returns:
+            dict: Field -> read-only array of the batch's rows, oldest first;
+            empty arrays for a batch without measurements
+
+        Raises:
+            KeyError: If there is no batch with that name
+        """
+        self.sync()
+        _, columns, _, batches, _, _ = self._mapped
+        if name not in batches:
+            raise KeyError(f"No batch named '{name}'")
+
+        start, stop = batches[name]
+        return {field: values[start:stop] for field, values in columns.items()}
+
+    def frame(self, name):
+        """
+        Return a batch's measurement history as a DataFrame for charts and tables.
+
+        Args:
+            name (str): Batch name
+
+        Returns:
+            pandas.DataFrame: "date", "phase" and the measurement fields,
+            oldest first; missing values are NaN or None
+        """
+        history = self.batch(name)
+        data = {"date": history["date"], "phase": np.array(PHASES)[history["phase"]]}
+        data.update((field, history[field]) for field in VALUE_COLUMNS)
+        data.update((field, np.where(history[field] == "", None, history[field])) for field in TEXT_COLUMNS)
+        return pd.DataFrame(data, copy=False)
+
+# Build the columns for the configured store if run directly
+if __name__ == "__main__":
+    started = time.perf_counter()
+    measurement_columns = MeasurementColumns()
+    version = measurement_columns.sync()
+    rows = len(measurement_columns.columns()["date"])
+    print(f"{rows} measurements of {len(measurement_columns.batch_names())} batches in "
+          f"{measurement_columns.directory} (version {version}, {time.perf_counter() - started:.3f}s)")
@@ -0,0 +1,166 @@
+"""
+Memoized CO2 Model Evaluation for Kombucha Fermentation
+
+Streamlit reruns app.py on every widget interaction. Each rerun evaluates the
+CO2 models again with the same arguments for the selected batch, the pressure
+gauge and the prediction chart. This module keeps a bounded, process-wide LRU
+cache in front of the co2_calculator functions, so a repeated evaluation costs
+a dictionary lookup.
+
+The cache is shared by every session in the process. Its size can be changed
+at runtime, and it counts hits and misses.
+
+Key functions:
+- calculate_co2_production: Cached co2_calculator.calculate_co2_production
+- estimate_fermentation_completion: Cached co2_calculator.estimate_fermentation_completion
+- estimate_co2: Cached co2_calculator.estimate_co2
+- configure_cache: Change the maximum number of cached results
+- cache_info: Report hit/miss counters and current size
+- clear_cache: Drop all cached results and reset the counters
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import functools
+import inspect
+import os
+import threading
+from collections import OrderedDict
+
+import co2_calculator
+
+# Default number of cached results, overridable through the environment
+DEFAULT_CACHE_SIZE = int(os.environ.get("KOMBUCHA_MODEL_CACHE_SIZE", 4096))
+
+class ModelCache:
+    """
+    Thread-safe LRU cache for model evaluations.
+
+    Attributes:
+        maxsize (int): Maximum number of cached results
+        hits (int): Number of lookups answered from the cache
+        misses (int): Number of lookups that had to evaluate the model
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def memoize(self, func):
+        """
+        Wrap a model function so that its results are cached.
+
+        Arguments are normalized through the function signature, so positional
+        and keyword calls share cache entries. Calls with unhashable arguments
+        (e.g. NumPy arrays) bypass the cache.
+
+        Args:
+            func (callable): Model function to wrap
+
+        Returns:
+            callable: Cached version of func
+        """
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (func.__name__,) + tuple(bound.arguments.values())
+
+            try:
+                hash(key)
+            except TypeError:
+                return func(*args, **kwargs)
+
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                self.misses += 1
+
+            result = func(*args, **kwargs)
+
+            with self._lock:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                self._evict()
+
+            return result
+
+        return wrapper
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits maxsize."""
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def resize(self, maxsize):
+        """
+        Change the maximum number of cached results.
+
+        Args:
+            maxsize (int): New maximum size; 0 disables caching
+        """
+        if maxsize < 0:
+            raise ValueError("Cache size must be zero or positive")
+
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """Drop all cached results and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        Report the cache statistics.
+
+        Returns:
+            dict: hits, misses, current size and maxsize
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize
+            }
+
+# Process-wide cache shared by all sessions
+MODEL_CACHE = ModelCache()
+
+calculate_co2_production = MODEL_CACHE.memoize(co2_calculator.calculate_co2_production)
+estimate_fermentation_completion = MODEL_CACHE.memoize(co2_calculator.estimate_fermentation_completion)
+estimate_co2 = MODEL_CACHE.memoize(co2_calculator.estimate_co2)
+
+def configure_cache(maxsize):
+    """
+    Change the maximum number of cached model results.
+
+    Args:
+        maxsize (int): New maximum size; 0 disables caching
+    """
+    MODEL_CACHE.resize(maxsize)
+
+def cache_info():
+    """
+    Report the model cache statistics.
+
+    Returns:
+        dict: hits, misses, current size and maxsize
+    """
+    return MODEL_CACHE.info()
+
+def clear_cache():
+    """Drop all cached model results and reset the counters."""
+    MODEL_CACHE.clear()
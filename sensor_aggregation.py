@@ -0,0 +1,307 @@
+"""
+Downsampling of Sensor Streams for Kombucha Monitoring
+
+Sampling every vessel once a second produces far more readings than are
+worth storing or charting. This module rolls raw samples up into fixed time
+buckets (per minute and per hour by default) holding the count, minimum,
+mean and maximum of each channel. Only the closed buckets are persisted
+(see add_sensor_aggregates in storage.py). The raw samples stay in the
+sampler's bounded ring buffers (see sensors.SensorSampler), so storage grows
+with elapsed time, not with the sampling rate.
+
+Buckets are aligned to multiples of their length since the epoch, so every
+process produces the same bucket boundaries. A bucket closes when the first
+sample of a later bucket arrives. Samples must arrive in time order per
+channel; a late sample is counted in the bucket that is still open.
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import os
+import threading
+
+import numpy as np
+
+# Bucket lengths in seconds to aggregate into
+AGGREGATE_RESOLUTIONS = tuple(
+    int(seconds) for seconds in os.environ.get("KOMBUCHA_AGGREGATE_RESOLUTIONS", "60,3600").split(",")
+)
+
+# Closed buckets kept in memory per channel and resolution
+AGGREGATE_CAPACITY = int(os.environ.get("KOMBUCHA_AGGREGATE_CAPACITY", 1440))
+
+# Names accepted for the default resolutions
+RESOLUTION_NAMES = {"minute": 60, "hour": 3600}
+
+class BucketSeries:
+    """
+    Min/mean/max buckets of one channel at one resolution.
+
+    Closed buckets are kept in fixed-size NumPy arrays used as a ring, so
+    memory stays constant however long the series runs. The open bucket is
+    kept in plain attributes until it closes.
+
+    Attributes:
+        seconds (int): Bucket length in seconds
+        capacity (int): Closed buckets kept
+    """
+
+    def __init__(self, seconds, capacity=AGGREGATE_CAPACITY):
+        self.seconds = seconds
+        self.capacity = capacity
+        self._starts = np.zeros(capacity)
+        self._counts = np.zeros(capacity, dtype=np.int64)
+        self._mins = np.zeros(capacity)
+        self._means = np.zeros(capacity)
+        self._maxs = np.zeros(capacity)
+        self._next = 0
+        self._closed = 0
+        self._open = None
+
+    def __len__(self):
+        return self._closed
+
+    def _close(self):
+        """Move the open bucket into the ring and return it as a dict."""
+        start, count, total, low, high = self._open
+        self._open = None
+
+        index = self._next
+        self._starts[index] = start
+        self._counts[index] = count
+        self._mins[index] = low
+        self._means[index] = total / count
+        self._maxs[index] = high
+        self._next = (index + 1) % self.capacity
+        self._closed = min(self._closed + 1, self.capacity)
+
+        return {"resolution": self.seconds, "start": start, "count": count, "min": low,
+                "mean": total / count, "max": high}
+
+    def add(self, timestamp, value):
+        """
+        Add one sample.
+
+        Args:
+            timestamp (float): Time of the sample in seconds since the epoch
+            value (float): Sample value
+
+        Returns:
+            list: Buckets closed by this sample (empty or one dict)
+        """
+        start = timestamp - timestamp % self.seconds
+        closed = []
+
+        if self._open is not None and start > self._open[0]:
+            closed.append(self._close())
+
+        if self._open is None:
+            self._open = [start, 1, value, value, value]
+        else:
+            bucket = self._open
+            bucket[1] += 1
+            bucket[2] += value
+            bucket[3] = min(bucket[3], value)
+            bucket[4] = max(bucket[4], value)
+
+        return closed
+
+    def add_many(self, timestamps, values):
+        """
+        Add many samples at once, in time order.
+
+        Args:
+            timestamps (numpy.ndarray): Sample times in seconds since the epoch
+            values (numpy.ndarray): Sample values
+
+        Returns:
+            list: Buckets closed by these samples, oldest first
+        """
+        timestamps = np.asarray(timestamps, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if len(timestamps) == 0:
+            return []
+
+        starts = timestamps - timestamps % self.seconds
+        # Late samples belong to the bucket that is still open
+        if self._open is not None:
+            starts = np.maximum(starts, self._open[0])
+
+        # Samples are in time order, so each bucket is one contiguous run
+        first = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        counts = np.diff(np.r_[first, len(values)])
+        totals = np.add.reduceat(values, first)
+        lows = np.minimum.reduceat(values, first)
+        highs = np.maximum.reduceat(values, first)
+
+        closed = []
+        for start, count, total, low, high in zip(starts[first].tolist(), counts.tolist(), totals.tolist(),
+                                                  lows.tolist(), highs.tolist()):
+            if self._open is not None and start == self._open[0]:
+                bucket = self._open
+                bucket[1] += count
+                bucket[2] += total
+                bucket[3] = min(bucket[3], low)
+                bucket[4] = max(bucket[4], high)
+                continue
+
+            if self._open is not None:
+                closed.append(self._close())
+            self._open = [start, count, total, low, high]
+
+        return closed
+
+    def close(self):
+        """
+        Close the open bucket early, e.g. when sampling stops.
+
+        Returns:
+            list: The closed bucket, if one was open
+        """
+        return [self._close()] if self._open is not None else []
+
+    def buckets(self, since=None):
+        """
+        Return the closed buckets in memory, oldest first.
+
+        Args:
+            since (float, optional): Only buckets starting at or after this time
+
+        Returns:
+            dict: "start", "count", "min", "mean" and "max" as new NumPy arrays
+        """
+        order = (np.arange(self._closed) + (self._next - self._closed)) % self.capacity
+        if since is not None:
+            order = order[self._starts[order] >= since]
+
+        return {
+            "start": self._starts[order],
+            "count": self._counts[order],
+            "min": self._mins[order],
+            "mean": self._means[order],
+            "max": self._maxs[order]
+        }
+
+class SensorAggregator:
+    """
+    Rolls raw sensor samples of many channels into buckets and persists them.
+
+    Closed buckets are queued and handed to sink in one call per flush(), so
+    a sampling sweep costs at most one storage write. If the sink fails, the
+    buckets stay queued for the next flush.
+
+    Attributes:
+        resolutions (tuple): Bucket lengths in seconds
+        capacity (int): Closed buckets kept in memory per channel and resolution
+        sink (callable): Called with a list of bucket dicts to persist them,
+            e.g. a store's add_sensor_aggregates
+    """
+
+    def __init__(self, resolutions=AGGREGATE_RESOLUTIONS, capacity=AGGREGATE_CAPACITY, sink=None):
+        self.resolutions = tuple(resolutions)
+        self.capacity = capacity
+        self.sink = sink
+        self._series = {}
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def _channel_series(self, channel):
+        """The BucketSeries of a channel, one per resolution, created on first use."""
+        series = self._series.get(channel)
+        if series is None:
+            series = self._series[channel] = [BucketSeries(seconds, self.capacity) for seconds in self.resolutions]
+        return series
+
+    def _queue(self, channel, closed):
+        """Queue closed buckets of a channel for the sink."""
+        for bucket in closed:
+            bucket["channel"] = channel
+            self._pending.append(bucket)
+
+    def add(self, channel, timestamp, value):
+        """
+        Add one sample of a channel.
+
+        Args:
+            channel (str): Channel name
+            timestamp (float): Time of the sample in seconds since the epoch
+            value (float): Sample value
+        """
+        with self._lock:
+            for series in self._channel_series(channel):
+                self._queue(channel, series.add(timestamp, value))
+
+    def add_record(self, timestamp, values):
+        """
+        Add one sample of several channels, e.g. a TraceReplay record.
+
+        Args:
+            timestamp (float): Time of the samples in seconds since the epoch
+            values (dict): Channel name -> sample value
+        """
+        for channel, value in values.items():
+            self.add(channel, timestamp, value)
+
+    def add_many(self, channel, timestamps, values):
+        """
+        Add many samples of a channel at once, in time order.
+
+        Args:
+            channel (str): Channel name
+            timestamps (numpy.ndarray): Sample times in seconds since the epoch
+            values (numpy.ndarray): Sample values
+        """
+        with self._lock:
+            for series in self._channel_series(channel):
+                self._queue(channel, series.add_many(timestamps, values))
+
+    def close(self):
+        """Close every open bucket, so the partial buckets are persisted on the next flush."""
+        with self._lock:
+            for channel, channel_series in self._series.items():
+                for series in channel_series:
+                    self._queue(channel, series.close())
+
+    def flush(self):
+        """
+        Hand the queued closed buckets to the sink.
+
+        Returns:
+            int: Number of buckets persisted
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        if not pending or self.sink is None:
+            return 0
+
+        try:
+            self.sink(pending)
+        except Exception as e:
+            print(f"Error storing sensor aggregates: {e}")
+            with self._lock:
+                self._pending[:0] = pending
+            return 0
+
+        return len(pending)
+
+    def buckets(self, channel, resolution, since=None):
+        """
+        Return a channel's closed buckets in memory.
+
+        Args:
+            channel (str): Channel name
+            resolution (int): Bucket length in seconds
+            since (float, optional): Only buckets starting at or after this time
+
+        Returns:
+            dict: "start", "count", "min", "mean" and "max" NumPy arrays, oldest
+            first; empty arrays for unknown channels or resolutions
+        """
+        with self._lock:
+            for series in self._series.get(channel, ()):
+                if series.seconds == resolution:
+                    return series.buckets(since)
+
+        return {field: np.zeros(0) for field in ("start", "count", "min", "mean", "max")}
@@ -0,0 +1,291 @@
+"""
+Sensor Calibration for Kombucha Monitoring
+
+The pH and CO2 sensors output a voltage that has to be converted to a
+reading, and every probe is a little different. This module loads
+multi-point calibrations for each sensor from SENSOR_CALIBRATION_FILE and
+compiles each one into a lookup table when it is loaded, so converting a
+reading costs one table lookup instead of a curve evaluation.
+
+The file maps sensor names to their calibration points as (raw, true) pairs:
+
+    {
+        "ph": {"points": [[2.86, 4.0], [2.5, 7.0], [2.14, 10.0]]},
+        "co2": {"points": [[0.4, 400], [1.0, 1000], [2.0, 5000]], "interpolation": "log"},
+        "temperature:28-0316a2794fff": {"points": [[0.0, 0.3], [100.0, 99.6]]}
+    }
+
+The sensor names are "ph" and "co2", which take the ADC voltage, and
+"temperature:<probe id>" for each DS18B20 probe (the "28-..." folder name
+under /sys/bus/w1/devices/), which takes the probe's reading in °C. A
+probe is keyed by its id, not by the "temperature:<batch name>" sampler
+channel it is read through, so the calibration stays with the probe when
+it moves to another batch. Two points give a
+straight line, and more points a piecewise-linear curve (e.g. a 3-point pH
+calibration with separate acid and base slopes). With "interpolation": "log"
+the curve is interpolated in log space instead, for sensors with an
+exponential response. Beyond the outer points the end segments are
+extended, up to the edges of the sensor's input range.
+
+The file is checked for changes every CALIBRATION_CHECK_INTERVAL seconds and
+reloaded when it has changed, so recalibrating a probe takes effect without
+restarting the sampler. A file that fails to load leaves the previous
+calibrations in place.
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+SENSOR_CALIBRATION_FILE = os.environ.get("KOMBUCHA_SENSOR_CALIBRATION", "sensor_calibration.json")
+
+# Seconds between checks of the calibration file for changes
+CALIBRATION_CHECK_INTERVAL = float(os.environ.get("KOMBUCHA_SENSOR_CALIBRATION_CHECK", 2.0))
+
+# Entries in each compiled lookup table
+CALIBRATION_TABLE_SIZE = 4096
+
+# Raw input range covered by the tables of each kind of sensor; ADC voltages
+# for pH and CO2, °C for temperature probes
+DEFAULT_INPUT_RANGES = {
+    "ph": (0.0, 5.0),
+    "co2": (0.0, 5.0),
+    "temperature": (-20.0, 100.0)
+}
+
+def _extend_linear(x, xp, fp):
+    """Piecewise-linear interpolation that extends the end segments beyond the points."""
+    y = np.interp(x, xp, fp)
+
+    below = x < xp[0]
+    y[below] = fp[0] + (x[below] - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0])
+
+    above = x > xp[-1]
+    y[above] = fp[-1] + (x[above] - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+
+    return y
+
+class CalibrationTable:
+    """
+    A sensor calibration compiled into a lookup table.
+
+    The curve through the calibration points is evaluated once at
+    CALIBRATION_TABLE_SIZE evenly spaced inputs over input_range. A reading
+    is converted by indexing into the table and interpolating between the
+    two neighbouring entries. Inputs outside the range are clamped to it.
+
+    Attributes:
+        points (list): (raw, true) calibration points, sorted by raw value
+        interpolation (str): "linear" or "log"
+        input_range (tuple): (low, high) raw values covered by the table
+    """
+
+    def __init__(self, points, interpolation="linear", input_range=(0.0, 5.0), size=CALIBRATION_TABLE_SIZE):
+        points = sorted((float(raw), float(value)) for raw, value in points)
+        raws = np.array([raw for raw, _ in points])
+        values = np.array([value for _, value in points])
+
+        if len(points) < 2:
+            raise ValueError("a calibration needs at least 2 points")
+        if np.any(np.diff(raws) == 0):
+            raise ValueError("calibration points must have distinct raw values")
+        if interpolation not in ("linear", "log"):
+            raise ValueError(f"unknown interpolation '{interpolation}' (expected 'linear' or 'log')")
+        if interpolation == "log" and np.any(values <= 0):
+            raise ValueError("log interpolation needs positive calibrated values")
+
+        low, high = float(input_range[0]), float(input_range[1])
+        if not high > low:
+            raise ValueError("input range must be (low, high) with low < high")
+
+        self.points = points
+        self.interpolation = interpolation
+        self.input_range = (low, high)
+
+        grid = np.linspace(low, high, size)
+        if interpolation == "log":
+            table = np.exp(_extend_linear(grid, raws, np.log(values)))
+        else:
+            table = _extend_linear(grid, raws, values)
+
+        self._low = low
+        self._scale = (size - 1) / (high - low)
+        self._last = size - 2
+        self._table = table
+        # Plain floats make single lookups cheaper than indexing the array
+        self._values = table.tolist()
+
+    def __call__(self, raw):
+        """
+        Convert one raw reading.
+
+        Args:
+            raw (float): Raw sensor reading
+
+        Returns:
+            float: Calibrated reading
+        """
+        position = (raw - self._low) * self._scale
+        if position <= 0:
+            return self._values[0]
+
+        index = int(position)
+        if index > self._last:
+            return self._values[-1]
+
+        below = self._values[index]
+        return below + (self._values[index + 1] - below) * (position - index)
+
+    def convert_array(self, raw):
+        """
+        Convert many raw readings at once.
+
+        Args:
+            raw (numpy.ndarray): Raw sensor readings
+
+        Returns:
+            numpy.ndarray: Calibrated readings
+        """
+        positions = np.clip((np.asarray(raw, dtype=float) - self._low) * self._scale, 0, len(self._table) - 1)
+        return np.interp(positions, np.arange(len(self._table)), self._table)
+
+def compile_calibrations(data):
+    """
+    Compile the calibrations of a calibration file.
+
+    Args:
+        data (dict): Sensor name -> {"points", optional "interpolation" and "range"}
+
+    Returns:
+        dict: Sensor name -> CalibrationTable
+
+    Raises:
+        ValueError: If a calibration is invalid
+    """
+    tables = {}
+
+    for sensor, calibration in data.items():
+        kind = sensor.split(":", 1)[0]
+        try:
+            tables[sensor] = CalibrationTable(
+                calibration["points"],
+                interpolation=calibration.get("interpolation", "linear"),
+                input_range=calibration.get("range", DEFAULT_INPUT_RANGES.get(kind, (0.0, 5.0)))
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid calibration for '{sensor}': {e}")
+
+    return tables
+
+class SensorCalibrations:
+    """
+    The compiled calibrations of a calibration file, reloaded when it changes.
+
+    The file is read on first use. After that, lookups check whether the file
+    has changed at most every check_interval seconds.
+
+    Attributes:
+        path (str): Path to the calibration JSON file
+        check_interval (float): Seconds between checks for changes
+    """
+
+    def __init__(self, path=SENSOR_CALIBRATION_FILE, check_interval=CALIBRATION_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._tables = {}
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _file_signature(self):
+        """(mtime, size) of the calibration file, or None if it doesn't exist."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self):
+        """
+        Reload the calibration file if it has changed.
+
+        Returns:
+            bool: True if the calibrations were reloaded
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._file_signature()
+            if signature == self._signature:
+                return False
+
+            if signature is None:
+                tables = {}
+            else:
+                try:
+                    with open(self.path, 'r') as f:
+                        tables = compile_calibrations(json.load(f))
+                except Exception as e:
+                    # Keep the previous calibrations, and retry once the file changes again
+                    print(f"Error loading sensor calibration {self.path}: {e}")
+                    self._signature = signature
+                    return False
+
+            self._tables = tables
+            self._signature = signature
+            print(f"Loaded {len(tables)} sensor calibrations from {self.path}")
+            return True
+
+    def table(self, sensor):
+        """
+        Return a sensor's compiled calibration.
+
+        Args:
+            sensor (str): Sensor name, e.g. "ph" or "temperature:<probe id>"
+
+        Returns:
+            CalibrationTable: The calibration, or None if the sensor isn't calibrated
+        """
+        checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at >= self.check_interval:
+            self.reload()
+        return self._tables.get(sensor)
+
+    def convert(self, sensor, raw):
+        """
+        Calibrate a raw reading, or pass it through if the sensor isn't calibrated.
+
+        Args:
+            sensor (str): Sensor name
+            raw (float): Raw sensor reading
+
+        Returns:
+            float: Calibrated reading
+        """
+        table = self.table(sensor)
+        if table is None or raw is None:
+            return raw
+        return table(raw)
+
+# Calibrations used by sensors.py
+SENSOR_CALIBRATIONS = SensorCalibrations()
+
+# Print what a calibration converts readings to if run directly
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python sensor_calibration.py <sensor> <raw reading> [...]")
+        sys.exit(1)
+
+    table = SENSOR_CALIBRATIONS.table(sys.argv[1])
+    if table is None:
+        print(f"No calibration for '{sys.argv[1]}' in {SENSOR_CALIBRATIONS.path}")
+        sys.exit(1)
+
+    for raw in sys.argv[2:]:
+        print(f"{raw} -> {table(float(raw)):.4g}")
@@ -6,94 +6,328 @@ sensor readings when hardware is not available. It supports temperature, pH,
 and CO2 sensors that can be connected to a Raspberry Pi.
 
 The module automatically detects whether hardware sensors are available and
-falls back to simulation when they are not.
+falls back to simulation when they are not. Detection and bus setup happen on
+the first real read (see HardwareBackend). NumPy, the CO2 model and the
+sensor calibrations are imported by the functions that use them, and the
+read threads and an environment-configured replay are started on first use,
+so importing the module is cheap. Alternatively, recorded sensor traces can
+be replayed in place of the hardware (see TraceReplay).
 
 Key functions:
 - get_temperature: Reads temperature from DS18B20 sensor or simulates it
+- get_batch_temperatures: Reads the DS18B20 probe assigned to each batch
 - get_ph: Reads pH from pH sensor module or simulates it
 - get_co2_level: Reads CO2 level from CO2 sensor or simulates it
+- get_analog_readings: Reads pH and CO2 together from the ADC
+- read_temperature/read_temperatures/read_batch_temperatures/read_analog:
+  asyncio versions that overlap slow reads in threads, with a timeout per
+  sensor; every file, sysfs or bus access runs in a thread, never on the loop
 - simulate_temperature/ph/co2: Generate realistic simulated sensor values
+- SensorSimulator: Seedable, vectorized simulation of many vessels' sensor series
+- TraceReplay / start_replay: Replay recorded CSV or JSONL sensor traces in
+  real time or faster
+- SensorSampler: Polls all sensors in a background thread and keeps recent
+  samples in memory, so readers never wait on the hardware
 
 Author: Deen
 Email: deen.htc@gmail.com
 """
 
+import asyncio
+import csv
+import datetime
+import json
 import random
+import threading
+import sys
 import time
 import os
-
-# Check if running on a Raspberry Pi
-try:
-    import RPi.GPIO as GPIO
-    import board
-    import busio
-    import adafruit_ads1x15.ads1115 as ADS
-    from adafruit_ads1x15.analog_in import AnalogIn
-    
-    # Flag to indicate if we're running on a Raspberry Pi with sensors
-    HARDWARE_AVAILABLE = True
-except ImportError:
-    # Not running on a Raspberry Pi or missing required libraries
-    HARDWARE_AVAILABLE = False
+from concurrent.futures import ThreadPoolExecutor
 
 # Global variables for sensor configuration
 TEMP_SENSOR_PIN = 4  # GPIO pin for DS18B20 temperature sensor
 PH_SENSOR_CHANNEL = 0  # ADS1115 channel for pH sensor
 CO2_SENSOR_CHANNEL = 1  # ADS1115 channel for CO2 sensor
+ADC_DATA_RATE = int(os.environ.get("KOMBUCHA_ADC_DATA_RATE", 860))  # ADS1115 samples per second (8-860)
+
+# DS18B20 probes: 1-Wire device directory, seconds between rescans of the bus,
+# and the file mapping probe ids to batch names
+W1_DEVICES_DIR = '/sys/bus/w1/devices/'
+PROBE_REFRESH_INTERVAL = float(os.environ.get("KOMBUCHA_PROBE_REFRESH_INTERVAL", 300))
+PROBE_MAP_FILE = os.environ.get("KOMBUCHA_PROBE_MAP", "probe_map.json")
+
+# Async reads: seconds before a sensor read is given up, and threads that run
+# blocking reads concurrently
+SENSOR_READ_TIMEOUT = float(os.environ.get("KOMBUCHA_SENSOR_READ_TIMEOUT", 2.0))
+SENSOR_READ_WORKERS = int(os.environ.get("KOMBUCHA_SENSOR_READ_WORKERS", 32))
+
+# Replay a recorded sensor trace instead of reading the hardware, and how
+# many times faster than real time to play it
+SENSOR_REPLAY_FILE = os.environ.get("KOMBUCHA_SENSOR_REPLAY")
+REPLAY_SPEED = float(os.environ.get("KOMBUCHA_REPLAY_SPEED", 1.0))
+
+# Active TraceReplay, if any (see start_replay)
+REPLAY = None
+
+# Whether SENSOR_REPLAY_FILE still has to be started, on the first sensor read
+_env_replay_pending = bool(SENSOR_REPLAY_FILE)
+_replay_lock = threading.Lock()
+
+# Background sampling: seconds between polls and samples kept per channel
+SAMPLE_INTERVAL = float(os.environ.get("KOMBUCHA_SAMPLE_INTERVAL", 5.0))
+SAMPLE_BUFFER_SIZE = int(os.environ.get("KOMBUCHA_SAMPLE_BUFFER_SIZE", 720))
+
+# Simulated vessels: °C above and below the storage temperature over a day
+DAILY_TEMPERATURE_SWING = 1.0
+
+# Serializes access to the ADS1115; switching channels reconfigures the chip
+adc_lock = threading.Lock()
+
+class HardwareBackend:
+    """
+    The Raspberry Pi sensor hardware, set up on first use.
+
+    Nothing is imported or opened until a sensor is actually read. The first
+    check of available imports the Raspberry Pi libraries, sets up GPIO and
+    the I2C bus, and remembers whether that worked, so processes that only
+    simulate never pay for it.
+
+    Attributes:
+        ph_channel (AnalogIn): ADS1115 channel of the pH sensor
+        co2_channel (AnalogIn): ADS1115 channel of the CO2 sensor
+    """
+
+    def __init__(self):
+        self.ph_channel = None
+        self.co2_channel = None
+        self._available = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        """True if the sensor hardware is present and set up."""
+        if self._available is None:
+            self._initialize()
+        return self._available
+
+    def _initialize(self):
+        """Import the hardware libraries and set up the GPIO and I2C bus, once."""
+        with self._lock:
+            if self._available is not None:
+                return
+
+            # Check if running on a Raspberry Pi
+            try:
+                import RPi.GPIO as GPIO
+                import board
+                import busio
+                import adafruit_ads1x15.ads1115 as ADS
+                from adafruit_ads1x15.analog_in import AnalogIn
+            except ImportError:
+                # Not running on a Raspberry Pi or missing required libraries
+                self._available = False
+                return
+
+            try:
+                # Set up GPIO
+                GPIO.setmode(GPIO.BCM)
+
+                # Set up I2C for ADS1115 ADC at a high data rate, so each
+                # single-shot conversion takes about a millisecond. pH and CO2
+                # alternate on the one ADC, and every channel switch starts a new
+                # conversion, so continuous mode would save nothing.
+                i2c = busio.I2C(board.SCL, board.SDA)
+                ads = ADS.ADS1115(i2c, data_rate=ADC_DATA_RATE)
+
+                # Channel objects are created once and reused for every read
+                self.ph_channel = AnalogIn(ads, PH_SENSOR_CHANNEL)
+                self.co2_channel = AnalogIn(ads, CO2_SENSOR_CHANNEL)
+
+                print("Hardware sensors initialized successfully")
+                self._available = True
+            except Exception as e:
+                print(f"Error initializing hardware: {e}")
+                self._available = False
+
+HARDWARE = HardwareBackend()
+
+def __getattr__(name):
+    """Keep HARDWARE_AVAILABLE working as a module attribute, checked on first access."""
+    if name == "HARDWARE_AVAILABLE":
+        return HARDWARE.available
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class DS18B20Probes:
+    """
+    DS18B20 temperature probes on the 1-Wire bus, discovered once and cached.
+
+    This class only reads the hardware. get_temperature, read_temperature and
+    read_temperatures serve replayed values first (see TraceReplay).
+
+    The device directory is scanned on first use, then again only when a
+    probe fails to read (it may have been unplugged or replaced) or when
+    the cached list is older than refresh_interval.
+
+    Attributes:
+        base_dir (str): 1-Wire devices directory
+        refresh_interval (float): Seconds before the device list is rescanned anyway
+    """
+
+    def __init__(self, base_dir=W1_DEVICES_DIR, refresh_interval=PROBE_REFRESH_INTERVAL):
+        self.base_dir = base_dir
+        self.refresh_interval = refresh_interval
+        self._devices = None
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Rescan the bus for DS18B20 probes.
+
+        Returns:
+            list: Probe ids (the "28-..." folder names), sorted
+        """
+        try:
+            devices = sorted(folder for folder in os.listdir(self.base_dir) if folder.startswith('28-'))
+        except OSError:
+            devices = []
+
+        with self._lock:
+            self._devices = devices
+            self._scanned_at = time.monotonic()
+        return devices
+
+    def devices(self):
+        """
+        Return the cached probe ids, rescanning if the list has expired.
+
+        Returns:
+            list: Probe ids, sorted
+        """
+        with self._lock:
+            devices = self._devices
+            expired = time.monotonic() - self._scanned_at > self.refresh_interval
+
+        if devices is None or expired:
+            devices = self.refresh()
+        return devices
+
+    def _read_device(self, device_id):
+        """Parse one probe's w1_slave file, returning None on a bad CRC."""
+        with open(os.path.join(self.base_dir, device_id, 'w1_slave'), 'r') as f:
+            lines = f.readlines()
+
+        if lines[0].strip()[-3:] == 'YES':
+            equals_pos = lines[1].find('t=')
+            if equals_pos != -1:
+                return float(lines[1][equals_pos+2:]) / 1000.0
+        return None
+
+    def read(self, device_id=None):
+        """
+        Read a probe's temperature.
+
+        A failed read triggers a rescan, and the read is retried once if the
+        probe is still on the bus.
+
+        Args:
+            device_id (str, optional): Probe id. Defaults to the first probe found.
+
+        Returns:
+            float: Temperature in Celsius, or None if the probe can't be read
+        """
+        for attempt in range(2):
+            devices = self.devices() if attempt == 0 else self.refresh()
+            probe = device_id or (devices[0] if devices else None)
+            if probe is None or probe not in devices:
+                continue
+
+            try:
+                temp_c = self._read_device(probe)
+            except (OSError, IndexError, ValueError):
+                temp_c = None
+            if temp_c is not None:
+                from sensor_calibration import SENSOR_CALIBRATIONS
+                return SENSOR_CALIBRATIONS.convert(f"temperature:{probe}", temp_c)
+
+        return None
+
+    def read_all(self):
+        """
+        Read every probe on the bus.
+
+        Returns:
+            dict: Probe id -> temperature in Celsius (None if it can't be read)
+        """
+        return {device_id: self.read(device_id) for device_id in self.devices()}
+
+PROBES = DS18B20Probes()
+
+def load_probe_map(path=PROBE_MAP_FILE):
+    """
+    Load the mapping of temperature probes to batches.
+
+    The file is a JSON object of probe id -> batch name, e.g.
+    {"28-0316a2794fff": "Classic Black Tea Batch"}.
+
+    Args:
+        path (str, optional): Path to the mapping file. Defaults to PROBE_MAP_FILE.
+
+    Returns:
+        dict: Probe id -> batch name, empty if the file doesn't exist
+    """
+    if not os.path.exists(path):
+        return {}
 
-# Initialize hardware if available
-if HARDWARE_AVAILABLE:
     try:
-        # Set up GPIO
-        GPIO.setmode(GPIO.BCM)
-        
-        # Set up I2C for ADS1115 ADC
-        i2c = busio.I2C(board.SCL, board.SDA)
-        ads = ADS.ADS1115(i2c)
-        
-        print("Hardware sensors initialized successfully")
-    except Exception as e:
-        print(f"Error initializing hardware: {e}")
-        HARDWARE_AVAILABLE = False
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error loading probe map: {e}")
+        return {}
+
+def _start_env_replay():
+    """Start replaying SENSOR_REPLAY_FILE, once, unless a replay was started or stopped explicitly."""
+    global _env_replay_pending
 
-def get_temperature():
+    with _replay_lock:
+        if _env_replay_pending:
+            _env_replay_pending = False
+            start_replay(SENSOR_REPLAY_FILE)
+
+def _replayed(*channels):
+    """Return the replayed value of the first of channels in the trace, or None."""
+    if _env_replay_pending:
+        _start_env_replay()
+    if REPLAY is None:
+        return None
+
+    for channel in channels:
+        value = REPLAY.value(channel)
+        if value is not None:
+            return value
+    return None
+
+def get_temperature(probe_id=None):
     """
     Read temperature from DS18B20 sensor or simulate a value.
-    
+
+    Args:
+        probe_id (str, optional): DS18B20 probe id. Defaults to the first probe found.
+
     Returns:
         float: Temperature in Celsius
     """
-    if HARDWARE_AVAILABLE:
+    replayed = _replayed(f"temperature:{probe_id}" if probe_id else "temperature", "temperature")
+    if replayed is not None:
+        return replayed
+
+    if HARDWARE.available:
         try:
-            # Implementation for DS18B20 temperature sensor on Raspberry Pi
-            base_dir = '/sys/bus/w1/devices/'
-            device_folder = None
-            
-            # Find the device folder
-            try:
-                device_folders = os.listdir(base_dir)
-                for folder in device_folders:
-                    if folder.startswith('28-'):
-                        device_folder = os.path.join(base_dir, folder)
-                        break
-            except:
-                pass
-            
-            if device_folder:
-                device_file = os.path.join(device_folder, 'w1_slave')
-                
-                # Read the temperature
-                with open(device_file, 'r') as f:
-                    lines = f.readlines()
-                
-                # Parse the temperature value
-                if lines[0].strip()[-3:] == 'YES':
-                    equals_pos = lines[1].find('t=')
-                    if equals_pos != -1:
-                        temp_string = lines[1][equals_pos+2:]
-                        temp_c = float(temp_string) / 1000.0
-                        return temp_c
-            
+            temp_c = PROBES.read(probe_id)
+            if temp_c is not None:
+                return temp_c
+
             # If we couldn't read from the sensor, simulate a value
             return simulate_temperature()
         except Exception as e:
@@ -103,6 +337,86 @@ def get_temperature():
         # Simulate temperature data
         return simulate_temperature()
 
+def get_batch_temperatures(probe_map=None):
+    """
+    Read the temperature of every batch that has a probe assigned.
+
+    Args:
+        probe_map (dict, optional): Probe id -> batch name. Defaults to load_probe_map().
+
+    Returns:
+        dict: Batch name -> temperature in Celsius
+    """
+    if probe_map is None:
+        probe_map = load_probe_map()
+
+    return {batch_name: get_temperature(probe_id) for probe_id, batch_name in probe_map.items()}
+
+def batch_temperature_channels(probe_map=None):
+    """
+    Sampler channels for every batch's temperature probe.
+
+    Args:
+        probe_map (dict, optional): Probe id -> batch name. Defaults to load_probe_map().
+
+    Returns:
+        dict: "temperature:<batch name>" -> read function, for SensorSampler
+    """
+    if probe_map is None:
+        probe_map = load_probe_map()
+
+    return {
+        f"temperature:{batch_name}": (lambda probe_id=probe_id: get_temperature(probe_id))
+        for probe_id, batch_name in probe_map.items()
+    }
+
+def voltage_to_ph(voltage):
+    """
+    Convert the pH sensor voltage to pH.
+
+    Uses the sensor's calibration (see sensor_calibration.py) if it has one.
+
+    Args:
+        voltage (float): Sensor output in volts
+
+    Returns:
+        float: pH value (0-14)
+    """
+    from sensor_calibration import SENSOR_CALIBRATIONS
+
+    calibration = SENSOR_CALIBRATIONS.table("ph")
+    if calibration is not None:
+        ph_value = calibration(voltage)
+    else:
+        # Uncalibrated: nominal response of a pH probe, 0.18 V per pH unit around 2.5 V at pH 7
+        ph_value = 7 - ((voltage - 2.5) / 0.18)
+
+    # Ensure the value is within the valid pH range
+    ph_value = max(0, min(14, ph_value))
+
+    return round(ph_value, 1)
+
+def voltage_to_co2(voltage):
+    """
+    Convert the CO2 sensor voltage to ppm.
+
+    Uses the sensor's calibration (see sensor_calibration.py) if it has one.
+
+    Args:
+        voltage (float): Sensor output in volts
+
+    Returns:
+        float: CO2 concentration in ppm
+    """
+    from sensor_calibration import SENSOR_CALIBRATIONS
+
+    calibration = SENSOR_CALIBRATIONS.table("co2")
+    if calibration is not None:
+        return calibration(voltage)
+
+    # Uncalibrated: nominal 1000 ppm per volt
+    return voltage * 1000
+
 def get_ph():
     """
     Read pH from pH sensor or simulate a value.
@@ -110,20 +424,16 @@ def get_ph():
     Returns:
         float: pH value (0-14)
     """
-    if HARDWARE_AVAILABLE:
+    replayed = _replayed("ph")
+    if replayed is not None:
+        return replayed
+
+    if HARDWARE.available:
         try:
             # Implementation for pH sensor connected to ADS1115
-            ph_channel = AnalogIn(ads, PH_SENSOR_CHANNEL)
-            
-            # Convert voltage to pH (this will depend on your specific sensor)
-            # This is a placeholder calculation - adjust based on your sensor's specifications
-            voltage = ph_channel.voltage
-            ph_value = 7 - ((voltage - 2.5) / 0.18)
-            
-            # Ensure the value is within the valid pH range
-            ph_value = max(0, min(14, ph_value))
-            
-            return round(ph_value, 1)
+            with adc_lock:
+                voltage = HARDWARE.ph_channel.voltage
+            return voltage_to_ph(voltage)
         except Exception as e:
             print(f"Error reading pH sensor: {e}")
             return simulate_ph()
@@ -138,17 +448,16 @@ def get_co2_level():
     Returns:
         float: CO2 concentration in ppm
     """
-    if HARDWARE_AVAILABLE:
+    replayed = _replayed("co2")
+    if replayed is not None:
+        return replayed
+
+    if HARDWARE.available:
         try:
             # Implementation for CO2 sensor connected to ADS1115
-            co2_channel = AnalogIn(ads, CO2_SENSOR_CHANNEL)
-            
-            # Convert voltage to CO2 ppm (this will depend on your specific sensor)
-            # This is a placeholder calculation - adjust based on your sensor's specifications
-            voltage = co2_channel.voltage
-            co2_ppm = voltage * 1000  # Example conversion
-            
-            return co2_ppm
+            with adc_lock:
+                voltage = HARDWARE.co2_channel.voltage
+            return voltage_to_co2(voltage)
         except Exception as e:
             print(f"Error reading CO2 sensor: {e}")
             return simulate_co2()
@@ -156,6 +465,149 @@ def get_co2_level():
         # Simulate CO2 data
         return simulate_co2()
 
+def get_analog_readings():
+    """
+    Read pH and CO2 together in one pass over the ADS1115.
+
+    Both channels are read back to back while holding the ADC, instead of
+    two separate calls each waiting for the bus. A channel with a replayed
+    value is not read.
+
+    Returns:
+        tuple: (pH value, CO2 concentration in ppm)
+    """
+    ph, co2 = _replayed("ph"), _replayed("co2")
+    if ph is not None and co2 is not None:
+        return ph, co2
+    if ph is not None:
+        return ph, get_co2_level()
+    if co2 is not None:
+        return get_ph(), co2
+
+    if HARDWARE.available:
+        try:
+            with adc_lock:
+                ph_voltage = HARDWARE.ph_channel.voltage
+                co2_voltage = HARDWARE.co2_channel.voltage
+            return voltage_to_ph(ph_voltage), voltage_to_co2(co2_voltage)
+        except Exception as e:
+            print(f"Error reading analog sensors: {e}")
+            return simulate_ph(), simulate_co2()
+    else:
+        # Simulate pH and CO2 data
+        return simulate_ph(), simulate_co2()
+
+# Executor for the blocking reads behind the async functions, created by the
+# first of them. A read that times out keeps its thread until the driver
+# returns, so size this above the number of probes that may hang at once.
+_sensor_executor = None
+_executor_lock = threading.Lock()
+
+def _executor():
+    """Return the sensor read executor, creating it on first use."""
+    global _sensor_executor
+
+    with _executor_lock:
+        if _sensor_executor is None:
+            _sensor_executor = ThreadPoolExecutor(max_workers=SENSOR_READ_WORKERS, thread_name_prefix="sensor-read")
+        return _sensor_executor
+
+def _read_probe(probe_id):
+    """Read one DS18B20 probe, or its replayed value, without the simulation fallback."""
+    replayed = _replayed(f"temperature:{probe_id}" if probe_id else "temperature", "temperature")
+    if replayed is not None:
+        return replayed
+
+    if HARDWARE.available:
+        return PROBES.read(probe_id)
+    return simulate_temperature()
+
+def _probe_ids():
+    """Probe ids on the bus, plus those the replayed trace has a temperature for."""
+    probe_ids = set(PROBES.devices()) if HARDWARE.available else set()
+
+    if _env_replay_pending:
+        _start_env_replay()
+    if REPLAY is not None:
+        probe_ids.update(channel.split(":", 1)[1] for channel in REPLAY.current() if channel.startswith("temperature:"))
+    return sorted(probe_ids)
+
+async def _read_in_executor(name, func, *args, timeout=SENSOR_READ_TIMEOUT):
+    """Run a blocking read in the sensor executor, returning None on timeout or error."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(_executor(), func, *args), timeout)
+    except asyncio.TimeoutError:
+        print(f"Timed out reading {name} sensor after {timeout}s")
+    except Exception as e:
+        print(f"Error reading {name} sensor: {e}")
+    return None
+
+async def read_temperature(probe_id=None, timeout=SENSOR_READ_TIMEOUT):
+    """
+    Read a DS18B20 probe without blocking the event loop.
+
+    Args:
+        probe_id (str, optional): Probe id. Defaults to the first probe found.
+        timeout (float, optional): Seconds to wait. Defaults to SENSOR_READ_TIMEOUT.
+
+    Returns:
+        float: Temperature in Celsius, or None if the probe failed or timed out
+    """
+    return await _read_in_executor(f"temperature {probe_id or ''}".strip(), _read_probe, probe_id, timeout=timeout)
+
+async def read_temperatures(probe_ids=None, timeout=SENSOR_READ_TIMEOUT):
+    """
+    Read many DS18B20 probes concurrently.
+
+    The slow 1-Wire conversions overlap, so a sweep takes about as long as
+    the slowest probe, and at most timeout.
+
+    Args:
+        probe_ids (list, optional): Probe ids. Defaults to every probe on the bus
+            or in the replayed trace.
+        timeout (float, optional): Seconds to wait for each probe. Defaults to SENSOR_READ_TIMEOUT.
+
+    Returns:
+        dict: Probe id -> temperature in Celsius (None for failed probes)
+    """
+    if probe_ids is None:
+        # Listing the bus touches sysfs and may set up the hardware, so it runs off the loop too
+        probe_ids = await asyncio.get_running_loop().run_in_executor(_executor(), _probe_ids)
+
+    temperatures = await asyncio.gather(*(read_temperature(probe_id, timeout) for probe_id in probe_ids))
+    return dict(zip(probe_ids, temperatures))
+
+async def read_batch_temperatures(probe_map=None, timeout=SENSOR_READ_TIMEOUT):
+    """
+    Read every batch's probe concurrently.
+
+    Args:
+        probe_map (dict, optional): Probe id -> batch name. Defaults to load_probe_map().
+        timeout (float, optional): Seconds to wait for each probe. Defaults to SENSOR_READ_TIMEOUT.
+
+    Returns:
+        dict: Batch name -> temperature in Celsius (None for failed probes)
+    """
+    if probe_map is None:
+        probe_map = await asyncio.get_running_loop().run_in_executor(_executor(), load_probe_map)
+
+    temperatures = await read_temperatures(list(probe_map), timeout)
+    return {batch_name: temperatures[probe_id] for probe_id, batch_name in probe_map.items()}
+
+async def read_analog(timeout=SENSOR_READ_TIMEOUT):
+    """
+    Read pH and CO2 from the ADC without blocking the event loop.
+
+    Args:
+        timeout (float, optional): Seconds to wait. Defaults to SENSOR_READ_TIMEOUT.
+
+    Returns:
+        tuple: (pH value, CO2 concentration in ppm), or (None, None) on timeout
+    """
+    readings = await _read_in_executor("analog", get_analog_readings, timeout=timeout)
+    return readings if readings is not None else (None, None)
+
 def simulate_temperature():
     """
     Simulate a realistic temperature reading for kombucha fermentation.
@@ -194,12 +646,579 @@ def simulate_co2():
     # CO2 levels can vary widely, but let's use a reasonable range
     return round(random.uniform(1000, 5000))
 
+class RingBuffer:
+    """
+    Fixed-size buffer of timestamped samples backed by NumPy arrays.
+
+    Once full, each new sample overwrites the oldest one. The buffer is not
+    locked; SensorSampler serializes access to it.
+
+    Attributes:
+        capacity (int): Maximum number of samples kept
+    """
+
+    def __init__(self, capacity):
+        import numpy as np
+
+        self.capacity = capacity
+        self._times = np.zeros(capacity)
+        self._values = np.zeros(capacity)
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        """
+        Add a sample, overwriting the oldest one when full.
+
+        Args:
+            timestamp (float): Time of the sample in seconds since the epoch
+            value (float): Sample value
+        """
+        self._times[self._next] = timestamp
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def latest(self):
+        """
+        Return the most recent sample.
+
+        Returns:
+            tuple: (timestamp, value), or None if the buffer is empty
+        """
+        if self._count == 0:
+            return None
+
+        index = (self._next - 1) % self.capacity
+        return float(self._times[index]), float(self._values[index])
+
+    def window(self, seconds, now=None):
+        """
+        Return the samples taken in the last few seconds, oldest first.
+
+        Args:
+            seconds (float): Length of the window
+            now (float, optional): End of the window. Defaults to time.time().
+
+        Returns:
+            tuple: (timestamps, values) as new NumPy arrays
+        """
+        import numpy as np
+
+        if now is None:
+            now = time.time()
+
+        # Chronological order: the oldest sample sits at _next once the buffer has wrapped
+        order = (np.arange(self._count) + (self._next - self._count)) % self.capacity
+        times = self._times[order]
+        recent = times >= now - seconds
+
+        return times[recent], self._values[order][recent]
+
+class SensorSampler:
+    """
+    Polls sensors on a fixed interval in a background thread.
+
+    A channel is a name mapped to a function returning one reading, or a
+    tuple of names mapped to a function returning one reading per name, for
+    sensors that are cheaper to read together. By default the channels are
+    temperature, pH and CO2 (read together from the ADC), plus one
+    "temperature:<batch name>" channel per probe in the probe map.
+
+    The last samples of each channel are kept in a RingBuffer. latest() and
+    window() only copy from memory, so the UI or API can read the sensors
+    as often as they like without touching the I²C bus.
+
+    With an aggregator (see sensor_aggregation.py), every sample is also
+    rolled into per-minute and per-hour buckets, and the closed buckets are
+    persisted after each sweep. The raw samples are never stored.
+
+    Attributes:
+        channels (dict): Channel name (or tuple of names) -> read function
+        interval (float): Seconds between polls
+        aggregator (SensorAggregator): Downsamples the samples for storage, or None
+    """
+
+    def __init__(self, channels=None, interval=SAMPLE_INTERVAL, capacity=SAMPLE_BUFFER_SIZE, aggregator=None):
+        if channels is None:
+            channels = {"temperature": get_temperature, ("ph", "co2"): get_analog_readings}
+            channels.update(batch_temperature_channels())
+
+        self.channels = channels
+        self.interval = interval
+        self.aggregator = aggregator
+        self._buffers = {}
+        for key in channels:
+            for name in (key if isinstance(key, tuple) else (key,)):
+                self._buffers[name] = RingBuffer(capacity)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def sample_once(self):
+        """Read every channel once and store the samples."""
+        for key, read in self.channels.items():
+            names = key if isinstance(key, tuple) else (key,)
+            try:
+                values = read() if isinstance(key, tuple) else (read(),)
+                values = [float(value) for value in values]
+            except Exception as e:
+                print(f"Error sampling {', '.join(names)} sensor: {e}")
+                continue
+
+            timestamp = time.time()
+            with self._lock:
+                for name, value in zip(names, values):
+                    self._buffers[name].append(timestamp, value)
+
+            if self.aggregator is not None:
+                for name, value in zip(names, values):
+                    self.aggregator.add(name, timestamp, value)
+
+        if self.aggregator is not None:
+            self.aggregator.flush()
+
+    def start(self):
+        """Start sampling in a daemon thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="sensor-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and wait for it to finish, persisting the partial buckets."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        if self.aggregator is not None:
+            self.aggregator.close()
+            self.aggregator.flush()
+
+    def _run(self):
+        """Sampling loop of the background thread, on a fixed schedule."""
+        next_sample = time.monotonic()
+        while not self._stopping.is_set():
+            self.sample_once()
+            next_sample += self.interval
+            self._stopping.wait(max(0.0, next_sample - time.monotonic()))
+
+    def latest(self):
+        """
+        Return the most recent sample of every channel.
+
+        Returns:
+            dict: Channel name -> (timestamp, value), or None if not sampled yet
+        """
+        with self._lock:
+            return {name: buffer.latest() for name, buffer in self._buffers.items()}
+
+    def window(self, seconds):
+        """
+        Return the samples of every channel taken in the last few seconds.
+
+        Args:
+            seconds (float): Length of the window
+
+        Returns:
+            dict: Channel name -> (timestamps, values) NumPy arrays, oldest first
+        """
+        now = time.time()
+        with self._lock:
+            return {name: buffer.window(seconds, now) for name, buffer in self._buffers.items()}
+
+class SensorSimulator:
+    """
+    Reproducible sensor series for many virtual vessels, generated with NumPy.
+
+    Each vessel gets its own sugar content, volume, storage temperature and
+    starting and final pH, drawn from the seed. Over the time range:
+    - temperature follows a daily cycle of ±DAILY_TEMPERATURE_SWING °C
+      peaking at 14:00 UTC, plus noise
+    - CO2 accumulates over that temperature path, each interval at its own
+      temperature (see co2_calculator.integrate_co2_history), so it never
+      decreases; pressure follows estimate_co2_array along the same path
+    - pH falls from its starting to its final value in step with CO2
+      production, plus noise
+
+    The same seed, vessel count and time range always give the same values,
+    whether generated at once or in chunks.
+
+    Attributes:
+        n_vessels (int): Number of virtual vessels
+        start (float): Start of fermentation in seconds since the epoch
+        duration_days (float): Length of the simulated range in days
+        interval (float): Seconds between samples
+        vessels (dict): Per-vessel parameter arrays ("sugar_content",
+            "volume", "base_temperature", "initial_ph", "final_ph")
+    """
+
+    def __init__(self, seed=None, n_vessels=1, start=None, duration_days=28, interval=60):
+        self.n_vessels = n_vessels
+        self.start = time.time() if start is None else float(start)
+        self.duration_days = duration_days
+        self.interval = interval
+        self.seed = seed
+
+        import numpy as np
+
+        rng = np.random.default_rng(seed)
+        self.vessels = {
+            "sugar_content": rng.uniform(50, 250, n_vessels),
+            "volume": rng.uniform(1, 10, n_vessels),
+            "base_temperature": rng.uniform(22, 27, n_vessels),
+            "initial_ph": rng.uniform(4.2, 4.8, n_vessels),
+            "final_ph": rng.uniform(2.8, 3.2, n_vessels)
+        }
+
+    @property
+    def n_samples(self):
+        """Number of samples per vessel in the time range."""
+        return int(self.duration_days * 86400 // self.interval) + 1
+
+    def _noise_generators(self):
+        """Independent random streams for the temperature and pH noise."""
+        import numpy as np
+
+        return [np.random.default_rng(seq) for seq in np.random.SeedSequence(self.seed).spawn(2)]
+
+    def _start_state(self):
+        """Integration state at the start of the range: day 0 and no CO2 yet."""
+        import numpy as np
+
+        return {"day": 0.0, "co2": np.zeros((self.n_vessels, 1))}
+
+    def _series(self, offsets, temperature_rng, ph_rng, state):
+        """
+        Generate all series for an array of sample offsets from the start.
+
+        state carries the last day and cumulative CO2 of the previous chunk
+        and is updated in place.
+        """
+        import numpy as np
+
+        from co2_calculator import (calculate_co2_production_array, estimate_co2_array,
+                                    estimate_fermentation_completion_array, integrate_co2_history)
+
+        timestamps = self.start + offsets * self.interval
+        days = (offsets * self.interval / 86400)[np.newaxis, :]
+        # Noise is drawn sample by sample (time-major), so chunking doesn't change it
+        shape = (len(offsets), self.n_vessels)
+
+        # Daily temperature cycle peaking at 14:00 UTC
+        hours = (timestamps % 86400) / 3600
+        daily_cycle = DAILY_TEMPERATURE_SWING * np.cos(2 * np.pi * (hours - 14) / 24)
+        temperature = (self.vessels["base_temperature"][:, np.newaxis] + daily_cycle
+                       + temperature_rng.uniform(-0.5, 0.5, shape).T)
+
+        sugar = self.vessels["sugar_content"][:, np.newaxis]
+        volume = self.vessels["volume"][:, np.newaxis]
+        co2 = state["co2"] + integrate_co2_history(sugar, days, temperature, volume, start_day=state["day"])
+        state["day"], state["co2"] = float(days[0, -1]), co2[:, -1:]
+
+        # Pressure along the same path: the pressure at 25 °C, scaled by the
+        # CO2 produced relative to a constant 25 °C
+        reference = calculate_co2_production_array(sugar, days, 25, volume)
+        path_factor = np.divide(co2, reference, out=np.ones_like(co2), where=reference > 0)
+        co2_pressure = estimate_co2_array(sugar, 25, days) * path_factor
+
+        # pH drops in proportion to the share of the sugar converted so far
+        progress = estimate_fermentation_completion_array(sugar, co2) / 100
+        initial_ph = self.vessels["initial_ph"][:, np.newaxis]
+        final_ph = self.vessels["final_ph"][:, np.newaxis]
+        ph = initial_ph - (initial_ph - final_ph) * progress + ph_rng.normal(0.0, 0.02, shape).T
+
+        return {
+            "timestamps": timestamps,
+            "temperature": temperature,
+            "ph": ph,
+            "co2": co2,
+            "co2_pressure": co2_pressure
+        }
+
+    def generate(self):
+        """
+        Generate the whole time range at once.
+
+        Returns:
+            dict: "timestamps" of shape (n_samples,), and "temperature" (°C),
+            "ph", "co2" (g) and "co2_pressure" (atm) of shape (n_vessels, n_samples)
+        """
+        import numpy as np
+
+        return self._series(np.arange(self.n_samples, dtype=float), *self._noise_generators(), self._start_state())
+
+    def iter_chunks(self, chunk_size=100000):
+        """
+        Generate the time range in chunks, to simulate long ranges in bounded memory.
+
+        Args:
+            chunk_size (int, optional): Samples per vessel in each chunk. Defaults to 100000.
+
+        Yields:
+            dict: Arrays as returned by generate() for consecutive sample ranges
+        """
+        import numpy as np
+
+        temperature_rng, ph_rng = self._noise_generators()
+        state = self._start_state()
+        for first in range(0, self.n_samples, chunk_size):
+            offsets = np.arange(first, min(first + chunk_size, self.n_samples), dtype=float)
+            yield self._series(offsets, temperature_rng, ph_rng, state)
+
+    def readings(self, batch_names, series=None):
+        """
+        Turn simulated series into readings in the ingest.py format.
+
+        Args:
+            batch_names (list): Batch name for each vessel
+            series (dict, optional): Output of generate() or one chunk. Defaults to generate().
+
+        Yields:
+            dict: Secondary-fermentation reading with "batch", "date",
+            "temperature", "ph", "co2_estimate" and "co2_pressure"
+        """
+        if series is None:
+            series = self.generate()
+
+        dates = [time.strftime("%Y-%m-%d", time.gmtime(t)) for t in series["timestamps"]]
+        for vessel, batch_name in enumerate(batch_names):
+            for sample, date in enumerate(dates):
+                yield {
+                    "batch": batch_name,
+                    "date": date,
+                    "phase": "secondary",
+                    "temperature": round(float(series["temperature"][vessel, sample]), 2),
+                    "ph": round(float(series["ph"][vessel, sample]), 2),
+                    "co2_estimate": float(series["co2"][vessel, sample]),
+                    "co2_pressure": float(series["co2_pressure"][vessel, sample])
+                }
+
+def _parse_trace_time(value):
+    """Parse a trace timestamp given in epoch seconds or ISO 8601."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.datetime.fromisoformat(value).timestamp()
+
+def _trace_record(row):
+    """Convert a trace row into (timestamp, {channel: value})."""
+    timestamp = _parse_trace_time(row["timestamp"])
+
+    # Long format: one channel per row
+    if "channel" in row and "value" in row:
+        return timestamp, {row["channel"]: float(row["value"])}
+
+    # Wide format: one column per channel; non-numeric columns are ignored
+    values = {}
+    for channel, value in row.items():
+        if channel == "timestamp" or value in (None, ""):
+            continue
+        try:
+            values[channel] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return timestamp, values
+
+class TraceReplay:
+    """
+    Replays a recorded sensor trace as if it came from the hardware.
+
+    A trace is a CSV file with a header row, or a JSONL file with one object
+    per line. Each record has a "timestamp" (epoch seconds or ISO 8601) and
+    either one field per channel ("temperature", "ph", "co2",
+    "temperature:<probe id>") or a "channel" and a "value" field. Records
+    must be in time order.
+
+    The file is streamed record by record, so traces of any size replay in
+    constant memory. Records are released at their recorded spacing divided
+    by speed; a speed of 0 replays as fast as possible.
+
+    Attributes:
+        path (str): Path to the trace file
+        speed (float): Playback rate relative to real time
+        loop (bool): Start over when the trace ends
+        on_record (callable): Called with (timestamp, values) for every record
+        trace_time (float): Timestamp of the last replayed record
+        records_replayed (int): Number of records replayed so far
+    """
+
+    def __init__(self, path, speed=1.0, loop=False, on_record=None):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.on_record = on_record
+        self.trace_time = None
+        self.records_replayed = 0
+        self._current = {}
+        self._lock = threading.Lock()
+        self._started = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def records(self):
+        """
+        Stream the records of the trace file without pacing.
+
+        Yields:
+            tuple: (timestamp, {channel: value})
+        """
+        with open(self.path, 'r', newline='') as f:
+            if os.path.splitext(self.path)[1].lower() == ".csv":
+                rows = csv.DictReader(f)
+            else:
+                rows = (json.loads(line) for line in f if line.strip())
+
+            for row in rows:
+                yield _trace_record(row)
+
+    def replay(self):
+        """
+        Stream the records at the replay speed.
+
+        Yields:
+            tuple: (timestamp, {channel: value}), each at its scheduled time
+        """
+        while True:
+            wall_start = trace_start = None
+
+            for timestamp, values in self.records():
+                if wall_start is None:
+                    wall_start, trace_start = time.monotonic(), timestamp
+
+                if self.speed:
+                    delay = wall_start + (timestamp - trace_start) / self.speed - time.monotonic()
+                    if delay > 0 and self._stopping.wait(delay):
+                        return
+                elif self._stopping.is_set():
+                    return
+
+                yield timestamp, values
+
+            if not self.loop or wall_start is None:
+                return
+
+    def start(self, wait=5.0):
+        """
+        Replay in a daemon thread.
+
+        Args:
+            wait (float, optional): Seconds to wait for the first record, so
+                readers don't start before there are values. Defaults to 5.0.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="sensor-replay", daemon=True)
+        self._thread.start()
+        self._started.wait(wait)
+
+    def stop(self):
+        """Stop replaying and wait for the thread to finish."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def finished(self):
+        """True once the replay thread has run to the end of the trace."""
+        return self._thread is not None and not self._thread.is_alive()
+
+    def _run(self):
+        """Replay loop of the background thread."""
+        try:
+            for timestamp, values in self.replay():
+                with self._lock:
+                    self._current.update(values)
+                    self.trace_time = timestamp
+                    self.records_replayed += 1
+                self._started.set()
+
+                if self.on_record is not None:
+                    self.on_record(timestamp, values)
+        except Exception as e:
+            print(f"Error replaying sensor trace {self.path}: {e}")
+        finally:
+            self._started.set()
+
+    def value(self, channel):
+        """
+        Return a channel's most recently replayed value.
+
+        Args:
+            channel (str): Channel name
+
+        Returns:
+            float: The value, or None if the trace hasn't had it yet
+        """
+        with self._lock:
+            return self._current.get(channel)
+
+    def current(self):
+        """
+        Return the most recently replayed value of every channel.
+
+        Returns:
+            dict: Channel name -> value
+        """
+        with self._lock:
+            return dict(self._current)
+
+def start_replay(path, speed=REPLAY_SPEED, loop=False):
+    """
+    Serve the sensor functions from a recorded trace instead of the hardware.
+
+    Channels missing from the trace are still read from the hardware or
+    simulated.
+
+    Args:
+        path (str): Path to a CSV or JSONL trace
+        speed (float, optional): Playback rate relative to real time. Defaults to REPLAY_SPEED.
+        loop (bool, optional): Start over when the trace ends. Defaults to False.
+
+    Returns:
+        TraceReplay: The running replay
+    """
+    global REPLAY
+
+    stop_replay()
+    REPLAY = TraceReplay(path, speed=speed, loop=loop)
+    REPLAY.start()
+    return REPLAY
+
+def stop_replay():
+    """Stop replaying and go back to the hardware or simulation."""
+    global REPLAY, _env_replay_pending
+
+    # An explicit start or stop replaces the replay given in the environment
+    _env_replay_pending = False
+    if REPLAY is not None:
+        REPLAY.stop()
+        REPLAY = None
+
 # Example usage if run directly
 if __name__ == "__main__":
+    # python sensors.py replay <trace> [speed]: replay a trace as fast as it allows and report the rate
+    if len(sys.argv) > 2 and sys.argv[1] == "replay":
+        replay = TraceReplay(sys.argv[2], speed=float(sys.argv[3]) if len(sys.argv) > 3 else 0)
+        started = time.perf_counter()
+        count = sum(1 for _ in replay.replay())
+        elapsed = time.perf_counter() - started
+        print(f"Replayed {count} records in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} records/s)")
+        sys.exit(0)
+
     print(f"Temperature: {get_temperature()}°C")
     print(f"pH Level: {get_ph()}")
     print(f"CO2 Level: {get_co2_level()} ppm")
     
-    if not HARDWARE_AVAILABLE:
+    if not HARDWARE.available:
         print("Note: Hardware sensors not detected. Using simulated values.")
 
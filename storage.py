@@ -0,0 +1,1344 @@
+"""
+Storage Backends for the Kombucha Batch Logger
+
+This module persists batches, measurements and settings. Every backend loads
+the data in the same shape as kombucha_data.json: a list of batch dictionaries
+with nested "measurements" lists, plus a settings dictionary. They also share
+the same fine-grained write operations, so recording a single reading doesn't
+require the caller to hand over the whole dataset.
+
+Backends:
+- SQLiteStore: Embedded SQLite database with batches and measurements tables.
+  Single-row inserts and updates replace full rewrites, and each write is an
+  atomic transaction.
+- JSONFileStore: The flat kombucha_data.json format. Writes are appended to a
+  JSON Lines journal and folded into the snapshot file periodically.
+
+Both backends also hold the current carbonation alerts and pressure
+forecasts, which are written by the background evaluator in alert_engine.py
+and only read by the UI, and the per-minute and per-hour sensor aggregates
+written by sensor_aggregation.py.
+
+The backend is chosen with the KOMBUCHA_STORAGE environment variable ("sqlite"
+or "json", default "sqlite"). The first time the SQLite store is opened, it
+imports the existing kombucha_data.json.
+
+Usage:
+    python storage.py import [kombucha_data.json]
+    python storage.py compact
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import bisect
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import uuid
+from contextlib import closing, contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; the JSON backend is then limited to one process
+    fcntl = None
+
+# File paths for persistent storage
+DATA_FILE = os.environ.get("KOMBUCHA_DATA_FILE", "kombucha_data.json")
+DB_FILE = os.environ.get("KOMBUCHA_DB_FILE", "kombucha_data.db")
+STORAGE_BACKEND = os.environ.get("KOMBUCHA_STORAGE", "sqlite")
+
+# Journal records after which the JSON backend folds its journal into the snapshot
+COMPACT_THRESHOLD = int(os.environ.get("KOMBUCHA_COMPACT_THRESHOLD", 500))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS measurements (
+    id INTEGER PRIMARY KEY,
+    batch_id INTEGER NOT NULL REFERENCES batches(id) ON DELETE CASCADE,
+    date TEXT NOT NULL,
+    phase TEXT,
+    data TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_measurements_batch_date ON measurements(batch_id, date);
+CREATE INDEX IF NOT EXISTS idx_measurements_date ON measurements(date);
+
+CREATE TABLE IF NOT EXISTS latest_measurements (
+    batch_id INTEGER PRIMARY KEY REFERENCES batches(id) ON DELETE CASCADE,
+    date TEXT NOT NULL,
+    co2_pressure REAL
+);
+
+CREATE INDEX IF NOT EXISTS idx_latest_measurements_pressure ON latest_measurements(co2_pressure);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    name TEXT PRIMARY KEY,
+    pressure REAL NOT NULL,
+    risk_level TEXT NOT NULL,
+    source TEXT NOT NULL,
+    date TEXT NOT NULL,
+    danger_at TEXT,
+    warning_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS forecasts (
+    name TEXT PRIMARY KEY,
+    pressure REAL NOT NULL,
+    date TEXT NOT NULL,
+    warning_at TEXT,
+    danger_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sensor_aggregates (
+    channel TEXT NOT NULL,
+    resolution INTEGER NOT NULL,
+    start REAL NOT NULL,
+    count INTEGER NOT NULL,
+    min REAL NOT NULL,
+    mean REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (channel, resolution, start)
+);
+
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Parsed datasets shared by every store and session in the process, keyed by
+# the storage they were read from and re-read only when its files change
+_load_cache = {}
+_load_cache_lock = threading.Lock()
+
+def _file_signature(*paths):
+    """Identify the current version of a set of files by inode, mtime and size."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+def _cached_load(key, signature, loader):
+    """
+    Return the shared parsed dataset for key, re-reading it if signature changed.
+
+    The batch list and settings dict returned are fresh copies, so callers can
+    add or remove batches freely. The batch dictionaries themselves are shared
+    between callers and must be copied before they are modified.
+    """
+    with _load_cache_lock:
+        cached = _load_cache.get(key)
+
+    if cached is None or cached[0] != signature:
+        batches, settings = loader()
+        cached = (signature, batches, settings)
+        with _load_cache_lock:
+            _load_cache[key] = cached
+
+    return list(cached[1]), dict(cached[2])
+
+def _write_json_atomic(path, data):
+    """Write a JSON file next to the old one and swap it in atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def _alert_sort_key(alert):
+    """Order alerts danger first, then by forecast time of danger, then by pressure."""
+    return (0 if alert["risk_level"] == "danger" else 1, alert.get("danger_at") or "9999", -alert["pressure"])
+
+def _forecast_sort_key(forecast):
+    """Order forecasts by forecast time of danger, then of warning, then by name."""
+    return (forecast["danger_at"] or "9999", forecast["warning_at"] or "9999", forecast["name"])
+
+def _merge_aggregates(first, second):
+    """Combine two aggregates of the same sensor bucket."""
+    count = first["count"] + second["count"]
+    return dict(
+        first,
+        count=count,
+        min=min(first["min"], second["min"]),
+        mean=(first["mean"] * first["count"] + second["mean"] * second["count"]) / count,
+        max=max(first["max"], second["max"])
+    )
+
+def _batch_fields(batch):
+    """Return a copy of a batch without its measurements list."""
+    return {key: value for key, value in batch.items() if key != "measurements"}
+
+def _pressure(measurement):
+    """Return a measurement's CO2 pressure, or None if it doesn't have one."""
+    pressure = measurement.get("co2_pressure")
+    return pressure if isinstance(pressure, (int, float)) else None
+
+class LatestMeasurementIndex:
+    """
+    Latest measurement of every batch, ordered by CO2 pressure.
+
+    "Latest" means the measurement with the newest date; among readings on
+    the same date, the first one recorded wins. Updating the index when a
+    reading is appended costs O(log batches). Finding the batches at or above
+    a pressure is a range query over the sorted pressures.
+    """
+
+    def __init__(self):
+        self._latest = {}
+        self._by_pressure = []
+
+    @classmethod
+    def build(cls, batches):
+        """
+        Build the index from a list of batch dictionaries.
+
+        Args:
+            batches (list): Batches with optional "measurements" lists
+
+        Returns:
+            LatestMeasurementIndex: The populated index
+        """
+        index = cls()
+        for batch in batches:
+            for measurement in batch.get("measurements", []):
+                index.update(batch["name"], measurement)
+        return index
+
+    def update(self, batch_name, measurement):
+        """
+        Record a newly appended measurement.
+
+        Args:
+            batch_name (str): Name of the batch
+            measurement (dict): Measurement with at least a "date" key
+        """
+        current = self._latest.get(batch_name)
+        if current is not None and measurement["date"] <= current["date"]:
+            return
+
+        self.remove(batch_name)
+        self._latest[batch_name] = measurement
+
+        pressure = _pressure(measurement)
+        if pressure is not None:
+            bisect.insort(self._by_pressure, (pressure, batch_name))
+
+    def remove(self, batch_name):
+        """
+        Drop a batch from the index.
+
+        Args:
+            batch_name (str): Name of the batch
+        """
+        current = self._latest.pop(batch_name, None)
+        if current is None or _pressure(current) is None:
+            return
+
+        position = bisect.bisect_left(self._by_pressure, (_pressure(current), batch_name))
+        del self._by_pressure[position]
+
+    def latest(self, batch_name):
+        """
+        Return the latest measurement of a batch.
+
+        Args:
+            batch_name (str): Name of the batch
+
+        Returns:
+            dict: The measurement, or None if the batch has none
+        """
+        return self._latest.get(batch_name)
+
+    def at_or_above(self, threshold):
+        """
+        Find the batches whose latest CO2 pressure is at or above a threshold.
+
+        Args:
+            threshold (float): Pressure in atm
+
+        Returns:
+            list: Dicts with "name", "pressure" and "date", highest pressure first
+        """
+        start = bisect.bisect_left(self._by_pressure, (threshold,))
+        return [
+            {"name": name, "pressure": pressure, "date": self._latest[name]["date"]}
+            for pressure, name in reversed(self._by_pressure[start:])
+        ]
+
+class SQLiteStore:
+    """
+    Batch storage in an embedded SQLite database.
+
+    A connection is opened per operation, so the store can be shared by the
+    threads Streamlit runs sessions in.
+
+    Attributes:
+        path (str): Path to the database file
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+
+        with self._transaction() as conn:
+            conn.executescript(SCHEMA)
+
+            # Tells a recreated database apart from the one it replaced
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', ?)", (uuid.uuid4().hex,))
+
+            # Databases created before the latest-measurement index existed
+            if not conn.execute("SELECT 1 FROM meta WHERE key = 'latest_index_built'").fetchone():
+                for batch_id, data in conn.execute("SELECT batch_id, data FROM measurements ORDER BY batch_id, id").fetchall():
+                    self._record_latest(conn, batch_id, json.loads(data))
+                conn.execute("INSERT INTO meta (key, value) VALUES ('latest_index_built', '1')")
+
+            # Alerts tables created before the threshold forecasts existed
+            alert_columns = {row[1] for row in conn.execute("PRAGMA table_info(alerts)")}
+            for column in ("danger_at", "warning_at"):
+                if column not in alert_columns:
+                    conn.execute(f"ALTER TABLE alerts ADD COLUMN {column} TEXT")
+
+    def __repr__(self):
+        return f"SQLiteStore({os.path.abspath(self.path)!r})"
+
+    @contextmanager
+    def _transaction(self):
+        """Open a connection and commit on success or roll back on error."""
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.execute("PRAGMA journal_mode = WAL")
+            with conn:
+                yield conn
+
+    def _record_latest(self, conn, batch_id, measurement):
+        """Update the latest-measurement index for a newly inserted measurement."""
+        conn.execute(
+            """
+            INSERT INTO latest_measurements (batch_id, date, co2_pressure) VALUES (?, ?, ?)
+            ON CONFLICT(batch_id) DO UPDATE SET date = excluded.date, co2_pressure = excluded.co2_pressure
+            WHERE excluded.date > latest_measurements.date
+            """,
+            (batch_id, measurement["date"], _pressure(measurement))
+        )
+
+    def _bump_version(self, conn):
+        """Increment the data version within a write transaction."""
+        conn.execute(
+            """
+            INSERT INTO meta (key, value) VALUES ('data_version', '1')
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+            """
+        )
+
+    def _bump_removals(self, conn):
+        """Count a deletion of batches within a write transaction, for measurements_since()."""
+        conn.execute(
+            """
+            INSERT INTO meta (key, value) VALUES ('removals', '1')
+            ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+            """
+        )
+
+    def version(self):
+        """
+        Return an identifier that changes whenever batches, measurements or settings change.
+
+        It includes the database's creation id, so a recreated database never
+        reuses the version of the one it replaced.
+
+        Returns:
+            str: Data version, usable as an HTTP ETag
+        """
+        with self._transaction() as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('store_id', 'data_version')"))
+        return f"sqlite-{meta['store_id'][:8]}-{meta.get('data_version', 0)}"
+
+    def _batch_id(self, conn, name):
+        """Look up a batch id by name, raising KeyError if it doesn't exist."""
+        row = conn.execute("SELECT id FROM batches WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise KeyError(f"No batch named '{name}'")
+        return row[0]
+
+    def load(self):
+        """
+        Load all batches with their measurements, and the settings.
+
+        The parsed data is cached for the whole process and only re-read when
+        the data version changes. Writes that don't touch batches,
+        measurements or settings (alerts, forecasts, sensor aggregates) leave
+        the cache valid. The returned batch dictionaries are shared and must
+        be copied before they are modified.
+
+        Returns:
+            tuple: (batches, settings) in the kombucha_data.json format
+        """
+        return _cached_load(("sqlite", os.path.abspath(self.path)), self.version(), self._read_all)
+
+    def _read_all(self):
+        """Read all batches, measurements and settings from the database."""
+        with self._transaction() as conn:
+            batches = {}
+            for batch_id, data in conn.execute("SELECT id, data FROM batches ORDER BY id"):
+                batches[batch_id] = json.loads(data)
+
+            for batch_id, data in conn.execute("SELECT batch_id, data FROM measurements ORDER BY batch_id, id"):
+                batches[batch_id].setdefault("measurements", []).append(json.loads(data))
+
+            settings = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM settings")}
+
+        return list(batches.values()), settings
+
+    def measurements_since(self, marker=None):
+        """
+        Read the batches and measurements added since an earlier call.
+
+        Args:
+            marker (list, optional): Marker returned by the earlier call
+
+        Returns:
+            tuple: (marker, reset, names, readings). Pass marker to the next
+            call. If reset is False, names lists the batches added since the
+            given marker and readings the (batch_name, measurement) pairs
+            added since. If reset is True, because no marker was given or
+            batches were deleted since, they cover all the data.
+        """
+        with self._transaction() as conn:
+            meta = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('store_id', 'removals')"))
+            state = [meta['store_id'], int(meta.get('removals', 0))]
+            reset = marker is None or marker[:2] != state
+            last_batch, last_measurement = (0, 0) if reset else marker[2:]
+
+            names = [name for (name,) in conn.execute("SELECT name FROM batches WHERE id > ? ORDER BY id", (last_batch,))]
+            readings = [
+                (name, json.loads(data))
+                for name, data in conn.execute(
+                    """
+                    SELECT batches.name, measurements.data FROM measurements
+                    JOIN batches ON batches.id = measurements.batch_id
+                    WHERE measurements.id > ? ORDER BY measurements.id
+                    """,
+                    (last_measurement,)
+                )
+            ]
+            last_ids = conn.execute(
+                "SELECT (SELECT COALESCE(MAX(id), 0) FROM batches), (SELECT COALESCE(MAX(id), 0) FROM measurements)"
+            ).fetchone()
+
+        # Ids only grow between removals, so later additions all have higher ones
+        return state + list(last_ids), reset, names, readings
+
+    def save_settings(self, settings):
+        """
+        Save the application settings.
+
+        Args:
+            settings (dict): Settings to store
+        """
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in settings.items()]
+            )
+            self._bump_version(conn)
+
+    def add_batch(self, batch):
+        """
+        Insert a new batch along with any measurements it already has.
+
+        Args:
+            batch (dict): Batch dictionary
+        """
+        with self._transaction() as conn:
+            self._insert_batch(conn, batch)
+            self._bump_version(conn)
+
+    def _insert_batch(self, conn, batch):
+        """Insert a batch and its measurements within an open transaction."""
+        cursor = conn.execute(
+            "INSERT INTO batches (name, data) VALUES (?, ?)",
+            (batch["name"], json.dumps(_batch_fields(batch)))
+        )
+        conn.executemany(
+            "INSERT INTO measurements (batch_id, date, phase, data) VALUES (?, ?, ?, ?)",
+            [(cursor.lastrowid, m["date"], m.get("phase"), json.dumps(m)) for m in batch.get("measurements", [])]
+        )
+        for measurement in batch.get("measurements", []):
+            self._record_latest(conn, cursor.lastrowid, measurement)
+
+    def update_batch(self, batch):
+        """
+        Update a batch's fields (not its measurements).
+
+        Args:
+            batch (dict): Batch dictionary, identified by its name
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE batches SET data = ? WHERE id = ?",
+                (json.dumps(_batch_fields(batch)), self._batch_id(conn, batch["name"]))
+            )
+            self._bump_version(conn)
+
+    def delete_batch(self, name):
+        """
+        Delete a batch and its measurements.
+
+        Args:
+            name (str): Name of the batch
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM batches WHERE name = ?", (name,))
+            self._bump_version(conn)
+            self._bump_removals(conn)
+
+    def clear_batches(self):
+        """Delete all batches and measurements."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM latest_measurements")
+            conn.execute("DELETE FROM measurements")
+            conn.execute("DELETE FROM batches")
+            self._bump_version(conn)
+            self._bump_removals(conn)
+
+    def add_measurement(self, batch_name, measurement):
+        """
+        Append a measurement to a batch.
+
+        Args:
+            batch_name (str): Name of the batch
+            measurement (dict): Measurement dictionary with at least a "date" key
+        """
+        with self._transaction() as conn:
+            batch_id = self._batch_id(conn, batch_name)
+            conn.execute(
+                "INSERT INTO measurements (batch_id, date, phase, data) VALUES (?, ?, ?, ?)",
+                (batch_id, measurement["date"], measurement.get("phase"), json.dumps(measurement))
+            )
+            self._record_latest(conn, batch_id, measurement)
+            self._bump_version(conn)
+
+    def add_measurements(self, readings):
+        """
+        Append many measurements, possibly to different batches, in one transaction.
+
+        Args:
+            readings (list): (batch_name, measurement) pairs
+        """
+        with self._transaction() as conn:
+            batch_ids = {}
+            latest = {}
+
+            for batch_name, measurement in readings:
+                if batch_name not in batch_ids:
+                    batch_ids[batch_name] = self._batch_id(conn, batch_name)
+
+                # Only each batch's newest reading can change the latest-measurement index
+                current = latest.get(batch_name)
+                if current is None or measurement["date"] > current["date"]:
+                    latest[batch_name] = measurement
+
+            conn.executemany(
+                "INSERT INTO measurements (batch_id, date, phase, data) VALUES (?, ?, ?, ?)",
+                [(batch_ids[name], m["date"], m.get("phase"), json.dumps(m)) for name, m in readings]
+            )
+            for batch_name, measurement in latest.items():
+                self._record_latest(conn, batch_ids[batch_name], measurement)
+            self._bump_version(conn)
+
+    def latest_at_or_above(self, threshold):
+        """
+        Find the batches whose latest CO2 pressure is at or above a threshold.
+
+        Uses the latest_measurements table, which is kept up to date on every
+        insert, so the cost depends on the number of matching batches only.
+
+        Args:
+            threshold (float): Pressure in atm
+
+        Returns:
+            list: Dicts with "name", "pressure" and "date", highest pressure first
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                """
+                SELECT b.name, l.co2_pressure, l.date FROM latest_measurements l
+                JOIN batches b ON b.id = l.batch_id
+                WHERE l.co2_pressure >= ?
+                ORDER BY l.co2_pressure DESC
+                """,
+                (threshold,)
+            ).fetchall()
+
+        return [{"name": name, "pressure": pressure, "date": date} for name, pressure, date in rows]
+
+    def save_alerts(self, alerts):
+        """
+        Replace the current carbonation alerts.
+
+        Nothing is written when the alerts haven't changed, so a periodic
+        evaluation doesn't invalidate every session's cached data.
+
+        Args:
+            alerts (list): Dicts with "name", "pressure", "risk_level", "source",
+                "date", "warning_at" and "danger_at"
+
+        Returns:
+            bool: True if the stored alerts changed
+        """
+        alerts = sorted(alerts, key=_alert_sort_key)
+        if alerts == self.load_alerts():
+            return False
+
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM alerts")
+            conn.executemany(
+                """
+                INSERT INTO alerts (name, pressure, risk_level, source, date, warning_at, danger_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [(a["name"], a["pressure"], a["risk_level"], a["source"], a["date"], a.get("warning_at"),
+                  a.get("danger_at")) for a in alerts]
+            )
+        return True
+
+    def load_alerts(self):
+        """
+        Read the current carbonation alerts.
+
+        Returns:
+            list: Alert dicts, danger first, then by forecast time of danger and by pressure
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT name, pressure, risk_level, source, date, warning_at, danger_at FROM alerts"
+            ).fetchall()
+
+        alerts = [
+            {"name": name, "pressure": pressure, "risk_level": risk_level, "source": source, "date": date,
+             "warning_at": warning_at, "danger_at": danger_at}
+            for name, pressure, risk_level, source, date, warning_at, danger_at in rows
+        ]
+        return sorted(alerts, key=_alert_sort_key)
+
+    def save_forecasts(self, forecasts):
+        """
+        Replace the pressure forecasts of the bottled batches.
+
+        Nothing is written when the forecasts haven't changed.
+
+        Args:
+            forecasts (list): Dicts with "name", "pressure", "date",
+                "warning_at" and "danger_at"
+
+        Returns:
+            bool: True if the stored forecasts changed
+        """
+        forecasts = sorted(forecasts, key=_forecast_sort_key)
+        if forecasts == self.load_forecasts():
+            return False
+
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM forecasts")
+            conn.executemany(
+                "INSERT INTO forecasts (name, pressure, date, warning_at, danger_at) VALUES (?, ?, ?, ?, ?)",
+                [(f["name"], f["pressure"], f["date"], f["warning_at"], f["danger_at"]) for f in forecasts]
+            )
+        return True
+
+    def load_forecasts(self):
+        """
+        Read the pressure forecasts of the bottled batches.
+
+        Returns:
+            list: Forecast dicts, soonest danger first
+        """
+        with self._transaction() as conn:
+            rows = conn.execute("SELECT name, pressure, date, warning_at, danger_at FROM forecasts").fetchall()
+
+        forecasts = [
+            {"name": name, "pressure": pressure, "date": date, "warning_at": warning_at, "danger_at": danger_at}
+            for name, pressure, date, warning_at, danger_at in rows
+        ]
+        return sorted(forecasts, key=_forecast_sort_key)
+
+    def add_sensor_aggregates(self, aggregates):
+        """
+        Store closed sensor aggregate buckets in one transaction.
+
+        A bucket that is already stored, e.g. partly filled before the sampler
+        restarted, is merged with the new one.
+
+        Args:
+            aggregates (list): Dicts with "channel", "resolution" (seconds),
+                "start", "count", "min", "mean" and "max"
+        """
+        with self._transaction() as conn:
+            conn.executemany(
+                """
+                INSERT INTO sensor_aggregates (channel, resolution, start, count, min, mean, max)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(channel, resolution, start) DO UPDATE SET
+                    count = count + excluded.count,
+                    min = MIN(min, excluded.min),
+                    mean = (mean * count + excluded.mean * excluded.count) / (count + excluded.count),
+                    max = MAX(max, excluded.max)
+                """,
+                [(a["channel"], a["resolution"], a["start"], a["count"], a["min"], a["mean"], a["max"])
+                 for a in aggregates]
+            )
+
+    def load_sensor_aggregates(self, channel, resolution, since=None):
+        """
+        Read a channel's stored sensor aggregates.
+
+        Args:
+            channel (str): Channel name
+            resolution (int): Bucket length in seconds
+            since (float, optional): Only buckets starting at or after this time
+
+        Returns:
+            list: Aggregate dicts, oldest first
+        """
+        with self._transaction() as conn:
+            rows = conn.execute(
+                """
+                SELECT start, count, min, mean, max FROM sensor_aggregates
+                WHERE channel = ? AND resolution = ? AND start >= ?
+                ORDER BY start
+                """,
+                (channel, resolution, since if since is not None else float("-inf"))
+            ).fetchall()
+
+        return [
+            {"channel": channel, "resolution": resolution, "start": start, "count": count, "min": low,
+             "mean": mean, "max": high}
+            for start, count, low, mean, high in rows
+        ]
+
+    def import_json(self, path=DATA_FILE, force=False):
+        """
+        Migrate an existing kombucha_data.json file into the database.
+
+        The import runs once: later calls do nothing unless force is set.
+        Batches whose name already exists in the database are skipped.
+
+        Args:
+            path (str, optional): Path to the JSON data file. Defaults to DATA_FILE.
+            force (bool, optional): Import even if a previous import was recorded. Defaults to False.
+
+        Returns:
+            int: Number of batches imported
+        """
+        if not os.path.exists(path):
+            return 0
+
+        with self._transaction() as conn:
+            if not force and conn.execute("SELECT 1 FROM meta WHERE key = 'json_imported'").fetchone():
+                return 0
+
+            # Read through JSONFileStore so unfolded journal records are included
+            batches, settings = JSONFileStore(path).load()
+
+            existing = {name for (name,) in conn.execute("SELECT name FROM batches")}
+            imported = 0
+            for batch in batches:
+                if batch["name"] not in existing:
+                    self._insert_batch(conn, batch)
+                    existing.add(batch["name"])
+                    imported += 1
+
+            conn.executemany(
+                "INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in settings.items()]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)",
+                (os.path.abspath(path),)
+            )
+            self._bump_version(conn)
+
+        return imported
+
+class JSONFileStore:
+    """
+    Batch storage in a JSON snapshot file plus an append-only journal.
+
+    Every write is appended to a JSON Lines journal next to the snapshot and
+    fsynced, so recording a reading costs the same however many batches
+    exist. Loading replays the journal on top of the snapshot. Once the
+    journal holds COMPACT_THRESHOLD records, it is folded into the snapshot.
+    The snapshot is written next to the old one and swapped in atomically.
+
+    Each journal record carries a sequence number, and the snapshot stores the
+    last one it contains. A crash between writing the snapshot and truncating
+    the journal therefore can't apply a record twice. A torn final line from a
+    crash mid-append is ignored.
+
+    Several processes (the app, the API and the alert engine) can share the
+    files. Appending, replaying and compacting hold an exclusive flock on the
+    journal, and the next sequence number is taken from the journal itself,
+    so concurrent writers never reuse one.
+
+    Attributes:
+        path (str): Path to the JSON snapshot file
+        journal_path (str): Path to the JSON Lines journal
+        alerts_path (str): Path to the current carbonation alerts
+        forecasts_path (str): Path to the current pressure forecasts
+        aggregates_path (str): Path to the JSON Lines file of sensor aggregates
+        compact_threshold (int): Journal records that trigger a compaction
+    """
+
+    def __init__(self, path=DATA_FILE, journal_path=None, compact_threshold=COMPACT_THRESHOLD):
+        self.path = path
+        self.journal_path = journal_path or os.path.splitext(path)[0] + ".journal.jsonl"
+        self.alerts_path = os.path.splitext(path)[0] + ".alerts.json"
+        self.forecasts_path = os.path.splitext(path)[0] + ".forecasts.json"
+        self.aggregates_path = os.path.splitext(path)[0] + ".sensors.jsonl"
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._snapshot_seq = None
+        self._latest_index = None
+        self._latest_index_signature = None
+
+    def __repr__(self):
+        return f"JSONFileStore({os.path.abspath(self.path)!r})"
+
+    def _read_snapshot(self):
+        """Read the snapshot file."""
+        if not os.path.exists(self.path):
+            return {'batches': [], 'settings': {}}
+
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    @contextmanager
+    def _journal_lock(self):
+        """Open the journal, holding an exclusive lock on it shared with other processes."""
+        with open(self.journal_path, 'a+b') as journal:
+            if fcntl is not None:
+                fcntl.flock(journal.fileno(), fcntl.LOCK_EX)
+            yield journal
+
+    def _last_journal_seq(self, journal):
+        """
+        Return the sequence number of the journal's last record; the caller holds the journal lock.
+
+        A torn final line from a crash mid-append is cut off first.
+
+        Returns:
+            int: Sequence number, or None if the journal is empty
+        """
+        journal.seek(0, os.SEEK_END)
+        size = journal.tell()
+
+        # Read backwards until the tail holds the start of the last line
+        position = size
+        tail = b""
+        while position > 0 and tail[:-1].count(b"\n") == 0:
+            step = min(4096, position)
+            position -= step
+            journal.seek(position)
+            tail = journal.read(step) + tail
+
+        if tail and not tail.endswith(b"\n"):
+            # Nobody else can be mid-append while we hold the lock
+            journal.truncate(position + tail.rfind(b"\n") + 1)
+            return self._last_journal_seq(journal)
+
+        lines = tail.rstrip(b"\n").rsplit(b"\n", 1)
+        return json.loads(lines[-1])["seq"] if lines[-1] else None
+
+    def _snapshot_journal_seq(self):
+        """Sequence number of the last record folded into the snapshot, cached per snapshot version."""
+        signature = _file_signature(self.path)
+        if self._snapshot_seq is None or self._snapshot_seq[0] != signature:
+            self._snapshot_seq = (signature, self._read_snapshot().get('journal_seq', 0))
+        return self._snapshot_seq[1]
+
+    def _read_journal(self):
+        """Read all complete records from the journal; the caller holds the journal lock."""
+        if not os.path.exists(self.journal_path):
+            return []
+
+        records = []
+        valid_size = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                valid_size += len(line)
+
+        # Cut off a torn write from a crash mid-append, so the next append
+        # starts on a fresh line; nothing after it was acknowledged
+        if valid_size < os.path.getsize(self.journal_path):
+            os.truncate(self.journal_path, valid_size)
+
+        return records
+
+    def _write_snapshot(self, data):
+        """Atomically replace the snapshot file."""
+        _write_json_atomic(self.path, data)
+
+    def _find_batch(self, data, name):
+        """Find a batch by name, raising KeyError if it doesn't exist."""
+        for batch in data['batches']:
+            if batch["name"] == name:
+                return batch
+        raise KeyError(f"No batch named '{name}'")
+
+    def _apply(self, data, record):
+        """Apply one journal record to the loaded data."""
+        op = record["op"]
+
+        if op == "add_measurement":
+            self._find_batch(data, record["batch"]).setdefault("measurements", []).append(record["measurement"])
+        elif op == "add_measurements":
+            # Look up every batch first so a missing one skips the whole record
+            targets = [self._find_batch(data, reading["batch"]) for reading in record["readings"]]
+            for batch, reading in zip(targets, record["readings"]):
+                batch.setdefault("measurements", []).append(reading["measurement"])
+        elif op == "add_batch":
+            data['batches'].append(record["batch"])
+        elif op == "update_batch":
+            self._find_batch(data, record["batch"]["name"]).update(record["batch"])
+        elif op == "delete_batch":
+            data['batches'] = [batch for batch in data['batches'] if batch["name"] != record["name"]]
+        elif op == "clear_batches":
+            data['batches'] = []
+        elif op == "save_settings":
+            data['settings'].update(record["settings"])
+        else:
+            raise ValueError(f"Unknown journal operation '{op}'")
+
+    def _replay(self):
+        """Load the snapshot and apply the journal records it doesn't contain yet; the caller holds the journal lock."""
+        data = self._read_snapshot()
+        data.setdefault('batches', [])
+        data.setdefault('settings', {})
+        last_seq = data.get('journal_seq', 0)
+
+        records = self._read_journal()
+        for record in records:
+            if record["seq"] > last_seq:
+                try:
+                    self._apply(data, record)
+                except KeyError:
+                    # Reading or update for a batch deleted in the meantime
+                    pass
+                last_seq = record["seq"]
+
+        data['journal_seq'] = last_seq
+        return data
+
+    def _signature(self):
+        """Identify the current version of the snapshot and journal."""
+        return _file_signature(self.path, self.journal_path)
+
+    def version(self):
+        """
+        Return an identifier that changes whenever batches, measurements or settings change.
+
+        Returns:
+            str: Data version, usable as an HTTP ETag
+        """
+        return "json-" + hashlib.sha1(repr(self._signature()).encode()).hexdigest()[:16]
+
+    def _append(self, op, **fields):
+        """Append a record to the journal, compacting it when it grows too long."""
+        with self._lock, self._journal_lock() as journal:
+            index_current = self._latest_index is not None and self._latest_index_signature == self._signature()
+
+            # Continue from the journal's last record, whichever process wrote it
+            snapshot_seq = self._snapshot_journal_seq()
+            last_seq = self._last_journal_seq(journal)
+            seq = max(snapshot_seq, last_seq or 0) + 1
+            record = dict(fields, op=op, seq=seq)
+
+            journal.write((json.dumps(record) + "\n").encode())
+            journal.flush()
+            os.fsync(journal.fileno())
+
+            if seq - snapshot_seq >= self.compact_threshold:
+                self._compact(journal)
+
+            # Keep the latest-measurement index in step with our own write
+            if index_current:
+                self._update_latest_index(record)
+                self._latest_index_signature = self._signature()
+
+    def _update_latest_index(self, record):
+        """Apply one journal record to the latest-measurement index."""
+        op = record["op"]
+
+        if op == "add_measurement":
+            self._latest_index.update(record["batch"], record["measurement"])
+        elif op == "add_measurements":
+            for reading in record["readings"]:
+                self._latest_index.update(reading["batch"], reading["measurement"])
+        elif op == "add_batch":
+            for measurement in record["batch"].get("measurements", []):
+                self._latest_index.update(record["batch"]["name"], measurement)
+        elif op == "delete_batch":
+            self._latest_index.remove(record["name"])
+        elif op == "clear_batches":
+            self._latest_index = LatestMeasurementIndex()
+
+    def latest_at_or_above(self, threshold):
+        """
+        Find the batches whose latest CO2 pressure is at or above a threshold.
+
+        The index is built once per version of the data and updated in place
+        when this store appends to the journal.
+
+        Args:
+            threshold (float): Pressure in atm
+
+        Returns:
+            list: Dicts with "name", "pressure" and "date", highest pressure first
+        """
+        signature = self._signature()
+        if self._latest_index is None or self._latest_index_signature != signature:
+            batches, _ = self.load()
+            self._latest_index = LatestMeasurementIndex.build(batches)
+            self._latest_index_signature = signature
+
+        return self._latest_index.at_or_above(threshold)
+
+    def save_alerts(self, alerts):
+        """
+        Replace the current carbonation alerts.
+
+        Alerts live in their own file, outside the snapshot and journal.
+
+        Args:
+            alerts (list): Dicts with "name", "pressure", "risk_level", "source",
+                "date", "warning_at" and "danger_at"
+
+        Returns:
+            bool: True if the stored alerts changed
+        """
+        alerts = sorted(alerts, key=_alert_sort_key)
+        if alerts == self.load_alerts():
+            return False
+
+        _write_json_atomic(self.alerts_path, alerts)
+        return True
+
+    def load_alerts(self):
+        """
+        Read the current carbonation alerts.
+
+        Returns:
+            list: Alert dicts, danger first, then by forecast time of danger and by pressure
+        """
+        if not os.path.exists(self.alerts_path):
+            return []
+
+        with open(self.alerts_path, 'r') as f:
+            return json.load(f)
+
+    def save_forecasts(self, forecasts):
+        """
+        Replace the pressure forecasts of the bottled batches.
+
+        Forecasts live in their own file, outside the snapshot and journal.
+
+        Args:
+            forecasts (list): Dicts with "name", "pressure", "date",
+                "warning_at" and "danger_at"
+
+        Returns:
+            bool: True if the stored forecasts changed
+        """
+        forecasts = sorted(forecasts, key=_forecast_sort_key)
+        if forecasts == self.load_forecasts():
+            return False
+
+        _write_json_atomic(self.forecasts_path, forecasts)
+        return True
+
+    def load_forecasts(self):
+        """
+        Read the pressure forecasts of the bottled batches.
+
+        Returns:
+            list: Forecast dicts, soonest danger first
+        """
+        if not os.path.exists(self.forecasts_path):
+            return []
+
+        with open(self.forecasts_path, 'r') as f:
+            return json.load(f)
+
+    def add_sensor_aggregates(self, aggregates):
+        """
+        Store closed sensor aggregate buckets.
+
+        They are appended to their own JSON Lines file, outside the snapshot
+        and journal, in one write.
+
+        Args:
+            aggregates (list): Dicts with "channel", "resolution" (seconds),
+                "start", "count", "min", "mean" and "max"
+        """
+        with self._lock:
+            with open(self.aggregates_path, 'a') as f:
+                f.write("".join(json.dumps(aggregate) + "\n" for aggregate in aggregates))
+                f.flush()
+                os.fsync(f.fileno())
+
+    def load_sensor_aggregates(self, channel, resolution, since=None):
+        """
+        Read a channel's stored sensor aggregates.
+
+        Buckets stored more than once, e.g. partly filled before the sampler
+        restarted, are merged.
+
+        Args:
+            channel (str): Channel name
+            resolution (int): Bucket length in seconds
+            since (float, optional): Only buckets starting at or after this time
+
+        Returns:
+            list: Aggregate dicts, oldest first
+        """
+        if not os.path.exists(self.aggregates_path):
+            return []
+
+        buckets = {}
+        with open(self.aggregates_path, 'r') as f:
+            for line in f:
+                try:
+                    aggregate = json.loads(line)
+                except ValueError:
+                    # Torn final line from a crash mid-append
+                    continue
+                if aggregate["channel"] != channel or aggregate["resolution"] != resolution:
+                    continue
+                if since is not None and aggregate["start"] < since:
+                    continue
+
+                stored = buckets.get(aggregate["start"])
+                buckets[aggregate["start"]] = aggregate if stored is None else _merge_aggregates(stored, aggregate)
+
+        return [buckets[start] for start in sorted(buckets)]
+
+    def _compact(self, journal):
+        """Fold the journal into the snapshot; the caller holds the journal lock."""
+        data = self._replay()
+        self._write_snapshot(data)
+
+        # Records up to journal_seq are now in the snapshot
+        journal.truncate(0)
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    def compact(self):
+        """Fold all journal records into the snapshot file and empty the journal."""
+        with self._lock, self._journal_lock() as journal:
+            self._compact(journal)
+
+    def load(self):
+        """
+        Load all batches with their measurements, and the settings.
+
+        The parsed data is cached for the whole process and only re-read when
+        the snapshot or journal changes. The returned batch dictionaries are
+        shared and must be copied before they are modified.
+
+        Returns:
+            tuple: (batches, settings) in the kombucha_data.json format
+        """
+        signature = self._signature()
+        return _cached_load(("json", os.path.abspath(self.path)), signature, self._read_all)
+
+    def _read_all(self):
+        """Replay the snapshot and journal into batches and settings."""
+        with self._lock, self._journal_lock():
+            data = self._replay()
+        return data['batches'], data['settings']
+
+    def measurements_since(self, marker=None):
+        """
+        Read the batches and measurements added since an earlier call.
+
+        Only the journal records after the marker are read, unless the
+        snapshot was rewritten since (by a compaction or a replaced file).
+
+        Args:
+            marker (list, optional): Marker returned by the earlier call
+
+        Returns:
+            tuple: (marker, reset, names, readings). Pass marker to the next
+            call. If reset is False, names lists the batches added since the
+            given marker and readings the (batch_name, measurement) pairs
+            added since. If reset is True, because no marker was given or
+            batches were deleted since, they cover all the data.
+        """
+        with self._lock, self._journal_lock():
+            snapshot = hashlib.sha1(repr(_file_signature(self.path)).encode()).hexdigest()[:16]
+            records = self._read_journal()
+            last_seq = max([self._snapshot_journal_seq()] + [record["seq"] for record in records])
+
+            # A sequence number that went backwards means the journal was recreated
+            since = None
+            if marker is not None and marker[0] == snapshot and marker[1] <= last_seq:
+                since = [record for record in records if record["seq"] > marker[1]]
+                if any(record["op"] in ("delete_batch", "clear_batches") for record in since):
+                    since = None
+
+            if since is None:
+                data = self._replay()
+                names = [batch["name"] for batch in data['batches']]
+                readings = [(batch["name"], measurement)
+                            for batch in data['batches'] for measurement in batch.get("measurements", [])]
+                return [snapshot, data['journal_seq']], True, names, readings
+
+        names = []
+        readings = []
+        for record in since:
+            if record["op"] == "add_batch":
+                names.append(record["batch"]["name"])
+                readings.extend((record["batch"]["name"], m) for m in record["batch"].get("measurements", []))
+            elif record["op"] == "add_measurement":
+                readings.append((record["batch"], record["measurement"]))
+            elif record["op"] == "add_measurements":
+                readings.extend((reading["batch"], reading["measurement"]) for reading in record["readings"])
+
+        return [snapshot, last_seq], False, names, readings
+
+    def save_settings(self, settings):
+        """
+        Save the application settings.
+
+        Args:
+            settings (dict): Settings to store
+        """
+        self._append("save_settings", settings=settings)
+
+    def add_batch(self, batch):
+        """
+        Insert a new batch along with any measurements it already has.
+
+        Args:
+            batch (dict): Batch dictionary
+        """
+        self._append("add_batch", batch=batch)
+
+    def update_batch(self, batch):
+        """
+        Update a batch's fields (not its measurements).
+
+        Args:
+            batch (dict): Batch dictionary, identified by its name
+        """
+        self._append("update_batch", batch=_batch_fields(batch))
+
+    def delete_batch(self, name):
+        """
+        Delete a batch and its measurements.
+
+        Args:
+            name (str): Name of the batch
+        """
+        self._append("delete_batch", name=name)
+
+    def clear_batches(self):
+        """Delete all batches and measurements."""
+        self._append("clear_batches")
+
+    def add_measurement(self, batch_name, measurement):
+        """
+        Append a measurement to a batch.
+
+        Args:
+            batch_name (str): Name of the batch
+            measurement (dict): Measurement dictionary with at least a "date" key
+        """
+        self._append("add_measurement", batch=batch_name, measurement=measurement)
+
+    def add_measurements(self, readings):
+        """
+        Append many measurements, possibly to different batches, in one write.
+
+        The readings are stored as a single journal record, so they are
+        applied all together or not at all.
+
+        Args:
+            readings (list): (batch_name, measurement) pairs
+        """
+        batches, _ = self.load()
+        names = {batch["name"] for batch in batches}
+        for batch_name, _ in readings:
+            if batch_name not in names:
+                raise KeyError(f"No batch named '{batch_name}'")
+
+        self._append("add_measurements", readings=[
+            {"batch": batch_name, "measurement": measurement} for batch_name, measurement in readings
+        ])
+
+def open_store(backend=STORAGE_BACKEND):
+    """
+    Open the configured storage backend.
+
+    The SQLite store imports kombucha_data.json the first time it is opened.
+
+    Args:
+        backend (str, optional): "sqlite" or "json". Defaults to STORAGE_BACKEND.
+
+    Returns:
+        SQLiteStore or JSONFileStore: The opened store
+    """
+    if backend == "json":
+        return JSONFileStore(DATA_FILE)
+    if backend == "sqlite":
+        store = SQLiteStore(DB_FILE)
+        imported = store.import_json(DATA_FILE)
+        if imported:
+            print(f"Imported {imported} batches from {DATA_FILE} into {DB_FILE}")
+        return store
+
+    raise ValueError(f"Unknown storage backend '{backend}' (expected 'sqlite' or 'json')")
+
+# Migrate or compact a JSON data file if run directly
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command == "import":
+        source = sys.argv[2] if len(sys.argv) > 2 else DATA_FILE
+        imported = SQLiteStore(DB_FILE).import_json(source, force=True)
+        print(f"Imported {imported} batches from {source} into {DB_FILE}")
+    elif command == "compact":
+        JSONFileStore(DATA_FILE).compact()
+        print(f"Compacted journal into {DATA_FILE}")
+    else:
+        print("Usage: python storage.py import [kombucha_data.json] | compact")
+        sys.exit(1)
@@ -0,0 +1,100 @@
+"""
+Tests for the Bulk Measurement Endpoint of the REST API
+
+POST /api/measurements validates every reading before storing any of them
+(see ingest.py). These tests post batches of readings where one is invalid
+and check that the request is refused and nothing reaches the store.
+
+Usage:
+    python -m pytest tests
+
+Author: Deen
+Email: deen.htc@gmail.com
+"""
+
+import datetime
+import json
+
+import pytest
+
+from alert_engine import AlertEngine
+from api import create_app
+from storage import SQLiteStore
+
+BATCH = {
+    "name": "Test Batch",
+    "start_date": "2024-03-01",
+    "tea_type": "Black",
+    "sugar_content": 100,
+    "volume": 2.0,
+    "fermentation_phase": "primary",
+    "measurements": [{"date": "2024-03-01", "temperature": 24.0, "ph": 4.5, "phase": "primary"}]
+}
+
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteStore(str(tmp_path / "kombucha_data.db"))
+    store.add_batch(BATCH)
+    return store
+
+@pytest.fixture
+def client(store):
+    # The engine is never started, so writes only set its wake-up event
+    app = create_app(store=store, alert_engine=AlertEngine(store), sampler=None)
+    return app.test_client()
+
+def stored_measurements(store):
+    """Return the measurements of the test batch as stored."""
+    batches, _ = store.load()
+    return batches[0]["measurements"]
+
+def assert_nothing_stored(store, version):
+    """Check that a refused request left the store as it was."""
+    assert store.version() == version
+    assert stored_measurements(store) == BATCH["measurements"]
+
+def test_valid_readings_are_stored(client, store):
+    response = client.post("/api/measurements", json=[
+        {"batch": "Test Batch", "date": "2024-03-02", "temperature": 24.5, "ph": 4.2},
+        {"batch": "Test Batch", "date": "2024-03-03", "temperature": 25.0, "taste": "sweet"}
+    ])
+
+    assert response.status_code == 201
+    assert response.get_json()["ingested"] == 2
+    assert [m["date"] for m in stored_measurements(store)] == ["2024-03-01", "2024-03-02", "2024-03-03"]
+
+def test_unknown_field_rejects_all_readings(client, store):
+    version = store.version()
+
+    response = client.post("/api/measurements", json=[
+        {"batch": "Test Batch", "date": "2024-03-02", "temperature": 24.5},
+        {"batch": "Test Batch", "date": "2024-03-03", "temperature": 25.0, "colour": "amber"}
+    ])
+
+    assert response.status_code == 400
+    assert response.get_json()["errors"] == [{"reading": 2, "message": "Unknown fields: colour"}]
+    assert_nothing_stored(store, version)
+
+def test_missing_temperature_rejects_all_readings(client, store):
+    version = store.version()
+    body = "\n".join(json.dumps(reading) for reading in [
+        {"batch": "Test Batch", "date": "2024-03-02", "ph": 4.2},
+        {"batch": "Test Batch", "date": "2024-03-03", "temperature": 25.0}
+    ])
+
+    response = client.post("/api/measurements", data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 400
+    assert response.get_json()["errors"] == [{"reading": 1, "message": "temperature is required"}]
+    assert_nothing_stored(store, version)
+
+def test_future_date_rejects_all_readings(client, store):
+    version = store.version()
+    tomorrow = (datetime.date.today() + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
+    body = f"batch,date,temperature\nTest Batch,2024-03-02,24.5\nTest Batch,{tomorrow},25.0\n"
+
+    response = client.post("/api/measurements", data=body, content_type="text/csv")
+
+    assert response.status_code == 400
+    assert response.get_json()["errors"] == [{"reading": 2, "message": "date must not be in the future"}]
+    assert_nothing_stored(store, version)